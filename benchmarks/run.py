@@ -0,0 +1,262 @@
+"""
+Benchmarks for the pipeline hot paths on synthetic universes (no data files
+or network needed).
+
+    python benchmarks/run.py                    # run, compare with baseline.json
+    python benchmarks/run.py --save-baseline    # run, store as the new baseline
+    python benchmarks/run.py --full             # include the slowest cells
+    python benchmarks/run.py --only find_pairs  # a single benchmark
+
+Each cell is timed as the best of several repeats after one warm-up call
+(numba compilation, caches). A cell more than --threshold slower than the
+baseline is flagged as a regression and makes the run exit with status 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Allow `python benchmarks/run.py` from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from benchmarks.synthetic import synthetic_universe, price_matrix
+from src.data_loader import create_clean_price_matrix
+from src.pair_selection import find_pairs
+from src.backtesting import backtest_pair, calculate_positions
+from src.utils import aggregate_yearly_results
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SYMBOLS = (50, 200, 1000)
+YEARS = (1, 5, 20)
+
+
+class Universe:
+    """Synthetic data of one (symbols, years) cell, with lazily derived inputs"""
+
+    def __init__(self, n_symbols: int, n_years: int):
+        self.n_symbols = n_symbols
+        self.n_years = n_years
+        self.df, self.planted = synthetic_universe(n_symbols, n_years)
+        self.prices = price_matrix(self.df)
+        self._details = None
+
+    def zscores(self):
+        window = 30
+        out = []
+        for a, b, beta in self.planted:
+            spread = self.prices[a] - beta * self.prices[b]
+            out.append(((spread - spread.rolling(window).mean().shift(1))
+                        / spread.rolling(window).std().shift(1)).to_numpy())
+        return out
+
+    def yearly_details(self):
+        """Per year, the planted pairs' backtest details (aggregate_yearly_results input)"""
+        if self._details is None:
+            details = [backtest_pair(self.prices[a], self.prices[b], beta)["details"]
+                       for a, b, beta in self.planted]
+            years = details[0]["date"].dt.year
+            self._details = {year: [d[years == year] for d in details] for year in years.unique()}
+        return self._details
+
+
+def bench_create_clean_price_matrix(universe: Universe):
+    return lambda: create_clean_price_matrix(universe.df)
+
+
+def bench_find_pairs(universe: Universe):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return find_pairs(universe.prices)
+    return run
+
+
+def bench_backtest_pair(universe: Universe):
+    prices = universe.prices
+    return lambda: [backtest_pair(prices[a], prices[b], beta) for a, b, beta in universe.planted]
+
+
+def bench_backtest_pair_kalman(universe: Universe):
+    prices = universe.prices
+    return lambda: [backtest_pair(prices[a], prices[b], beta, hedge="kalman") for a, b, beta in universe.planted]
+
+
+def bench_backtest_pair_rolling(universe: Universe):
+    prices = universe.prices
+    return lambda: [backtest_pair(prices[a], prices[b], beta, hedge="rolling") for a, b, beta in universe.planted]
+
+
+def bench_calculate_positions(universe: Universe):
+    zscores = universe.zscores()
+    return lambda: [calculate_positions(z, 1.5, 0.15) for z in zscores]
+
+
+def bench_aggregate_yearly_results(universe: Universe):
+    details = universe.yearly_details()
+    return lambda: [aggregate_yearly_results(frames, year) for year, frames in details.items()]
+
+
+# name -> (setup returning the timed callable, whether a cell only runs with --full)
+BENCHMARKS = {
+    "create_clean_price_matrix": (bench_create_clean_price_matrix, lambda s, y: False),
+    # The Engle-Granger screen grows with symbols^2 * days: minutes on the largest cells
+    "find_pairs": (bench_find_pairs, lambda s, y: s * s * y > 200 * 200 * 5),
+    "backtest_pair": (bench_backtest_pair, lambda s, y: False),
+    "backtest_pair_kalman": (bench_backtest_pair_kalman, lambda s, y: False),
+    "backtest_pair_rolling": (bench_backtest_pair_rolling, lambda s, y: False),
+    "calculate_positions": (bench_calculate_positions, lambda s, y: False),
+    "aggregate_yearly_results": (bench_aggregate_yearly_results, lambda s, y: s * y > 200 * 20),
+}
+
+
+def time_call(func, min_time: float = 1.0, max_repeats: int = 15, min_sample: float = 0.02) -> dict:
+    """
+    Best and median wall time of one func() call after a warm-up call. Fast
+    functions are looped so that each sample lasts at least min_sample.
+    """
+    start = time.perf_counter()
+    func()
+    loops = max(1, int(min_sample / max(time.perf_counter() - start, 1e-9)))
+    times = []
+    while len(times) < max_repeats and (len(times) < 3 or sum(times) * loops < min_time):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        times.append((time.perf_counter() - start) / loops)
+        if times[-1] > min_time:
+            break
+    return {"seconds": min(times), "median": float(np.median(times)), "repeats": len(times), "loops": loops}
+
+
+def calibrate() -> float:
+    """
+    Time of a fixed reference workload (pandas rolling statistics and a
+    Python loop), used to factor machine speed and load out of comparisons
+    """
+    values = pd.Series(np.random.default_rng(0).standard_normal(200_000))
+
+    def workload():
+        values.rolling(30).std().sum()
+        total = 0.0
+        for x in range(200_000):
+            total += x * 0.5
+    return time_call(workload)["seconds"]
+
+
+def run_suite(only=None, full: bool = False, cells=None) -> pd.DataFrame:
+    """Time every benchmark on every grid cell, or only the given (name, symbols, years) cells"""
+    rows = []
+    for n_symbols in SYMBOLS:
+        for n_years in YEARS:
+            if cells is not None:
+                names = [name for name, s, y in cells if (s, y) == (n_symbols, n_years)]
+            else:
+                names = [name for name, (_, slow) in BENCHMARKS.items()
+                         if (only is None or name in only) and (full or not slow(n_symbols, n_years))]
+            if not names:
+                continue
+            universe = Universe(n_symbols, n_years)
+            for name in names:
+                timing = time_call(BENCHMARKS[name][0](universe))
+                rows.append({"benchmark": name, "symbols": n_symbols, "years": n_years, **timing})
+                print(f"{name:<26} {n_symbols:>5} symbols {n_years:>3}y  {timing['seconds'] * 1000:10.2f} ms")
+    return pd.DataFrame(rows)
+
+
+def _key(row) -> str:
+    return f"{row['benchmark']}|{row['symbols']}|{row['years']}"
+
+
+def save_baseline(results: pd.DataFrame, calibration: float, path: str = BASELINE_PATH):
+    """
+    Store results as the baseline. If a baseline exists, only the cells in
+    results are replaced or added, converted to its calibration; every other
+    cell and the baseline's calibration stay exactly as they were.
+    """
+    timings = {_key(row): row["seconds"] for _, row in results.iterrows()}
+    if os.path.exists(path):
+        with open(path) as f:
+            baseline = json.load(f)
+        # Timed on this machine now: scale to the machine the baseline was recorded on
+        speed = calibration / baseline["calibration"]
+        baseline["results"].update({key: seconds / speed for key, seconds in timings.items()})
+    else:
+        baseline = {
+            "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                        "cpus": os.cpu_count()},
+            "created": pd.Timestamp.now().strftime("%Y-%m-%d %H:%M"),
+            "calibration": calibration,
+            "results": timings,
+        }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f"Baseline saved to {path}")
+
+
+def compare(results: pd.DataFrame, calibration: float, path: str = BASELINE_PATH,
+            threshold: float = 0.25) -> pd.DataFrame:
+    """
+    Join results with the baseline: ratio = current / baseline time, divided
+    by the same ratio of the calibration workload, and a status per cell
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+    speed = calibration / baseline["calibration"]
+    print(f"Machine speed vs baseline: x{1 / speed:.2f} (calibration {calibration * 1000:.1f} ms)")
+    report = results[["benchmark", "symbols", "years", "seconds"]].copy()
+    report["baseline"] = [baseline["results"].get(_key(row), np.nan) for _, row in report.iterrows()]
+    report["ratio"] = report["seconds"] / report["baseline"] / speed
+    report["status"] = np.select(
+        [report["baseline"].isna(), report["ratio"] > 1 + threshold, report["ratio"] < 1 / (1 + threshold)],
+        ["new", "REGRESSION", "faster"], default="ok")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline hot-path benchmarks on synthetic universes")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--full", action="store_true", help="include the slowest cells")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="flag cells slower than baseline * (1 + threshold)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    calibration = calibrate()
+    results = run_suite(args.only, args.full)
+    # Calibrate before and after, the load of a shared machine drifts
+    calibration = min(calibration, calibrate())
+    if args.output:
+        results.to_json(args.output, orient="records", indent=2)
+    if args.save_baseline:
+        save_baseline(results, calibration, args.baseline)
+    elif os.path.exists(args.baseline):
+        report = compare(results, calibration, args.baseline, args.threshold)
+        flagged = report[report["status"] == "REGRESSION"]
+        if len(flagged):
+            # Timings on a shared machine are noisy: confirm regressions with
+            # a second measurement and keep the faster one
+            print(f"\nRe-timing {len(flagged)} slower cell(s)")
+            cells = list(flagged[["benchmark", "symbols", "years"]].itertuples(index=False, name=None))
+            retimed = run_suite(cells=cells).set_index(["benchmark", "symbols", "years"])["seconds"]
+            results = results.set_index(["benchmark", "symbols", "years"])
+            results["seconds"] = np.fmin(results["seconds"], retimed.reindex(results.index))
+            results = results.reset_index()
+            report = compare(results, min(calibration, calibrate()), args.baseline, args.threshold)
+        print()
+        report[["seconds", "baseline"]] *= 1000
+        report = report.rename(columns={"seconds": "ms", "baseline": "baseline_ms"})
+        print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        regressions = int((report["status"] == "REGRESSION").sum())
+        print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+        if regressions:
+            raise SystemExit(1)
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from typing import List, Tuple
+
+TRADING_DAYS = 250
+
+
+def synthetic_universe(n_symbols: int = 50,
+                       n_years: int = 1,
+                       pair_share: float = 0.2,
+                       start: str = "2000-01-03",
+                       seed: int = 0) -> Tuple[pd.DataFrame, List[Tuple[str, str, float]]]:
+    """
+    Offline stand-in for the data/raw parquet files: daily closes of
+    n_symbols synthetic stocks over n_years of business days, in the same
+    long (date, symbol, close) layout.
+
+    Prices follow a one-factor model (market + sector + idiosyncratic
+    log-returns). A share `pair_share` of the symbols is paired up: the
+    first leg of each planted pair is alpha + beta * second leg plus a
+    mean-reverting AR(1) deviation, so the pair is cointegrated by
+    construction. Returns the long frame and the planted (a, b, beta) list.
+    """
+    rng = np.random.default_rng(seed)
+    n_days = n_years * TRADING_DAYS
+    dates = pd.bdate_range(start, periods=n_days)
+    symbols = [f"SYN{i:04d}" for i in range(n_symbols)]
+
+    market = rng.normal(0.0003, 0.010, n_days)
+    n_sectors = max(1, n_symbols // 10)
+    sectors = rng.normal(0, 0.006, (n_days, n_sectors))
+    sector_of = rng.integers(0, n_sectors, n_symbols)
+    loading = rng.uniform(0.5, 1.5, n_symbols)
+    returns = (market[:, None] * loading + sectors[:, sector_of]
+               + rng.normal(0, 0.015, (n_days, n_symbols)))
+    prices = rng.uniform(50, 2000, n_symbols) * np.exp(np.cumsum(returns, axis=0))
+
+    planted = []
+    n_planted = int(n_symbols * pair_share) // 2
+    for k in range(n_planted):
+        a, b = 2 * k, 2 * k + 1
+        beta = rng.uniform(0.3, 3.0)
+        deviation = np.zeros(n_days)
+        shocks = rng.normal(0, 0.01 * prices[0, b] * beta, n_days)
+        for t in range(1, n_days):
+            deviation[t] = 0.9 * deviation[t - 1] + shocks[t]
+        prices[:, a] = 0.1 * prices[0, b] * beta + beta * prices[:, b] + deviation
+        planted.append((symbols[a], symbols[b], beta))
+
+    df = pd.DataFrame({
+        "date": np.repeat(dates, n_symbols),
+        "symbol": np.tile(symbols, n_days),
+        "close": prices.ravel(),
+    })
+    return df, planted
+
+
+def price_matrix(df: pd.DataFrame) -> pd.DataFrame:
+    """Dense (dates x symbols) close matrix of a synthetic universe"""
+    return df.pivot(index="date", columns="symbol", values="close")
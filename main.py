@@ -1,9 +1,25 @@
 import os
+import argparse
+import numpy as np
 import pandas as pd
-from src.data_loader import load_and_validate_data, create_clean_price_matrix
-from src.pair_selection import find_pairs
+from concurrent.futures import ProcessPoolExecutor
+from src.price_cube import PriceCube, load_price_cube, append_price_cube
+from src.pair_selection import SELECTORS, PAIR_CACHE_VERSION, select_pairs, pair_cache
 from src.backtesting import backtest_pair
-from src.utils import save_pair_results, aggregate_yearly_results
+from src.utils import aggregate_yearly_results, pool_context
+from src.results_store import (
+    write_pair_results, write_yearly_results, write_final_portfolio, write_book, write_metrics,
+    delete_year, read_book, read_pair_results, read_yearly_results, read_final_portfolio
+)
+from src.checkpoints import (
+    CHECKPOINT_VERSION, read_manifest, stage_valid, record_stage, drop_stages, write_selection, read_selection
+)
+from src.cache import content_hash
+from src.metrics import results_metrics
+from src.streaming import StreamingEngine, replay_book, replay_feed
+from src.walk_forward import walk_forward
+from src import instrumentation
+from src.instrumentation import stage
 
 
 nifty50_2015 = [
@@ -97,52 +113,82 @@ def buy_and_hold_pnl(price_series: pd.Series, capital: float) -> float:
     pnl = (sell_price - buy_price) * quantity
     return pnl
 
-def main():
-    years = list(range(2015, 2025))
-    all_results = []
-    window = 20  # rolling window size for z-score
+def process_year(year: int, price_matrix: pd.DataFrame, warmup: pd.DataFrame = None, window: int = 20,
+                 selector: str = "cointegration", force: bool = False):
+    """
+    Select, backtest and save the top pairs of one year.
+    price_matrix is the year's clean price matrix for the valid index
+    symbols; warmup is the last `window` rows of the previous year's price
+    matrix (or None); selector names the pair selector in
+    src.pair_selection.SELECTORS.
+    Each stage (select, backtest, aggregate, book) is checkpointed (see
+    src.checkpoints); a stage whose inputs match its checkpoint is skipped
+    and its stored output reused. force reruns every stage.
+    A year that fails partway is discarded like one that produced nothing:
+    its stored results and the checkpoints after selection are removed.
+    Returns the yearly PnL DataFrame, or None if the year produced nothing.
+    """
+    with instrumentation.context(year=year):
+        return _process_year(year, price_matrix, warmup, window, selector, force)
 
-    yearly_data = load_and_validate_data(years)
 
-    for idx, year in enumerate(years):
-        print(f"\n=== Processing {year} ===")
-        try:
-            df = yearly_data[year]
-            nifty_symbols = globals()[f"nifty50_{year}"]
-            valid_symbols = [s for s in nifty_symbols if s in df['symbol'].unique()]
-            print(f"{year}: {len(valid_symbols)} valid symbols")
+def stored_pair_frames(year: int, traded: list) -> list:
+    """A year's stored pair details, one DataFrame per traded pair in trading order"""
+    details = read_pair_results(year)
+    return [details[details['pair'] == f"{a}-{b}"].reset_index(drop=True) for a, b, _ in traded]
 
-            if len(valid_symbols) < 20:
-                print(f"Skipping {year} - insufficient symbols")
-                continue
 
-            price_matrix = create_clean_price_matrix(df[df['symbol'].isin(valid_symbols)])
-            if price_matrix.empty:
-                print(f"Skipping {year} - empty price matrix")
-                continue
+def discard_year(year: int):
+    """
+    Forget a year that produced nothing or failed this run: results stored
+    by an earlier run and the checkpoints after selection would otherwise
+    keep showing it in the dashboard and metrics.
+    """
+    delete_year(year)
+    drop_stages(year, "backtest")
 
-            # Prepare previous year price_matrix for warm-up
-            if idx > 0:
-                prev_year = years[idx - 1]
-                prev_df = yearly_data[prev_year]
-                prev_valid_symbols = [s for s in nifty_symbols if s in prev_df['symbol'].unique()]
-                prev_price_matrix = create_clean_price_matrix(prev_df[prev_df['symbol'].isin(prev_valid_symbols)])
-            else:
-                prev_price_matrix = None
 
-            pairs = find_pairs(price_matrix)
-            print(f"Found {len(pairs)} valid pairs for {year}")
+def _process_year(year: int, price_matrix: pd.DataFrame, warmup: pd.DataFrame, window: int,
+                  selector: str, force: bool):
+    try:
+        if price_matrix.empty:
+            print(f"Skipping {year} - empty price matrix")
+            return None
 
-            if not pairs:
-                continue
+        manifest = {} if force else read_manifest(year)
+        entry_z, exit_z = 1.5, 0.15
+
+        select_key = content_hash("select", CHECKPOINT_VERSION, PAIR_CACHE_VERSION, selector, price_matrix)
+        if stage_valid(manifest, "select", select_key):
+            pairs = read_selection(year)
+            print(f"{year}: selection checkpoint is up to date")
+        else:
+            with stage("selection", selector=selector) as record:
+                pairs = select_pairs(price_matrix, selector)
+                record["items"] = len(pairs)
+            manifest = record_stage(year, "select", select_key, write_selection(year, pairs),
+                                    {"selector": selector})
+        print(f"Found {len(pairs)} valid pairs for {year}")
+
+        if not pairs:
+            discard_year(year)
+            return None
 
+        backtest_key = content_hash("backtest", select_key, warmup, window, entry_z, exit_z)
+        year_results = None
+        if stage_valid(manifest, "backtest", backtest_key):
+            traded = [tuple(pair) for pair in manifest["backtest"]["params"]["pairs"]]
+            print(f"{year}: backtest checkpoint is up to date")
+        else:
             year_results = []
+            traded = []
+            errors = 0
             for a, b, stats in pairs[:5]:
                 try:
                     # Prepare price series with warm-up
-                    if prev_price_matrix is not None and a in prev_price_matrix and b in prev_price_matrix:
-                        price_a_full = pd.concat([prev_price_matrix[a].iloc[-window:], price_matrix[a]])
-                        price_b_full = pd.concat([prev_price_matrix[b].iloc[-window:], price_matrix[b]])
+                    if warmup is not None and a in warmup and b in warmup:
+                        price_a_full = pd.concat([warmup[a], price_matrix[a]])
+                        price_b_full = pd.concat([warmup[b], price_matrix[b]])
                     else:
                         price_a_full = price_matrix[a]
                         price_b_full = price_matrix[b]
@@ -151,13 +197,15 @@ def main():
                     price_a_full, price_b_full = price_a_full.align(price_b_full, join='inner')
 
                     print(f"Backtesting {a}-{b}...")
-                    results = backtest_pair(
-                        price_a_full,
-                        price_b_full,
-                        stats['beta'],
-                        entry_z=1.5,
-                        exit_z=0.15
-                    )
+                    with stage("backtest", pair=f"{a}-{b}") as record:
+                        results = backtest_pair(
+                            price_a_full,
+                            price_b_full,
+                            stats['beta'],
+                            entry_z=entry_z,
+                            exit_z=exit_z
+                        )
+                        record["items"] = len(price_a_full)
 
                     # Slice off the first `window` rows so only current year remains
                     if isinstance(results, dict) and "details" in results:
@@ -166,6 +214,7 @@ def main():
                         df_pair = results.iloc[window:].copy()
                     else:
                         print(f"Warning: Unexpected results type for {a}-{b}")
+                        errors += 1
                         continue
 
                     bh_pnl_a = buy_and_hold_pnl(price_matrix[a], 500_000)
@@ -174,23 +223,148 @@ def main():
 
                     df_pair['year'] = year
                     df_pair['pair'] = f"{a}-{b}"
+                    df_pair['symbol_a'] = a
+                    df_pair['symbol_b'] = b
                     df_pair['bh_pnl_a'] = bh_pnl_a
                     df_pair['bh_pnl_b'] = bh_pnl_b
                     year_results.append(df_pair)
-                    save_pair_results({"details": df_pair}, year, a, b)
+                    traded.append((a, b, stats['beta']))
                 except Exception as e:
                     print(f"Error backtesting {a}-{b}: {str(e)}")
+                    errors += 1
                     continue
 
-            if year_results:
-                # Aggregate yearly results (cumulative_pnl starts from 0)
+            if not year_results:
+                discard_year(year)
+                return None
+            with stage("persistence") as record:
+                write_pair_results(year, year_results)
+                record["items"] = sum(len(df_pair) for df_pair in year_results)
+            # A year with failed pairs is kept but rerun next time
+            manifest = record_stage(year, "backtest", backtest_key, os.path.join("pairs", f"year={year}"),
+                                    {"pairs": traded, "entry_z": entry_z, "exit_z": exit_z,
+                                     "window": window, "errors": errors},
+                                    status="partial" if errors else "complete")
+
+        aggregate_key = content_hash("aggregate", backtest_key)
+        if stage_valid(manifest, "aggregate", aggregate_key):
+            yearly_pnl = read_yearly_results(year)
+        else:
+            if year_results is None:
+                year_results = stored_pair_frames(year, traded)
+            # Aggregate yearly results (cumulative_pnl starts from 0)
+            with stage("aggregation") as record:
                 yearly_pnl = aggregate_yearly_results(year_results, year)
-                yearly_pnl.to_csv(f"results/{year}_yearly_pnl.csv", index=False)
-                all_results.append(yearly_pnl)
+                record["items"] = len(year_results)
+            with stage("persistence") as record:
+                write_yearly_results(year, yearly_pnl)
+                record["items"] = len(yearly_pnl)
+            manifest = record_stage(year, "aggregate", aggregate_key, os.path.join("yearly", f"year={year}"))
+
+        # Streaming state at the end of the year, for run_update
+        book_params = {"entry_z": entry_z, "exit_z": exit_z}
+        book_key = content_hash("book", backtest_key, sorted(book_params.items()))
+        if not stage_valid(manifest, "book", book_key):
+            with stage("book") as record:
+                engine = replay_book(price_matrix, traded, warmup, **book_params)
+                write_book(year, traded, engine.get_state(), price_matrix.index[-1], book_params)
+                record["items"] = len(traded)
+            record_stage(year, "book", book_key, os.path.join("book", f"{year}.npz"), book_params)
+        return yearly_pnl
+
+    except Exception as e:
+        print(f"Error processing {year}: {str(e)}")
+        # Partitions written before the failure would not match the final portfolio
+        discard_year(year)
+    return None
+
 
+def prepare_tasks(cube: PriceCube, years: list, window: int = 20) -> list:
+    """
+    Build one (year, price_matrix, warmup) task per tradable year: the year's
+    clean price matrix for its valid index symbols and the last `window` rows
+    of the previous year's price matrix for warm-up, both sliced from the
+    price cube.
+    """
+    tasks = []
+    for idx, year in enumerate(years):
+        print(f"\n=== Preparing {year} ===")
+        try:
+            nifty_symbols = globals()[f"nifty50_{year}"]
+            year_symbols = set(cube.symbols_in(year))
+            valid_symbols = [s for s in nifty_symbols if s in year_symbols]
+            print(f"{year}: {len(valid_symbols)} valid symbols")
+
+            if len(valid_symbols) < 20:
+                print(f"Skipping {year} - insufficient symbols")
+                continue
+
+            # Previous year's price matrix tail for warm-up
+            if idx > 0:
+                prev_year = years[idx - 1]
+                prev_symbols = set(cube.symbols_in(prev_year))
+                prev_valid_symbols = [s for s in nifty_symbols if s in prev_symbols]
+                prev_price_matrix = cube.price_matrix(prev_year, prev_valid_symbols)
+                warmup = prev_price_matrix.iloc[-window:]
+            else:
+                warmup = None
+
+            with stage("matrix", year=year) as record:
+                price_matrix = cube.price_matrix(year, valid_symbols)
+                record["items"] = price_matrix.shape[1]
+            tasks.append((year, price_matrix, warmup))
         except Exception as e:
             print(f"Error processing {year}: {str(e)}")
             continue
+    return tasks
+
+
+def main(n_workers: int = 1, selector: str = "cointegration", report: bool = False, force=()):
+    """
+    Run the yearly pipeline for 2015-2024.
+    n_workers > 1 processes the years in a process pool (started with
+    utils.pool_context, so main can be called after numba parallel kernels
+    ran in this process); each task gets only its own price matrix and the
+    warm-up tail of the previous year, and the cumulative PnL is chained
+    once every year has finished. selector
+    names the pair selection method (see src.pair_selection.SELECTORS).
+    report records the time, CPU and memory of every stage and writes a
+    run report to results/reports (see src.instrumentation). Years resume
+    from their checkpoints, except those listed in force, which rerun fully.
+    """
+    years = list(range(2015, 2025))
+    window = 20  # rolling window size for z-score
+    if report:
+        instrumentation.enable()
+    started = pd.Timestamp.now()
+
+    with stage("load") as record:
+        cube = load_price_cube(years)
+        record["items"] = len(cube.dates)
+    tasks = prepare_tasks(cube, years, window)
+
+    if n_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks)), mp_context=pool_context()) as pool:
+            if report:
+                # Workers record their own stages and send them back with the result
+                futures = [pool.submit(instrumentation.collect, process_year,
+                                       year, price_matrix, warmup, window, selector, year in force)
+                           for year, price_matrix, warmup in tasks]
+                outputs = []
+                for future in futures:
+                    yearly_pnl, stages = future.result()
+                    instrumentation.extend(stages)
+                    outputs.append(yearly_pnl)
+            else:
+                futures = [pool.submit(process_year, year, price_matrix, warmup, window, selector, year in force)
+                           for year, price_matrix, warmup in tasks]
+                outputs = [future.result() for future in futures]
+    else:
+        outputs = []
+        for year, price_matrix, warmup in tasks:
+            print(f"\n=== Processing {year} ===")
+            outputs.append(process_year(year, price_matrix, warmup, window, selector, year in force))
+    all_results = [yearly_pnl for yearly_pnl in outputs if yearly_pnl is not None]
 
     if all_results:
         # Build continuous cumulative_pnl for final portfolio
@@ -202,11 +376,135 @@ def main():
             carry_forward = yearly_pnl['cumulative_pnl'].iloc[-1]
             final_results.append(yearly_pnl)
         final_results = pd.concat(final_results, ignore_index=True)
-        final_results.to_csv("results/final_portfolio_pnl.csv", index=False)
+        with stage("persistence") as record:
+            write_final_portfolio(final_results)
+            record["items"] = len(final_results)
+        # Metrics of every pair, year and the portfolio, for the dashboard
+        with stage("metrics") as record:
+            table, rolling = results_metrics()
+            write_metrics(table, rolling)
+            record["items"] = len(table)
         print("\n=== Final Performance ===")
         print(f"Total Portfolio Value: {final_results['cumulative_pnl'].iloc[-1]:,.2f}")
     else:
         print("No valid results generated")
 
+    if report:
+        path = instrumentation.write_run_report({
+            "mode": "yearly", "selector": selector, "workers": n_workers, "years": years,
+            "wall_s": (pd.Timestamp.now() - started).total_seconds(),
+            "total_pnl": float(final_results['cumulative_pnl'].iloc[-1]) if all_results else None,
+        })
+        instrumentation.disable()
+        print(f"Run report written to {path}")
+
+def run_walk_forward(lookback: int = 250):
+    """Monthly walk-forward: select on the trailing `lookback` days, trade the next month"""
+    years = list(range(2015, 2025))
+    cube = load_price_cube(years)
+    universes = {year: globals()[f"nifty50_{year}"] for year in years}
+    symbols = sorted(set().union(*universes.values()))
+    panel = cube.panel(symbols)
+
+    results = walk_forward(panel, universes, lookback=lookback)
+    os.makedirs("results", exist_ok=True)
+    results["daily"].to_csv("results/walk_forward_pnl.csv", index=False)
+    results["selections"].to_csv("results/walk_forward_selections.csv", index=False)
+    print("\n=== Walk-Forward Performance ===")
+    print(f"Periods traded: {results['selections']['period_start'].nunique() if len(results['selections']) else 0}")
+    print(f"Total Portfolio Value: {results['daily']['cumulative_pnl'].iloc[-1]:,.2f}")
+
+def run_update():
+    """
+    End-of-day update: advance the latest year's live book through the bars
+    added to its raw parquet file since the last stored day, with the
+    streaming engine, and append them to the price cube and to the pair,
+    yearly and final portfolio results in the store (the year's pair
+    partition is rewritten so every row carries the updated buy & hold).
+    Pairs stay those selected by the last full run; a new year needs a
+    full run.
+    """
+    book = read_book()
+    if book is None:
+        print("No live book found - run the full pipeline first")
+        return
+    year, pairs = book["year"], book["pairs"]
+    cube = PriceCube()
+    bars = list(replay_feed([year], cube.symbols, start=book["last_date"] + pd.Timedelta(days=1)))
+    if not bars:
+        print(f"Up to date ({book['last_date']:%Y-%m-%d})")
+        return
+    dates = pd.DatetimeIndex([date for date, _ in bars])
+    prices = np.vstack([bar for _, bar in bars])
+    cube = append_price_cube(cube, year, dates, prices)
+
+    engine = StreamingEngine(cube.symbols, pairs, **book["params"])
+    engine.set_state(book["state"])
+    rows = {pair: [] for pair in range(len(pairs))}
+    for date, bar in zip(dates, prices):
+        state = engine.on_bar(bar)
+        for k in rows:
+            rows[k].append({"date": date, **{name: values[k] for name, values in state.items()}})
+
+    year_prices = cube.frame(year)
+    stored = read_pair_results(year).drop(columns="year")
+    new_frames, pair_frames = [], []
+    for k, (a, b, _) in enumerate(pairs):
+        df_pair = pd.DataFrame(rows[k])
+        df_pair['pair'] = f"{a}-{b}"
+        df_pair['symbol_a'] = a
+        df_pair['symbol_b'] = b
+        new_frames.append(df_pair)
+        # Buy & hold runs to the new last day: refresh it on every row of the pair
+        previous = stored[stored['pair'] == f"{a}-{b}"].astype({"pair": str, "symbol_a": str, "symbol_b": str})
+        df_pair = pd.concat([previous, df_pair], ignore_index=True)
+        df_pair['bh_pnl_a'] = buy_and_hold_pnl(year_prices[a].dropna(), 500_000)
+        df_pair['bh_pnl_b'] = buy_and_hold_pnl(year_prices[b].dropna(), 500_000)
+        pair_frames.append(df_pair)
+    write_pair_results(year, pair_frames)
+
+    # Same columns as the full run's aggregation, continuing its cumulative PnL
+    tag = f"update-{dates[-1]:%Y%m%d}"
+    yearly_pnl = aggregate_yearly_results(new_frames, year)
+    daily_pnl = yearly_pnl['yearly_pnl'].to_numpy()
+    yearly_pnl['cumulative_pnl'] += read_yearly_results(year)['cumulative_pnl'].iloc[-1]
+    write_yearly_results(year, yearly_pnl, append_tag=tag)
+
+    final_results = read_final_portfolio()
+    new_rows = yearly_pnl.copy()
+    new_rows['cumulative_pnl'] = final_results['cumulative_pnl'].iloc[-1] + daily_pnl.cumsum()
+    write_final_portfolio(pd.concat([final_results, new_rows], ignore_index=True))
+    write_book(year, pairs, engine.get_state(), dates[-1], book["params"])
+    write_metrics(*results_metrics())
+
+    print(f"Appended {len(dates)} day(s) for {len(pairs)} pairs, through {dates[-1]:%Y-%m-%d}")
+    print(f"Total Portfolio Value: {new_rows['cumulative_pnl'].iloc[-1]:,.2f}")
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Nifty 50 cointegration pairs backtest")
+    parser.add_argument("--mode", choices=["yearly", "walk-forward", "update"], default="yearly",
+                        help="yearly: select and trade within each year; "
+                             "walk-forward: select on a trailing window, trade the next month; "
+                             "update: append the days added to the raw data since the last run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="process years in parallel with this many worker processes")
+    parser.add_argument("--lookback", type=int, default=250,
+                        help="walk-forward selection window in trading days")
+    parser.add_argument("--selector", choices=sorted(SELECTORS), default="cointegration",
+                        help="yearly pair selection method")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="drop cached pair selections before running")
+    parser.add_argument("--force", type=int, nargs="+", default=[], metavar="YEAR",
+                        help="rerun these years from scratch instead of resuming from their checkpoints")
+    parser.add_argument("--report", action="store_true",
+                        help="record per-stage time and memory and write a run report to results/reports")
+    args = parser.parse_args()
+    if args.clear_cache:
+        pair_cache().invalidate()
+    if args.mode == "walk-forward":
+        run_walk_forward(lookback=args.lookback)
+    elif args.mode == "update":
+        run_update()
+    else:
+        main(n_workers=args.workers, selector=args.selector, report=args.report, force=args.force)
@@ -1,10 +1,18 @@
 import pandas as pd
 import numpy as np
+from numba import njit, prange
 
-from typing import Dict
+from typing import Dict, Optional, Sequence, Tuple
 
+from src.hedge_ratio import KALMAN_DELTA, ROLLING_HEDGE_WINDOW, kalman_hedge, rolling_hedge
 
-def calculate_positions(zscore: np.ndarray, entry_z: float, exit_z: float) -> np.ndarray:
+# Hedge ratio methods of backtest_pair / backtest_pairs: the static beta from
+# pair selection, or one re-estimated every day
+HEDGES = ("static", "kalman", "rolling")
+
+
+@njit(cache=True)
+def _positions_kernel(zscore, entry_z, exit_z):
     positions = np.zeros_like(zscore)
     for i in range(1, len(zscore)):
         if positions[i-1] == 0:
@@ -13,70 +21,181 @@ def calculate_positions(zscore: np.ndarray, entry_z: float, exit_z: float) -> np
             elif zscore[i] > entry_z:
                 positions[i] = -1  # Short spread
         else:
-            if ((positions[i-1] == 1 and zscore[i] > -exit_z) or 
+            if ((positions[i-1] == 1 and zscore[i] > -exit_z) or
                 (positions[i-1] == -1 and zscore[i] < exit_z)):
                 positions[i] = 0
             else:
                 positions[i] = positions[i-1]
     return positions
 
-def backtest_pair(
-    price_a: pd.Series,
-    price_b: pd.Series,
-    beta: float,
-    entry_z: float = 1.5,
-    exit_z: float = 0.5,
-    cost_rate: float = 0.001,
-    book_size: float = 1_000_000,
-    stop_loss_pct: float = 0.10  # 10% stop-loss on book size
-) -> Dict[str, pd.Series]:
-    # Calculate spread and z-score
-    window = 30  # or another reasonable value
-    spread = price_a - beta * price_b
-    spread_mean = spread.rolling(window).mean().shift(1)
-    spread_std = spread.rolling(window).std().shift(1)
-    zscore = (spread - spread_mean) / spread_std
 
-    # Generate positions
-    positions = calculate_positions(zscore.values, entry_z, exit_z)
+@njit(cache=True)
+def _backtest_kernel(price_a, price_b, zscore, beta, entry_z, exit_z,
+                     cost_rate, book_size, stop_loss_pct):
+    """
+    Single pass over raw float arrays: positions, quantities, costs,
+    cumulative PnL and the stop-loss cut-off, exactly as backtest_pair
+    used to compute them with pandas indexing.
+    """
+    positions = _positions_kernel(zscore, entry_z, exit_z)
+    return _pnl_kernel(price_a, price_b, positions, beta, cost_rate, book_size, stop_loss_pct)
+
+
+@njit(cache=True)
+def _hedged_backtest_kernel(price_a, price_b, zscore, betas, entry_z, exit_z,
+                            cost_rate, book_size, stop_loss_pct, rebalance_cost):
+    """_backtest_kernel with a hedge ratio per day"""
+    positions = _positions_kernel(zscore, entry_z, exit_z)
+    return _hedged_pnl_kernel(price_a, price_b, positions, betas, cost_rate, book_size, stop_loss_pct,
+                              rebalance_cost)
+
+
+@njit(cache=True)
+def _pnl_kernel(price_a, price_b, positions, beta, cost_rate, book_size, stop_loss_pct):
+    """Quantities, costs, PnL and stop-loss of a position path (modified in place on a stop)"""
+    return _hedged_pnl_kernel(price_a, price_b, positions, np.full(len(positions), beta),
+                              cost_rate, book_size, stop_loss_pct, False)
+
 
+@njit(cache=True)
+def _hedged_pnl_kernel(price_a, price_b, positions, betas, cost_rate, book_size, stop_loss_pct,
+                       rebalance_cost):
+    """
+    _pnl_kernel with a hedge ratio per day: each day's quantities use that
+    day's beta. With rebalance_cost, re-sizing the legs of an open position
+    costs cost_rate on the traded notional, cost_rate * |change in quantity|
+    * price per leg, on top of the entry and exit costs.
+    """
     # Calculate dollar quantities
-    abs_beta = abs(beta)
+    abs_beta = np.abs(betas)
     notional_a = book_size / (1 + abs_beta)
     notional_b = book_size * abs_beta / (1 + abs_beta)
 
-    a_quantity = np.round((notional_a / price_a.values) * positions)
-    b_quantity = np.round((-np.sign(beta) * notional_b / price_b.values) * positions)
+    n = len(positions)
+    prices = np.empty((n, 2))
+    prices[:, 0] = price_a
+    prices[:, 1] = price_b
+    quantity = np.empty((n, 2))
+    quantity[:, 0] = np.round((notional_a / price_a) * positions)
+    quantity[:, 1] = np.round((-np.sign(betas) * notional_b / price_b) * positions)
 
-    # Calculate P&L
+    pnl, cumulative_pnl, num_trades = _legs_pnl_kernel(prices, quantity, positions, cost_rate, book_size,
+                                                       stop_loss_pct, rebalance_cost)
+    return positions, quantity[:, 0], quantity[:, 1], pnl, cumulative_pnl, num_trades
+
+
+@njit(cache=True)
+def _legs_pnl_kernel(prices, quantity, positions, cost_rate, book_size, stop_loss_pct, rebalance_cost):
+    """
+    Daily PnL, costs, stop-loss and trade count of (days x legs) quantities
+    held in (days x legs) prices, shared by pairs and baskets. positions and
+    quantity are modified in place on a stop.
+    Returns (pnl, cumulative_pnl, num_trades).
+    """
+    n, legs = prices.shape
     pnl = np.zeros_like(positions)
     cumulative_pnl = np.zeros_like(positions)
-    stop_loss_triggered = False
-    for i in range(1, len(positions)):
-        a_return = (price_a.iloc[i] - price_a.iloc[i-1]) / price_a.iloc[i-1]
-        b_return = (price_b.iloc[i] - price_b.iloc[i-1]) / price_b.iloc[i-1]
-
+    for i in range(1, n):
         # Position P&L
-        pnl[i] = (a_quantity[i-1] * price_a.iloc[i-1] * a_return +
-                  b_quantity[i-1] * price_b.iloc[i-1] * b_return)
+        for j in range(legs):
+            leg_return = (prices[i, j] - prices[i-1, j]) / prices[i-1, j]
+            pnl[i] += quantity[i-1, j] * prices[i-1, j] * leg_return
 
         # Transaction costs
         if positions[i] != positions[i-1]:
             pnl[i] -= cost_rate * book_size * abs(positions[i] - positions[i-1])
+        elif rebalance_cost:
+            traded = 0.0
+            for j in range(legs):
+                traded += abs(quantity[i, j] - quantity[i-1, j]) * prices[i, j]
+            pnl[i] -= cost_rate * traded
 
         cumulative_pnl[i] = cumulative_pnl[i-1] + pnl[i]
 
-        # Stop-loss: force flat if cumulative PnL drops below -stop_loss_pct * book_size
-        if not stop_loss_triggered and cumulative_pnl[i] < -stop_loss_pct * book_size:
+        # Stop-loss: force flat and stop trading if cumulative PnL
+        # drops below -stop_loss_pct * book_size
+        if cumulative_pnl[i] < -stop_loss_pct * book_size:
             positions[i:] = 0
-            a_quantity[i:] = 0
-            b_quantity[i:] = 0
-            stop_loss_triggered = True
-            break  # Optionally, stop further trading for this pair
+            quantity[i:] = 0
+            break
+
+    # Count number of round-trip trades (exits, with wrap-around like np.roll)
+    num_trades = 0
+    for i in range(n):
+        if positions[i-1] != 0 and positions[i] == 0:
+            num_trades += 1
+
+    return pnl, cumulative_pnl, num_trades
+
+
+def calculate_positions(zscore: np.ndarray, entry_z: float, exit_z: float) -> np.ndarray:
+    return _positions_kernel(np.asarray(zscore, dtype=np.float64), entry_z, exit_z)
+
+
+def dynamic_hedge(hedge: str, prices_a: np.ndarray, prices_b: np.ndarray, betas,
+                  starts: Optional[np.ndarray] = None,
+                  kalman_delta: float = KALMAN_DELTA,
+                  hedge_window: int = ROLLING_HEDGE_WINDOW) -> Dict[str, np.ndarray]:
+    """
+    Daily hedge ratio ('beta') and the z-score that drives positions
+    ('zscore') of one pair (1-D prices) or many ((days x pairs) prices)
+    under a non-static `hedge` method, starting from the static betas.
+    kalman: the filtered beta and the innovation z-score of kalman_hedge.
+    rolling: the trailing hedge_window-day regression of rolling_hedge.
+    """
+    if hedge == "kalman":
+        return kalman_hedge(prices_a, prices_b, betas, delta=kalman_delta, starts=starts)
+    if hedge == "rolling":
+        return rolling_hedge(prices_a, prices_b, betas, window=hedge_window, starts=starts)
+    raise ValueError(f"Unknown hedge {hedge!r}, expected one of {list(HEDGES)}")
+
+
+def backtest_pair(
+    price_a: pd.Series,
+    price_b: pd.Series,
+    beta: float,
+    entry_z: float = 1.5,
+    exit_z: float = 0.5,
+    cost_rate: float = 0.001,
+    book_size: float = 1_000_000,
+    stop_loss_pct: float = 0.10,  # 10% stop-loss on book size
+    hedge: str = "static",
+    kalman_delta: float = KALMAN_DELTA,
+    hedge_window: int = ROLLING_HEDGE_WINDOW
+) -> Dict[str, pd.Series]:
+    """
+    hedge: "static" trades the spread price_a - beta * price_b with a rolling
+    z-score; "kalman" re-estimates the hedge ratio daily with a Kalman filter
+    started at beta (state noise kalman_delta), sizes each day's legs with
+    that day's beta and trades the filter's innovation z-score; "rolling"
+    re-fits the hedge ratio by OLS over the trailing hedge_window days and
+    trades the residual z-score against the previous day's fit. Under a
+    dynamic hedge, re-sizing the legs of an open position is charged
+    cost_rate on the notional traded, and the details get a 'hedge_ratio'
+    column.
+    """
+    if hedge == "static":
+        # Calculate spread and z-score
+        window = 30  # or another reasonable value
+        spread = price_a - beta * price_b
+        spread_mean = spread.rolling(window).mean().shift(1)
+        spread_std = spread.rolling(window).std().shift(1)
+        zscore = (spread - spread_mean) / spread_std
+        betas = np.full(len(price_a), float(beta))
+    else:
+        hedged = dynamic_hedge(hedge, price_a.to_numpy(dtype=np.float64), price_b.to_numpy(dtype=np.float64),
+                               float(beta), kalman_delta=kalman_delta, hedge_window=hedge_window)
+        betas = hedged["beta"]
+        spread = price_a - betas * price_b
+        zscore = pd.Series(hedged["zscore"], index=price_a.index)
 
-    # Count number of round-trip trades
-    exits = ((np.roll(positions, 1) != 0) & (positions == 0))
-    num_trades = int(np.sum(exits))
+    positions, a_quantity, b_quantity, pnl, cumulative_pnl, num_trades = _hedged_backtest_kernel(
+        price_a.to_numpy(dtype=np.float64),
+        price_b.to_numpy(dtype=np.float64),
+        zscore.to_numpy(dtype=np.float64),
+        betas, float(entry_z), float(exit_z),
+        float(cost_rate), float(book_size), float(stop_loss_pct), hedge != "static"
+    )
 
     df = pd.DataFrame({
         'date': price_a.index,
@@ -90,4 +209,241 @@ def backtest_pair(
         'daily_pnl': pnl,
         'cumulative_pnl': cumulative_pnl
     })
-    return {"details": df, "num_trades": num_trades}
\ No newline at end of file
+    if hedge != "static":
+        df['hedge_ratio'] = betas
+    return {"details": df, "num_trades": num_trades}
+
+
+@njit(cache=True, parallel=True)
+def _backtest_matrix_kernel(prices_a, prices_b, zscores, betas, starts, entry_z, exit_z,
+                            cost_rate, book_size, stop_loss_pct, rebalance_cost):
+    """Run _hedged_backtest_kernel on every column of (days x pairs) arrays (betas too)."""
+    n_days, n_pairs = zscores.shape
+    positions = np.zeros((n_days, n_pairs))
+    a_quantity = np.zeros((n_days, n_pairs))
+    b_quantity = np.zeros((n_days, n_pairs))
+    pnl = np.zeros((n_days, n_pairs))
+    cumulative_pnl = np.zeros((n_days, n_pairs))
+    num_trades = np.zeros(n_pairs, dtype=np.int64)
+    for k in prange(n_pairs):
+        s = starts[k]
+        pos, qa, qb, p, cp, nt = _hedged_backtest_kernel(
+            np.ascontiguousarray(prices_a[s:, k]),
+            np.ascontiguousarray(prices_b[s:, k]),
+            np.ascontiguousarray(zscores[s:, k]),
+            np.ascontiguousarray(betas[s:, k]), entry_z, exit_z, cost_rate, book_size, stop_loss_pct,
+            rebalance_cost
+        )
+        positions[s:, k] = pos
+        a_quantity[s:, k] = qa
+        b_quantity[s:, k] = qb
+        pnl[s:, k] = p
+        cumulative_pnl[s:, k] = cp
+        num_trades[k] = nt
+    return positions, a_quantity, b_quantity, pnl, cumulative_pnl, num_trades
+
+
+def stack_pairs(
+    price_matrix: pd.DataFrame,
+    pairs: Sequence[Tuple[str, str, float]],
+    warmup: Optional[pd.DataFrame] = None
+) -> Dict[str, object]:
+    """
+    Leg prices and spreads of many (a, b, beta) pairs as (days x pairs) arrays.
+    Warm-up rows are prepended ('n_warmup' of them); 'starts' gives the first
+    usable row per pair (pairs with a leg missing from the warm-up start cold
+    on the first row of price_matrix). Raises KeyError if a leg is not a
+    column of price_matrix.
+    """
+    symbols_a = [a for a, _, _ in pairs]
+    symbols_b = [b for _, b, _ in pairs]
+    betas = np.array([beta for _, _, beta in pairs], dtype=np.float64)
+
+    n_warmup = 0
+    if warmup is not None and not warmup.empty:
+        n_warmup = len(warmup)
+        price_matrix = pd.concat([warmup.reindex(columns=price_matrix.columns), price_matrix])
+
+    columns_a = price_matrix.columns.get_indexer(symbols_a)
+    columns_b = price_matrix.columns.get_indexer(symbols_b)
+    # get_indexer marks a missing symbol with -1, which would read the last column
+    missing = sorted({s for s, c in zip(symbols_a + symbols_b, np.r_[columns_a, columns_b]) if c < 0})
+    if missing:
+        raise KeyError(f"Symbols not in the price matrix: {missing}")
+    values = price_matrix.to_numpy(dtype=np.float64)
+    prices_a = values[:, columns_a]
+    prices_b = values[:, columns_b]
+
+    warm = ~(np.isnan(prices_a[:n_warmup]).any(axis=0) | np.isnan(prices_b[:n_warmup]).any(axis=0))
+    starts = np.where(warm, 0, n_warmup).astype(np.int64)
+
+    return {
+        "dates": price_matrix.index,
+        "n_warmup": n_warmup,
+        "symbol_a": np.array(symbols_a, dtype=object),
+        "symbol_b": np.array(symbols_b, dtype=object),
+        "beta": betas,
+        "starts": starts,
+        "price_a": prices_a,
+        "price_b": prices_b,
+        "spread": prices_a - betas * prices_b,
+    }
+
+
+def rolling_zscore(spread: np.ndarray, starts: np.ndarray, window: int) -> np.ndarray:
+    """backtest_pair's lookahead-free rolling z-score for every column of spread"""
+    rolling = pd.DataFrame(spread).rolling(window)
+    spread_mean = rolling.mean().shift(1).to_numpy()
+    spread_std = rolling.std().shift(1).to_numpy()
+    zscore = (spread - spread_mean) / spread_std
+    for k in np.flatnonzero(starts):
+        # Cold-started pairs get their rolling statistics from their own rows only
+        column = pd.Series(spread[starts[k]:, k]).rolling(window)
+        zscore[:starts[k], k] = np.nan
+        zscore[starts[k]:, k] = ((spread[starts[k]:, k] - column.mean().shift(1).to_numpy())
+                                 / column.std().shift(1).to_numpy())
+    return zscore
+
+
+def backtest_pairs(
+    price_matrix: pd.DataFrame,
+    pairs: Sequence[Tuple[str, str, float]],
+    entry_z: float = 1.5,
+    exit_z: float = 0.5,
+    cost_rate: float = 0.001,
+    book_size: float = 1_000_000,
+    stop_loss_pct: float = 0.10,
+    window: int = 30,
+    warmup: Optional[pd.DataFrame] = None,
+    hedge: str = "static",
+    kalman_delta: float = KALMAN_DELTA,
+    hedge_window: int = ROLLING_HEDGE_WINDOW
+) -> Dict[str, object]:
+    """
+    Backtest many pairs at once on a (dates x symbols) price matrix.
+
+    pairs: sequence of (symbol_a, symbol_b, beta), e.g.
+        [(a, b, stats['beta']) for a, b, stats in find_pairs(price_matrix)]
+    warmup: optional trailing rows of the previous year, prepended to warm up
+        the rolling z-score and sliced off again afterwards. Pairs with a leg
+        missing from the warm-up rows start cold on the first day of
+        price_matrix.
+    hedge: as in backtest_pair; a dynamic hedge is estimated for all pairs
+        in one pass over the (days x pairs) prices.
+
+    Each pair follows exactly the same rules as backtest_pair. Returns a
+    columnar dict: 'dates', per-pair 'symbol_a', 'symbol_b', 'beta',
+    'num_trades' arrays and (dates x pairs) arrays for every details column,
+    plus 'hedge_ratio' for dynamic hedges.
+    """
+    arrays = stack_pairs(price_matrix, pairs, warmup)
+    prices_a, prices_b, betas, starts = (arrays["price_a"], arrays["price_b"],
+                                         arrays["beta"], arrays["starts"])
+    if hedge == "static":
+        spread = arrays["spread"]
+        zscore = rolling_zscore(spread, starts, window)
+        hedge_ratio = np.repeat(betas[None, :], len(prices_a), axis=0)
+    else:
+        hedged = dynamic_hedge(hedge, prices_a, prices_b, betas, starts,
+                               kalman_delta=kalman_delta, hedge_window=hedge_window)
+        hedge_ratio, zscore = hedged["beta"], hedged["zscore"]
+        spread = prices_a - hedge_ratio * prices_b
+
+    positions, a_quantity, b_quantity, pnl, cumulative_pnl, num_trades = _backtest_matrix_kernel(
+        prices_a, prices_b, zscore, hedge_ratio, starts,
+        float(entry_z), float(exit_z), float(cost_rate), float(book_size), float(stop_loss_pct),
+        hedge != "static"
+    )
+
+    current = slice(arrays["n_warmup"], None)
+    results = {
+        "dates": arrays["dates"][current],
+        "symbol_a": arrays["symbol_a"],
+        "symbol_b": arrays["symbol_b"],
+        "beta": betas,
+        "num_trades": num_trades,
+        "price_a": prices_a[current],
+        "price_b": prices_b[current],
+        "spread": spread[current],
+        "zscore": zscore[current],
+        "position": positions[current],
+        "quantity_a": a_quantity[current],
+        "quantity_b": b_quantity[current],
+        "daily_pnl": pnl[current],
+        "cumulative_pnl": cumulative_pnl[current],
+    }
+    if hedge != "static":
+        results["hedge_ratio"] = hedge_ratio[current]
+    return results
+
+
+def pair_details(results: Dict[str, object], k: int) -> pd.DataFrame:
+    """Rebuild backtest_pair's 'details' DataFrame for pair k of a backtest_pairs result."""
+    df = pd.DataFrame({'date': results["dates"]})
+    for field in ('price_a', 'price_b', 'spread', 'zscore', 'position',
+                  'quantity_a', 'quantity_b', 'daily_pnl', 'cumulative_pnl', 'hedge_ratio'):
+        if field in results:
+            df[field] = results[field][:, k]
+    return df
+
+
+@njit(cache=True)
+def _basket_pnl_kernel(prices, positions, weights, cost_rate, book_size, stop_loss_pct):
+    """
+    _pnl_kernel for a basket of legs ((days x legs) prices): leg j gets
+    book_size * |w_j| / sum(|w|) of notional, on the side of sign(w_j) when
+    long the spread. Two legs weighted (1, -beta) trade exactly like a pair.
+    """
+    n, legs = prices.shape
+    total = np.abs(weights).sum()
+    quantity = np.zeros((n, legs))
+    for j in range(legs):
+        notional = book_size * abs(weights[j]) / total
+        quantity[:, j] = np.round((np.sign(weights[j]) * notional / prices[:, j]) * positions)
+
+    pnl, cumulative_pnl, num_trades = _legs_pnl_kernel(prices, quantity, positions, cost_rate, book_size,
+                                                       stop_loss_pct, False)
+    return positions, quantity, pnl, cumulative_pnl, num_trades
+
+
+def backtest_basket(
+    prices: pd.DataFrame,
+    weights: Sequence[float],
+    entry_z: float = 1.5,
+    exit_z: float = 0.5,
+    cost_rate: float = 0.001,
+    book_size: float = 1_000_000,
+    stop_loss_pct: float = 0.10,
+    window: int = 30
+) -> Dict[str, object]:
+    """
+    backtest_pair for a basket of any number of legs, e.g. one found by
+    find_baskets: prices has one column per leg, weights one weight per
+    column, and the spread traded is prices @ weights with the same rolling
+    z-score, entry/exit rules, costs and stop-loss as backtest_pair.
+    The details have a price_<symbol> and quantity_<symbol> column per leg.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    values = prices.to_numpy(dtype=np.float64)
+    spread = pd.Series(values @ weights, index=prices.index)
+    spread_mean = spread.rolling(window).mean().shift(1)
+    spread_std = spread.rolling(window).std().shift(1)
+    zscore = (spread - spread_mean) / spread_std
+
+    positions = _positions_kernel(zscore.to_numpy(dtype=np.float64), float(entry_z), float(exit_z))
+    positions, quantity, pnl, cumulative_pnl, num_trades = _basket_pnl_kernel(
+        np.ascontiguousarray(values), positions, weights,
+        float(cost_rate), float(book_size), float(stop_loss_pct)
+    )
+
+    df = pd.DataFrame({'date': prices.index})
+    for j, symbol in enumerate(prices.columns):
+        df[f'price_{symbol}'] = values[:, j]
+    df['spread'] = spread.values
+    df['zscore'] = zscore.values
+    df['position'] = positions
+    for j, symbol in enumerate(prices.columns):
+        df[f'quantity_{symbol}'] = quantity[:, j]
+    df['daily_pnl'] = pnl
+    df['cumulative_pnl'] = cumulative_pnl
+    return {"details": df, "num_trades": num_trades}
@@ -0,0 +1,258 @@
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def sizeof(value) -> int:
+    """Approximate in-memory size of a cached value in bytes"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(index=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by number of entries and, optionally,
+    by the total approximate size of the values (see sizeof). Counts hits,
+    misses and evictions.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value):
+        size = sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.nbytes += size
+            # Always keep the newest entry, even if it alone exceeds max_bytes
+            while len(self._data) > 1 and (
+                    len(self._data) > self.max_entries
+                    or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Caches live in this module rather than in the callers so they survive
+# Streamlit re-executing the dashboard script on every interaction.
+_registry: Dict[str, LRUCache] = {}
+
+
+def get_cache(name: str, max_entries: int = 128, max_bytes: Optional[int] = None) -> LRUCache:
+    """Named process-wide cache, created on first use"""
+    if name not in _registry:
+        _registry[name] = LRUCache(max_entries, max_bytes)
+    return _registry[name]
+
+
+def memoize(name: Optional[str] = None,
+            max_entries: int = 128,
+            max_bytes: Optional[int] = None,
+            version: Optional[Callable[..., Hashable]] = None):
+    """
+    Cache a function's results in a named LRUCache keyed on its arguments.
+    version(*args, **kwargs), if given, is added to the key - e.g. the mtime of
+    the file being read - so that stale entries are never served after the
+    underlying data changes (they age out of the LRU instead).
+    Cached values are shared between callers and must be treated as read-only.
+    """
+    def decorator(func):
+        cache = get_cache(name or f"{func.__module__}.{func.__qualname__}", max_entries, max_bytes)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            if version is not None:
+                key = (version(*args, **kwargs),) + key
+            missing = object()
+            value = cache.get(key, missing)
+            if value is missing:
+                value = func(*args, **kwargs)
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def cache_stats() -> pd.DataFrame:
+    """Hit/miss/eviction counters of every registered cache"""
+    rows = [dict(cache=name, **cache.stats()) for name, cache in sorted(_registry.items())]
+    return pd.DataFrame(rows, columns=["cache", "entries", "bytes", "hits", "misses", "evictions"])
+
+
+def clear_caches():
+    for cache in _registry.values():
+        cache.clear()
+
+
+def content_hash(*parts) -> str:
+    """
+    SHA-256 over the contents of the given values: DataFrames and Series by
+    their index, columns and raw data, arrays by dtype/shape/bytes, anything
+    else by repr (so parameters should be plain numbers/strings/tuples).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+            columns = part.columns if isinstance(part, pd.DataFrame) else [part.name]
+            digest.update(repr(list(columns)).encode())
+        elif isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"{part.dtype}{part.shape}".encode())
+            digest.update(part.tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed pickle store: one file per key (normally a
+    content_hash) under `path`, with an in-process LRUCache in front.
+    Hits refresh the file's mtime; once the files exceed max_bytes the least
+    recently used ones are deleted. Writes go through a temporary file and
+    a rename, so concurrent worker processes never see partial entries.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 ** 2, memory_entries: int = 64):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory = LRUCache(memory_entries)
+        self.hits = self.misses = self.evictions = 0
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.pkl")
+
+    def get(self, key: str, default=None):
+        missing = object()
+        value = self.memory.get(key, missing)
+        if value is not missing:
+            self.hits += 1
+            return value
+        try:
+            with open(self._file(key), "rb") as f:
+                value = pickle.load(f)
+            os.utime(self._file(key))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value):
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            # e.g. an unpicklable value: drop the partial file, keep any earlier entry
+            os.remove(tmp)
+            raise
+        self.memory.put(key, value)
+        self._evict()
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.path) if e.name.endswith(".pkl")]
+        stats = sorted(((e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in entries))
+        total = sum(size for _, size, _ in stats)
+        # Oldest first; the newest entry is always kept
+        for _, size, path in stats[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one entry, or everything when key is None"""
+        if key is None:
+            self.memory.clear()
+            if os.path.isdir(self.path):
+                for entry in os.scandir(self.path):
+                    if entry.name.endswith((".pkl", ".tmp")):
+                        os.remove(entry.path)
+            return
+        self.memory.pop(key)
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        files = [e.stat().st_size for e in os.scandir(self.path) if e.name.endswith(".pkl")] \
+            if os.path.isdir(self.path) else []
+        return {
+            "entries": len(files),
+            "bytes": sum(files),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,127 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+
+from src.results_store import STORE_DIR
+
+# Bump when the yearly pipeline changes what a stage produces, so every
+# checkpoint written before is treated as stale
+CHECKPOINT_VERSION = 1
+
+# Stages of main.process_year, in order; each one's input key chains on the
+# previous one's, so invalidating a stage invalidates everything after it
+STAGES = ["select", "backtest", "aggregate", "book"]
+
+
+def _dir(store_dir: Optional[str] = None) -> str:
+    return os.path.join(store_dir or STORE_DIR, "checkpoints")
+
+
+def _manifest_path(year: int, store_dir: Optional[str] = None) -> str:
+    return os.path.join(_dir(store_dir), f"{year}.json")
+
+
+def _write_json(path: str, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=2, default=_json_default)
+    os.replace(path + ".tmp", path)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def read_manifest(year: int, store_dir: Optional[str] = None) -> dict:
+    """
+    Checkpoint manifest of one year: stage -> {input, params, output, status,
+    completed}. One file per year so parallel workers never write the same one.
+    """
+    try:
+        with open(_manifest_path(year, store_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def stage_valid(manifest: dict, stage: str, key: str, store_dir: Optional[str] = None) -> bool:
+    """True if `stage` completed with the same input key and its output still exists"""
+    entry = manifest.get(stage)
+    return (entry is not None
+            and entry["input"] == key
+            and entry["status"] == "complete"
+            and os.path.exists(os.path.join(store_dir or STORE_DIR, entry["output"])))
+
+
+def record_stage(year: int, stage: str, key: str, output: str, params: Optional[dict] = None,
+                 status: str = "complete", store_dir: Optional[str] = None) -> dict:
+    """
+    Mark `stage` of `year` done for input `key`, its output at `output`
+    (relative to the store). Stages after it are dropped: they were built
+    from the previous output. status other than "complete" (e.g. a
+    backtest with failed pairs) is recorded but never resumed from.
+    """
+    manifest = read_manifest(year, store_dir)
+    for later in STAGES[STAGES.index(stage):]:
+        manifest.pop(later, None)
+    manifest[stage] = {
+        "input": key,
+        "params": params or {},
+        "output": output,
+        "status": status,
+        "completed": pd.Timestamp.now().isoformat(timespec="seconds"),
+    }
+    _write_json(_manifest_path(year, store_dir), manifest)
+    return manifest
+
+
+def drop_stages(year: int, stage: str, store_dir: Optional[str] = None) -> dict:
+    """Forget `stage` of `year` and every stage after it, e.g. when it produced nothing"""
+    manifest = read_manifest(year, store_dir)
+    for later in STAGES[STAGES.index(stage):]:
+        manifest.pop(later, None)
+    _write_json(_manifest_path(year, store_dir), manifest)
+    return manifest
+
+
+def write_selection(year: int, pairs: list, store_dir: Optional[str] = None) -> str:
+    """Persist a year's selected pairs [(a, b, stats)]; returns the store-relative path"""
+    output = os.path.join("checkpoints", f"{year}-pairs.json")
+    _write_json(os.path.join(store_dir or STORE_DIR, output), [[a, b, stats] for a, b, stats in pairs])
+    return output
+
+
+def read_selection(year: int, store_dir: Optional[str] = None) -> List[tuple]:
+    with open(os.path.join(_dir(store_dir), f"{year}-pairs.json")) as f:
+        return [(a, b, stats) for a, b, stats in json.load(f)]
+
+
+def invalidate(year: Optional[int] = None, store_dir: Optional[str] = None):
+    """Drop the checkpoints of one year, or of every year when year is None"""
+    if not os.path.isdir(_dir(store_dir)):
+        return
+    for name in os.listdir(_dir(store_dir)):
+        if year is None or name in (f"{year}.json", f"{year}-pairs.json"):
+            os.remove(os.path.join(_dir(store_dir), name))
+
+
+def checkpoint_table(store_dir: Optional[str] = None) -> pd.DataFrame:
+    """One row per recorded (year, stage)"""
+    rows = []
+    if os.path.isdir(_dir(store_dir)):
+        for name in sorted(os.listdir(_dir(store_dir))):
+            if name.endswith(".json") and name[:-5].isdigit():
+                year = int(name[:-5])
+                for stage, entry in read_manifest(year, store_dir).items():
+                    rows.append({"year": year, "stage": stage, "status": entry["status"],
+                                 "output": entry["output"], "completed": entry["completed"],
+                                 "input": entry["input"][:12]})
+    return pd.DataFrame(rows, columns=["year", "stage", "status", "output", "completed", "input"])
+
+
+if __name__ == "__main__":
+    print(checkpoint_table().to_string(index=False))
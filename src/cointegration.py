@@ -0,0 +1,282 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+from src.utils import pool_context
+
+SQRTEPS = np.sqrt(np.finfo(float).eps)
+
+
+def default_maxlag(nobs: int) -> int:
+    """Schwert (1989) rule used by adfuller when maxlag is None (no trend terms)"""
+    maxlag = int(np.ceil(12.0 * np.power(nobs / 100.0, 1 / 4.0)))
+    return min(nobs // 2 - 1, maxlag)
+
+
+def mackinnon_pvalues(teststat: np.ndarray, regression: str = "c", N: int = 2) -> np.ndarray:
+    """
+    Vectorized MacKinnon (1994) approximate p-values, as statsmodels' mackinnonp.
+    The polynomial tables are private to statsmodels.tsa.adfvalues; if a
+    release moves them, fall back to calling mackinnonp element-wise.
+    """
+    # Imported on first use: statsmodels and scipy.stats take over a second to
+    # import, which dominates entry points that never test cointegration
+    from scipy.stats import norm
+    teststat = np.asarray(teststat, dtype=np.float64)
+    try:
+        from statsmodels.tsa.adfvalues import (
+            _tau_maxs, _tau_mins, _tau_stars, _tau_smallps, _tau_largeps
+        )
+    except ImportError:
+        from statsmodels.tsa.adfvalues import mackinnonp
+        pvalues = [np.nan if np.isnan(stat) else mackinnonp(stat, regression=regression, N=N)
+                   for stat in teststat.ravel()]
+        return np.asarray(pvalues, dtype=np.float64).reshape(teststat.shape)
+    small = np.polyval(np.asarray(_tau_smallps[regression][N - 1])[::-1], teststat)
+    large = np.polyval(np.asarray(_tau_largeps[regression][N - 1])[::-1], teststat)
+    with np.errstate(invalid='ignore'):
+        pvalues = norm.cdf(np.where(teststat <= _tau_stars[regression][N - 1], small, large))
+        pvalues = np.where(teststat > _tau_maxs[regression][N - 1], 1.0, pvalues)
+        pvalues = np.where(teststat < _tau_mins[regression][N - 1], 0.0, pvalues)
+    return np.where(np.isnan(teststat), np.nan, pvalues)
+
+
+def _lagged_design(levels: np.ndarray, diffs: np.ndarray, lags: int, maxlag: int) -> np.ndarray:
+    """
+    Stack the ADF regression [x_{t-1}, dx_{t-1}, ..., dx_{t-lags}, dx_t] for
+    every column, using the last len(diffs) - maxlag observations.
+    Returns an array of shape (pairs, nobs, lags + 2), response in the last
+    column; it is a transposed view of a (pairs, lags + 2, nobs) buffer, i.e.
+    already in LAPACK's column-major order.
+    """
+    n = diffs.shape[0] - maxlag
+    levels_t = levels.T
+    diffs_t = diffs.T
+    design = np.empty((levels.shape[1], lags + 2, n))
+    design[:, 0, :] = levels_t[:, maxlag:maxlag + n]
+    for j in range(1, lags + 1):
+        design[:, j, :] = diffs_t[:, maxlag - j:maxlag - j + n]
+    design[:, -1, :] = diffs_t[:, maxlag:]
+    return design.transpose(0, 2, 1)
+
+
+def batch_adf(residuals: np.ndarray, maxlag: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ADF t-statistics (no constant, AIC lag selection) for every column of a
+    (days x series) residual matrix, following statsmodels' adfuller(x,
+    regression='n', autolag='aic') step by step:
+
+    1. all lag lengths 0..maxlag are fitted on the common maxlag-trimmed
+       sample and the lag with the smallest AIC is kept (ties -> fewer lags);
+    2. the regression is rerun with that lag on its own, longer sample and
+       the t-value of the lagged level is returned.
+
+    Every regression comes from one batched QR of [X, y]: the leading k
+    columns of R solve the k-regressor model and the trailing entries of R's
+    last column give its residual sum of squares without cancellation.
+    Returns (adf_stat, used_lag); columns that cannot be tested give NaN.
+    """
+    residuals = np.asarray(residuals, dtype=np.float64)
+    nobs, n_series = residuals.shape
+    if maxlag is None:
+        maxlag = default_maxlag(nobs)
+    adf_stat = np.full(n_series, np.nan)
+    used_lag = np.full(n_series, -1, dtype=np.int64)
+    if n_series == 0 or maxlag < 0:
+        return adf_stat, used_lag
+
+    testable = np.isfinite(residuals).all(axis=0) & (np.ptp(residuals, axis=0) > 0)
+    cols = np.flatnonzero(testable)
+    if cols.size == 0:
+        return adf_stat, used_lag
+    levels = residuals[:, cols]
+    diffs = np.diff(levels, axis=0)
+
+    # 1. Lag selection on the common sample
+    n = diffs.shape[0] - maxlag
+    r = np.linalg.qr(_lagged_design(levels, diffs, maxlag, maxlag), mode='r')
+    tail = r[:, :, -1] ** 2  # (series, maxlag + 2)
+    ssr = np.cumsum(tail[:, ::-1], axis=1)[:, ::-1][:, 1:]  # ssr[:, k-1] for k regressors
+    k = np.arange(1, maxlag + 2)
+    with np.errstate(divide='ignore'):
+        aic = n * np.log(2 * np.pi) + n * np.log(ssr / n) + n + 2 * k
+    best = np.argmin(aic, axis=1)
+
+    # 2. Rerun each series with its selected lag
+    for lag in np.unique(best):
+        members = np.flatnonzero(best == lag)
+        design = _lagged_design(levels[:, members], diffs[:, members], lag, lag)
+        n_lag = design.shape[1]
+        r = np.linalg.qr(design, mode='r')
+        r_x = r[:, :lag + 1, :lag + 1]
+        params = np.linalg.solve(r_x, r[:, :lag + 1, -1:])[:, 0, 0]
+        scale = r[:, -1, -1] ** 2 / (n_lag - (lag + 1))
+        r_inv = np.linalg.inv(r_x)
+        bse = np.sqrt(scale * np.sum(r_inv[:, 0, :] ** 2, axis=1))
+        adf_stat[cols[members]] = params / bse
+        used_lag[cols[members]] = lag
+
+    return adf_stat, used_lag
+
+
+def centred_moments(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Column-centred prices and their cross-product matrix (first-stage OLS inputs)"""
+    values = np.asarray(values, dtype=np.float64)
+    centred = values - values.mean(axis=0)
+    return centred, centred.T @ centred
+
+
+def _coint_chunk(centred: np.ndarray, cross: np.ndarray,
+                 idx_a: np.ndarray, idx_b: np.ndarray,
+                 maxlag: Optional[int] = None) -> np.ndarray:
+    """Engle-Granger t-statistics for one chunk of pairs"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = cross[idx_a, idx_b] / cross[idx_b, idx_b]
+        resid = centred[:, idx_a] - beta * centred[:, idx_b]
+        rsquared = 1 - np.sum(resid ** 2, axis=0) / cross[idx_a, idx_a]
+    return engle_granger_stats(resid, rsquared, maxlag)
+
+
+def engle_granger_stats(residuals: np.ndarray, rsquared: np.ndarray,
+                        maxlag: Optional[int] = None) -> np.ndarray:
+    """Second Engle-Granger step on first-stage residuals computed elsewhere"""
+    stats, _ = batch_adf(residuals, maxlag=maxlag)
+    # (Almost) perfectly colinear legs: coint reports -inf
+    stats[np.asarray(rsquared) >= 1 - 100 * SQRTEPS] = -np.inf
+    return stats
+
+
+def batch_coint(values: np.ndarray,
+                idx_a: np.ndarray,
+                idx_b: np.ndarray,
+                maxlag: Optional[int] = None,
+                chunk_size: int = 512) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Engle-Granger test of column idx_a on column idx_b for many pairs at once,
+    equivalent to statsmodels' coint(values[:, a], values[:, b]) per pair.
+
+    The first-stage OLS (a on b plus constant) for every pair is read off the
+    centred cross-product matrix, the residuals go through batch_adf and the
+    p-values come from the MacKinnon surface for N=2 with a constant.
+    Returns (stat, pvalue) arrays aligned with idx_a/idx_b.
+    """
+    idx_a = np.asarray(idx_a, dtype=np.int64)
+    idx_b = np.asarray(idx_b, dtype=np.int64)
+    centred, cross = centred_moments(values)
+    stats = np.full(len(idx_a), np.nan)
+    for start in range(0, len(idx_a), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        stats[chunk] = _coint_chunk(centred, cross, idx_a[chunk], idx_b[chunk], maxlag)
+    return stats, mackinnon_pvalues(stats, regression="c", N=2)
+
+
+# Per-worker views onto the shared moments, set by _attach_shared_moments
+_shared = {}
+
+
+def _attach_shared_moments(blocks) -> None:
+    """Pool initializer: map the parent's shared-memory blocks without copying"""
+    for key, (name, shape) in blocks.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key + "_shm"] = shm  # keep the mapping alive
+        _shared[key] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _coint_shared_chunk(idx_a: np.ndarray, idx_b: np.ndarray, maxlag: Optional[int]) -> np.ndarray:
+    return _coint_chunk(_shared["centred"], _shared["cross"], idx_a, idx_b, maxlag)
+
+
+def parallel_coint(values: np.ndarray,
+                   idx_a: np.ndarray,
+                   idx_b: np.ndarray,
+                   maxlag: Optional[int] = None,
+                   n_jobs: int = -1,
+                   chunk_size: int = 64) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    batch_coint spread over a process pool.
+
+    The centred price matrix and its cross-product matrix are computed once
+    and placed in multiprocessing.shared_memory; workers attach to them
+    zero-copy and test chunks of chunk_size pairs. Chunks are merged back in
+    submission order, so the output is bit-identical to batch_coint.
+    n_jobs=-1 uses every core; n_jobs=1 runs batch_coint in this process with
+    the same chunk_size. Workers are started with utils.pool_context.
+    """
+    idx_a = np.asarray(idx_a, dtype=np.int64)
+    idx_b = np.asarray(idx_b, dtype=np.int64)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs == 1:
+        return batch_coint(values, idx_a, idx_b, maxlag, chunk_size)
+
+    centred, cross = centred_moments(values)
+    segments = []
+    blocks = {}
+    try:
+        for key, array in (("centred", centred), ("cross", cross)):
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            segments.append(shm)
+            np.ndarray(array.shape, dtype=np.float64, buffer=shm.buf)[...] = array
+            blocks[key] = (shm.name, array.shape)
+        del centred, cross
+
+        starts = range(0, len(idx_a), chunk_size)
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 mp_context=pool_context(),
+                                 initializer=_attach_shared_moments,
+                                 initargs=(blocks,)) as pool:
+            chunks = list(pool.map(
+                _coint_shared_chunk,
+                [idx_a[s:s + chunk_size] for s in starts],
+                [idx_b[s:s + chunk_size] for s in starts],
+                [maxlag] * len(starts)
+            ))
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+    stats = np.concatenate(chunks) if chunks else np.empty(0)
+    return stats, mackinnon_pvalues(stats, regression="c", N=2)
+
+
+def check_parity(years=range(2015, 2025), min_correlation: float = 0.7) -> float:
+    """
+    Compare batch_coint against statsmodels' coint on every correlated pair
+    of the shipped parquet files; returns the largest absolute p-value gap.
+    """
+    import warnings
+    import main
+    from statsmodels.tsa.stattools import coint
+    from src.data_loader import load_and_validate_data, create_clean_price_matrix
+
+    yearly_data = load_and_validate_data(list(years))
+    worst = 0.0
+    for year, df in yearly_data.items():
+        symbols = [s for s in getattr(main, f"nifty50_{year}") if s in df['symbol'].unique()]
+        price_matrix = create_clean_price_matrix(df[df['symbol'].isin(symbols)])
+        corr = np.abs(np.corrcoef(price_matrix.values, rowvar=False))
+        idx_a, idx_b = np.triu_indices(corr.shape[0], k=1)
+        keep = corr[idx_a, idx_b] >= min_correlation
+        idx_a, idx_b = idx_a[keep], idx_b[keep]
+
+        stats, pvalues = batch_coint(price_matrix.values, idx_a, idx_b)
+        ref = np.empty((len(idx_a), 2))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for n, (i, j) in enumerate(zip(idx_a, idx_b)):
+                ref[n] = coint(price_matrix.iloc[:, i], price_matrix.iloc[:, j])[:2]
+        gap = float(np.max(np.abs(pvalues - ref[:, 1]))) if len(ref) else 0.0
+        stat_gap = float(np.max(np.abs(stats - ref[:, 0]))) if len(ref) else 0.0
+        print(f"{year}: {len(idx_a)} pairs, max |stat diff| {stat_gap:.2e}, max |p-value diff| {gap:.2e}")
+        worst = max(worst, gap)
+    return worst
+
+
+if __name__ == "__main__":
+    worst = check_parity()
+    print(f"Max p-value difference vs statsmodels coint: {worst:.2e}")
+    if worst > 1e-8:
+        raise SystemExit(1)
@@ -44,6 +44,10 @@ def create_clean_price_matrix(df: pd.DataFrame) -> pd.DataFrame:
     
     price_matrix = df.pivot(index='date', columns='symbol', values='close')
     
+    return clean_price_matrix(price_matrix)
+
+def clean_price_matrix(price_matrix: pd.DataFrame) -> pd.DataFrame:
+    """History filter and gap filling applied to a (dates x symbols) close matrix"""
     # Filter for stocks with sufficient history
     price_matrix = price_matrix.loc[:, price_matrix.count() >= 200]
     
@@ -51,6 +55,8 @@ def create_clean_price_matrix(df: pd.DataFrame) -> pd.DataFrame:
     price_matrix = price_matrix.ffill(limit=5).dropna(axis=1)
     
     return price_matrix
+
+
 def load_year_data(symbol, year, window=20):
     # Load full data for the symbol
     df = pd.read_csv(f"data/{symbol}.csv", parse_dates=["date"])
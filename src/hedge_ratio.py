@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+from typing import Dict, Optional
+
+# Kalman filter defaults: state noise delta / (1 - delta) and observation
+# noise on prices normalised to 1 on the first day (see kalman_hedge)
+KALMAN_DELTA = 1e-5
+KALMAN_OBS_VAR = 1e-3
+KALMAN_ADAPT = 0.02  # about a 50-day average of squared innovations
+
+# Trailing days of the rolling regression hedge (see rolling_hedge)
+ROLLING_HEDGE_WINDOW = 60
+
+
+@njit(cache=True, parallel=True)
+def _kalman_kernel(y, x, starts, init_beta, delta, obs_var, adapt):
+    """
+    2-state (intercept, beta) Kalman filter of y = alpha + beta * x + e on
+    every column of (days x pairs) arrays. Prices are divided by their
+    first valid value so that one set of noise parameters fits every pair;
+    alpha and beta are scaled back before being returned. The observation
+    noise starts at obs_var and tracks an exponential average (weight
+    adapt) of the squared innovations, so z-scores stay near unit variance.
+    """
+    n_days, n_pairs = y.shape
+    alpha = np.full((n_days, n_pairs), np.nan)
+    beta = np.full((n_days, n_pairs), np.nan)
+    zscore = np.full((n_days, n_pairs), np.nan)
+    state_var = delta / (1 - delta)
+    for k in prange(n_pairs):
+        # First day with both prices: the normalisation constants
+        first = -1
+        for t in range(starts[k], n_days):
+            if y[t, k] == y[t, k] and x[t, k] == x[t, k]:
+                first = t
+                break
+        if first < 0:
+            continue
+        y0 = y[first, k]
+        x0 = x[first, k]
+        # Start from the static hedge ratio when there is one, with the
+        # intercept that fits the first day exactly
+        theta1 = init_beta[k] * x0 / y0 if init_beta[k] == init_beta[k] else 1.0
+        theta0 = 1.0 - theta1
+        p00 = p01 = p11 = 0.0
+        noise = obs_var
+        for t in range(starts[k], n_days):
+            yt = y[t, k] / y0
+            xt = x[t, k] / x0
+            if yt == yt and xt == xt:
+                # Predict: random-walk state, covariance grows by the state noise
+                r00 = p00 + state_var
+                r01 = p01
+                r11 = p11 + state_var
+                # Innovation and its variance for the observation row [1, xt]
+                error = yt - (theta0 + theta1 * xt)
+                rx0 = r00 + r01 * xt
+                rx1 = r01 + r11 * xt
+                q = rx0 + rx1 * xt + noise
+                zscore[t, k] = error / np.sqrt(q)
+                # Update
+                k0 = rx0 / q
+                k1 = rx1 / q
+                theta0 += k0 * error
+                theta1 += k1 * error
+                p00 = r00 - k0 * rx0
+                p01 = r01 - k0 * rx1
+                p11 = r11 - k1 * rx1
+                noise += adapt * (error * error - noise)
+            alpha[t, k] = theta0 * y0
+            beta[t, k] = theta1 * y0 / x0
+        for t in range(starts[k], first):
+            alpha[t, k] = y0 - x0 if init_beta[k] != init_beta[k] else y0 - init_beta[k] * x0
+            beta[t, k] = y0 / x0 if init_beta[k] != init_beta[k] else init_beta[k]
+    return alpha, beta, zscore
+
+
+def _as_matrix(values) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    return np.ascontiguousarray(values.reshape(len(values), -1))
+
+
+def kalman_hedge(price_a,
+                 price_b,
+                 beta: Optional[np.ndarray] = None,
+                 delta: float = KALMAN_DELTA,
+                 obs_var: float = KALMAN_OBS_VAR,
+                 adapt: float = KALMAN_ADAPT,
+                 starts: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Dynamic hedge ratio of leg a on leg b from a Kalman filter, for one pair
+    (1-D price arrays) or many at once ((days x pairs) arrays).
+    beta, per pair, is the filter's starting hedge ratio (e.g. the static
+    one from find_pairs); starts, per pair, is the first row to use.
+    delta sets how fast the hedge ratio may drift, obs_var the starting
+    observation noise and adapt how fast the latter follows the data.
+    Returns 'alpha', 'beta' and 'zscore' with the shape of the inputs:
+    the filtered intercept and hedge ratio after each day (carried over days
+    with missing prices) and the innovation z-score, i.e. the one-step
+    prediction error of leg a over its predicted standard deviation, which
+    uses only earlier days.
+    """
+    one_pair = np.ndim(price_a) == 1
+    y, x = _as_matrix(price_a), _as_matrix(price_b)
+    n_pairs = y.shape[1]
+    init_beta = np.full(n_pairs, np.nan) if beta is None else \
+        np.broadcast_to(np.asarray(beta, dtype=np.float64), n_pairs).copy()
+    starts = np.zeros(n_pairs, dtype=np.int64) if starts is None else np.asarray(starts, dtype=np.int64)
+    alpha, betas, zscore = _kalman_kernel(y, x, starts, init_beta, float(delta), float(obs_var),
+                                           float(adapt))
+    if one_pair:
+        return {"alpha": alpha[:, 0], "beta": betas[:, 0], "zscore": zscore[:, 0]}
+    return {"alpha": alpha, "beta": betas, "zscore": zscore}
+
+
+def _window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum over the trailing `window` rows of every column, NaN until the window is full"""
+    cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+    out = np.full(values.shape, np.nan)
+    out[window - 1:] = cumulative[window:] - cumulative[:-window]
+    return out
+
+
+def rolling_hedge(price_a,
+                  price_b,
+                  beta: Optional[np.ndarray] = None,
+                  window: int = ROLLING_HEDGE_WINDOW,
+                  starts: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Hedge ratio of leg a on leg b re-estimated every day by an OLS
+    regression a = alpha + beta * b over the trailing `window` days, for one
+    pair (1-D price arrays) or many at once ((days x pairs) arrays).
+    The regressions come from windowed cumulative sums of x, y, x^2, xy and
+    y^2, so each pair costs O(days) whatever the window.
+    Returns 'alpha', 'beta' and 'zscore' with the shape of the inputs. A
+    window must be full of days with both prices: before the first one beta
+    is the given static beta (alpha fits the first day), and days after a
+    gap keep the last estimate. The z-score is each day's residual from the
+    previous day's fit over that fit's residual standard deviation.
+    """
+    one_pair = np.ndim(price_a) == 1
+    y, x = _as_matrix(price_a), _as_matrix(price_b)
+    n_days, n_pairs = y.shape
+    rows = np.arange(n_days)[:, None]
+    started = rows >= (np.zeros(n_pairs, dtype=np.int64) if starts is None else np.asarray(starts))[None, :]
+    valid = ~(np.isnan(y) | np.isnan(x)) & started
+
+    # Normalise by the first usable prices so the sums stay well conditioned
+    first = np.where(valid.any(axis=0), valid.argmax(axis=0), 0)
+    y0 = y[first, np.arange(n_pairs)]
+    x0 = x[first, np.arange(n_pairs)]
+    yn = np.where(valid, y / y0, 0.0)
+    xn = np.where(valid, x / x0, 0.0)
+
+    n = _window_sum(valid.astype(np.float64), window)
+    sx, sy = _window_sum(xn, window), _window_sum(yn, window)
+    sxx, sxy, syy = _window_sum(xn * xn, window), _window_sum(xn * yn, window), _window_sum(yn * yn, window)
+    full = n == window
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        var = sxx - sx * sx / n
+        slope = np.where(full, cov / var, np.nan)
+        intercept = (sy - slope * sx) / n
+        resid_std = np.sqrt(np.maximum(syy - sy * sy / n - slope * cov, 0.0) / (n - 2))
+
+        # Out of sample: today's residual against yesterday's regression
+        zscore = np.full((n_days, n_pairs), np.nan)
+        zscore[1:] = (yn[1:] - intercept[:-1] - slope[:-1] * xn[1:]) / resid_std[:-1]
+        zscore[~valid] = np.nan
+
+        init = np.full(n_pairs, np.nan) if beta is None else \
+            np.broadcast_to(np.asarray(beta, dtype=np.float64), n_pairs)
+        init = np.where(np.isnan(init), y0 / x0, init)
+        betas = slope * y0 / x0
+        alphas = intercept * y0
+
+    # Before the first full window: the static beta; after gaps: the last estimate
+    fitted = full.any(axis=0)
+    before = rows < np.where(fitted, full.argmax(axis=0), n_days)
+    betas = np.where(before, init, betas)
+    alphas = np.where(before, y0 - init * x0, alphas)
+    betas = pd.DataFrame(betas).ffill().to_numpy()
+    alphas = pd.DataFrame(alphas).ffill().to_numpy()
+    betas[~started] = np.nan
+    alphas[~started] = np.nan
+
+    if one_pair:
+        return {"alpha": alphas[:, 0], "beta": betas[:, 0], "zscore": zscore[:, 0]}
+    return {"alpha": alphas, "beta": betas, "zscore": zscore}
@@ -0,0 +1,191 @@
+import contextlib
+import json
+import os
+import platform
+import time
+import pandas as pd
+from typing import Callable, List, Optional, Tuple
+
+REPORT_DIR = os.path.join("results", "reports")
+STAGE_COLUMNS = ["year", "stage", "pair", "items", "wall_s", "cpu_s", "rss_start_mb", "rss_peak_mb",
+                 "rss_end_mb", "rss_delta_mb", "pid"]
+
+# None while instrumentation is off, so stage() costs next to nothing by default
+_records: Optional[List[dict]] = None
+_context: dict = {}
+# Highest RSS seen so far by each open stage, innermost last (see stage)
+_peaks: List[float] = []
+
+
+def enable():
+    """Start recording stages in this process (drops anything recorded before)"""
+    global _records
+    _records = []
+    _peaks.clear()
+
+
+def disable():
+    global _records
+    _records = None
+
+
+def enabled() -> bool:
+    return _records is not None
+
+
+def records() -> List[dict]:
+    return list(_records or [])
+
+
+def rss_mb() -> float:
+    """Current resident memory of this process, in MB (NaN where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return float("nan")
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def _high_water_mb() -> float:
+    """VmHWM, the peak resident memory since the last _reset_high_water, in MB (NaN if unknown)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return float("nan")
+
+
+def _reset_high_water() -> bool:
+    """Reset VmHWM to the current RSS (Linux 4.0+); False where that is not possible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """Add fields (e.g. year=2023) to every stage recorded inside the block"""
+    previous = dict(_context)
+    _context.update(fields)
+    try:
+        yield
+    finally:
+        _context.clear()
+        _context.update(previous)
+
+
+@contextlib.contextmanager
+def stage(name: str, **fields):
+    """
+    Record wall time, CPU time and the resident memory of the process as
+    one stage: RSS on entering and leaving the block and its high-water mark
+    in between, rss_peak_mb, which includes buffers freed before the block
+    returns. The peak comes from resetting and reading the kernel's VmHWM;
+    nested stages fold their peaks into the enclosing one. Where that is not
+    available (not Linux) rss_peak_mb is NaN. The block may set
+    record["items"] to the number of things it processed.
+    Does nothing unless enable() was called in this process.
+    """
+    record = {"stage": name, "items": None, **_context, **fields}
+    if _records is None:
+        yield record
+        return
+    if _peaks:
+        # The enclosing stage's peak so far, before the mark is reset for this one
+        _peaks[-1] = max(_peaks[-1], _high_water_mb())
+    _peaks.append(float("-inf") if _reset_high_water() else float("nan"))
+    rss = rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = time.perf_counter() - wall
+        record["cpu_s"] = time.process_time() - cpu
+        peak = max(_peaks.pop(), _high_water_mb())
+        if _peaks:
+            _peaks[-1] = max(_peaks[-1], peak)
+        record["rss_start_mb"] = rss
+        record["rss_peak_mb"] = peak
+        record["rss_end_mb"] = rss_mb()
+        record["rss_delta_mb"] = record["rss_end_mb"] - rss
+        record["pid"] = os.getpid()
+        _records.append(record)
+
+
+def collect(func: Callable, *args, **kwargs) -> Tuple[object, List[dict]]:
+    """
+    Run func with instrumentation on and return (result, recorded stages);
+    used to bring back the stages of work done in a worker process.
+    """
+    enable()
+    try:
+        return func(*args, **kwargs), records()
+    finally:
+        disable()
+
+
+def extend(stages: List[dict]):
+    """Add stages recorded elsewhere (see collect) to this process's records"""
+    if _records is not None:
+        _records.extend(stages)
+
+
+def stage_table(stages: List[dict]) -> pd.DataFrame:
+    df = pd.DataFrame(stages)
+    for column in STAGE_COLUMNS:
+        if column not in df:
+            df[column] = None
+    return df[STAGE_COLUMNS + [c for c in df.columns if c not in STAGE_COLUMNS]]
+
+
+def write_run_report(info: dict, stages: Optional[List[dict]] = None, path: str = REPORT_DIR) -> str:
+    """
+    Write the recorded stages as run-YYYYmmdd-HHMMSS.json (run info, the
+    stages and per-stage totals) and a .parquet with one row per stage.
+    Returns the JSON path.
+    """
+    stages = records() if stages is None else stages
+    table = stage_table(stages)
+    started = pd.Timestamp.now()
+    name = f"run-{started:%Y%m%d-%H%M%S}"
+    totals = table.groupby("stage", sort=False).agg(
+        calls=("stage", "size"), items=("items", "sum"), wall_s=("wall_s", "sum"),
+        cpu_s=("cpu_s", "sum"), rss_peak_mb=("rss_peak_mb", "max"),
+        rss_delta_mb=("rss_delta_mb", "sum")).reset_index()
+    report = {
+        "run": name,
+        "created": started.isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count()},
+        **info,
+        "totals": totals.to_dict(orient="records"),
+        "stages": stages,
+    }
+    os.makedirs(path, exist_ok=True)
+    json_path = os.path.join(path, f"{name}.json")
+    with open(json_path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    table.astype({"year": "Int64", "items": "Int64", "pid": "Int64", "pair": "string"}).to_parquet(
+        os.path.join(path, f"{name}.parquet"), index=False)
+    return json_path
+
+
+def list_run_reports(path: str = REPORT_DIR) -> List[str]:
+    """JSON run reports, newest first"""
+    if not os.path.isdir(path):
+        return []
+    return sorted((os.path.join(path, f) for f in os.listdir(path) if f.endswith(".json")), reverse=True)
+
+
+def read_run_report(json_path: str) -> Tuple[dict, pd.DataFrame]:
+    """(report without the stages, stage table) of one JSON run report"""
+    with open(json_path) as f:
+        report = json.load(f)
+    return report, stage_table(report.pop("stages"))
@@ -0,0 +1,168 @@
+import numpy as np
+from typing import Dict, Optional
+
+
+def johansen_moments(values: np.ndarray, k_ar_diff: int = 1) -> np.ndarray:
+    """
+    Centred cross-product matrix of [dx_t, dx_{t-1}, ..., dx_{t-k}, x_{t-k}]
+    over the sample coint_johansen uses, for every column of a (days x
+    symbols) price matrix at once: a ((k + 2) * symbols) square matrix from
+    which every basket's regressions are read off (see batch_johansen).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    diffs = np.diff(values, axis=0)
+    n = diffs.shape[0] - k_ar_diff
+    blocks = [diffs[k_ar_diff:]]
+    blocks += [diffs[k_ar_diff - j:k_ar_diff - j + n] for j in range(1, k_ar_diff + 1)]
+    blocks.append(values[1:1 + n])
+    stacked = np.hstack(blocks)
+    stacked -= stacked.mean(axis=0)
+    return stacked.T @ stacked
+
+
+def _blocks(moments: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Stack of moments[rows[i]][:, cols[i]] for every basket i"""
+    return moments[rows[:, :, None], cols[:, None, :]]
+
+
+def batch_johansen(values: np.ndarray,
+                   baskets: np.ndarray,
+                   k_ar_diff: int = 1,
+                   moments: Optional[np.ndarray] = None,
+                   chunk_size: int = 4096) -> Dict[str, np.ndarray]:
+    """
+    Johansen cointegration test (constant term, k_ar_diff lagged
+    differences) of many baskets of the same size at once, equivalent to
+    statsmodels' coint_johansen(values[:, basket], 0, k_ar_diff) per basket.
+
+    baskets is a (baskets x legs) array of column indices. The reduced-rank
+    regressions of every basket come from blocks of one johansen_moments
+    matrix: the residual moments after partialling out the lagged
+    differences are solved in a stack, and the eigenproblem
+    S_k0 S_00^-1 S_0k v = lambda S_kk v becomes a stacked symmetric one via
+    the Cholesky factor of S_kk, so no per-basket Python loop runs.
+
+    Returns 'eigenvalues' (baskets x legs, descending), 'eigenvectors'
+    (baskets x legs x legs, columns normalised to v' S_kk v / nobs = 1, signed so
+    the first leg is positive), 'trace_stat' and 'max_eig_stat' (baskets x
+    legs, for cointegration rank r = 0..legs-1) and 'trace_crit' (legs x 3:
+    90/95/99% critical values, shared by every basket).
+    """
+    # Imported on first use, like the MacKinnon tables in src.cointegration
+    from statsmodels.tsa.coint_tables import c_sjt
+
+    values = np.asarray(values, dtype=np.float64)
+    baskets = np.asarray(baskets, dtype=np.int64)
+    n_baskets, legs = baskets.shape
+    n_symbols = values.shape[1]
+    nobs = values.shape[0] - 1 - k_ar_diff
+    if moments is None:
+        moments = johansen_moments(values, k_ar_diff)
+
+    eigenvalues = np.full((n_baskets, legs), np.nan)
+    eigenvectors = np.full((n_baskets, legs, legs), np.nan)
+    for start in range(0, n_baskets, chunk_size):
+        chunk = baskets[start:start + chunk_size]
+        lagged = np.hstack([chunk + j * n_symbols for j in range(1, k_ar_diff + 1)])
+        levels = chunk + (k_ar_diff + 1) * n_symbols
+
+        s00, s0k, skk = _blocks(moments, chunk, chunk), _blocks(moments, chunk, levels), \
+            _blocks(moments, levels, levels)
+        if k_ar_diff > 0:
+            # Partial out the lagged differences
+            szz = _blocks(moments, lagged, lagged)
+            sz0, szk = _blocks(moments, lagged, chunk), _blocks(moments, lagged, levels)
+            solved = np.linalg.solve(szz, np.concatenate([sz0, szk], axis=2))
+            w0, wk = solved[:, :, :legs], solved[:, :, legs:]
+            s00 = s00 - np.swapaxes(sz0, 1, 2) @ w0
+            s0k = s0k - np.swapaxes(sz0, 1, 2) @ wk
+            skk = skk - np.swapaxes(szk, 1, 2) @ wk
+
+        with np.errstate(invalid="ignore"):
+            try:
+                lower = np.linalg.cholesky(skk)
+            except np.linalg.LinAlgError:
+                # A degenerate basket (e.g. a constant or repeated leg) would
+                # fail the whole stack: factor the baskets one by one instead
+                lower = np.full_like(skk, np.nan)
+                for i in range(len(skk)):
+                    try:
+                        lower[i] = np.linalg.cholesky(skk[i])
+                    except np.linalg.LinAlgError:
+                        pass
+            ok = np.isfinite(lower).all(axis=(1, 2))
+            # C = L^-1 S_k0 S_00^-1 S_0k L^-T, symmetric
+            a = np.linalg.solve(lower[ok], np.swapaxes(s0k[ok], 1, 2))
+            c = a @ np.linalg.solve(s00[ok], np.swapaxes(a, 1, 2))
+            c = (c + np.swapaxes(c, 1, 2)) / 2
+            lam, w = np.linalg.eigh(c)
+            # Scaled like coint_johansen, whose S_kk is divided by nobs
+            vectors = np.linalg.solve(np.swapaxes(lower[ok], 1, 2), w) * np.sqrt(nobs)
+
+        # Descending eigenvalues; first leg of each eigenvector positive
+        lam, vectors = lam[:, ::-1], vectors[:, :, ::-1]
+        vectors *= np.where(vectors[:, :1, :] < 0, -1.0, 1.0)
+        index = np.arange(start, start + len(chunk))[ok]
+        eigenvalues[index] = lam
+        eigenvectors[index] = vectors
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_remaining = np.log(1 - eigenvalues)
+        trace_stat = -nobs * np.cumsum(log_remaining[:, ::-1], axis=1)[:, ::-1]
+        max_eig_stat = -nobs * log_remaining
+    return {
+        "eigenvalues": eigenvalues,
+        "eigenvectors": eigenvectors,
+        "trace_stat": trace_stat,
+        "max_eig_stat": max_eig_stat,
+        "trace_crit": np.array([c_sjt(legs - r, 0) for r in range(legs)]),
+    }
+
+
+def check_parity(years=range(2015, 2025), sizes=(3, 4), n_baskets: int = 100,
+                 min_correlation: float = 0.7, seed: int = 0) -> float:
+    """
+    Compare batch_johansen against statsmodels' coint_johansen on a random
+    sample of n_baskets correlated baskets of each size per shipped year;
+    returns the largest relative trace statistic gap.
+    """
+    import main
+    from statsmodels.tsa.vector_ar.vecm import coint_johansen
+    from src.price_cube import load_price_cube
+    from src.pair_selection import correlated_pairs, correlated_baskets
+
+    rng = np.random.default_rng(seed)
+    cube = load_price_cube(list(years))
+    worst = 0.0
+    for year in years:
+        symbols = [s for s in getattr(main, f"nifty50_{year}") if s in cube.symbols_in(year)]
+        price_matrix = cube.price_matrix(year, symbols)
+        values = price_matrix.to_numpy(dtype=np.float64)
+        candidates = correlated_pairs(price_matrix, min_correlation)
+        for size in sizes:
+            baskets = correlated_baskets(candidates, len(symbols), size)
+            if len(baskets) > n_baskets:
+                baskets = baskets[np.sort(rng.choice(len(baskets), n_baskets, replace=False))]
+            if not len(baskets):
+                continue
+            result = batch_johansen(values, baskets)
+            stat_gap = vector_gap = 0.0
+            for i, basket in enumerate(baskets):
+                ref = coint_johansen(values[:, basket], 0, 1)
+                stat_gap = max(stat_gap, float(np.max(np.abs(result["trace_stat"][i] - ref.lr1)
+                                                      / np.maximum(np.abs(ref.lr1), 1e-12))))
+                # Eigenvectors are unique up to sign
+                vectors = ref.evec * np.where(ref.evec[:1] < 0, -1.0, 1.0)
+                vector_gap = max(vector_gap, float(np.max(np.abs(result["eigenvectors"][i][:, 0] - vectors[:, 0])
+                                                          / np.abs(vectors[:, 0]).max())))
+            print(f"{year}: {len(baskets)} baskets of {size}, max relative trace stat diff {stat_gap:.2e}, "
+                  f"first eigenvector diff {vector_gap:.2e}")
+            worst = max(worst, stat_gap)
+    return worst
+
+
+if __name__ == "__main__":
+    worst = check_parity()
+    print(f"Max relative trace statistic difference vs statsmodels coint_johansen: {worst:.2e}")
+    if worst > 1e-6:
+        raise SystemExit(1)
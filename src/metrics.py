@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+
+from src.results_store import read_pair_results, read_final_portfolio
+
+TRADING_DAYS = 252
+ROLLING_WINDOW = 63  # about a quarter
+CAPITAL_PER_PAIR = 1_000_000
+PAIRS_PER_YEAR = 5
+
+
+def metrics_table(pnl: pd.DataFrame,
+                  capital,
+                  cumulative: Optional[pd.DataFrame] = None,
+                  positions: Optional[pd.DataFrame] = None,
+                  risk_free_rate: float = 0.06,
+                  window: int = ROLLING_WINDOW) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Performance metrics of every column of a (dates x series) daily PnL
+    matrix at once; NaN marks dates on which a series did not trade.
+    capital is the capital behind each series (scalar or one per column);
+    cumulative defaults to the running sum of pnl; positions, if given,
+    are used to count round-trip trades.
+    Returns (table, rolling): one row per series with the dashboard's
+    metrics (see view_results.compute_metrics, whose definitions this
+    follows), and a long table of the rolling `window`-day Sharpe and the
+    drawdown from the trailing `window`-day peak per series and date.
+    """
+    values = pnl.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    capital = np.broadcast_to(np.asarray(capital, dtype=np.float64), values.shape[1])
+    if cumulative is None:
+        cum = np.where(valid, np.nancumsum(values, axis=0), np.nan)
+    else:
+        cum = cumulative.reindex(index=pnl.index, columns=pnl.columns).to_numpy(dtype=np.float64)
+    n = valid.sum(axis=0)
+    rows = np.arange(len(values))
+    has_rows = n > 0
+    first = np.where(valid, rows[:, None], len(values)).min(axis=0)
+    last = np.where(valid, rows[:, None], -1).max(axis=0)
+    first_date = pnl.index.to_numpy()[np.minimum(first, len(values) - 1)]
+    last_date = pnl.index.to_numpy()[np.maximum(last, 0)]
+
+    # Sharpe of the daily excess returns, ddof=1 like pandas' std
+    rf_daily = (1 + risk_free_rate) ** (1 / TRADING_DAYS) - 1
+    excess = values / capital - rf_daily
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(excess, axis=0) / n
+        std = np.sqrt(np.nansum((excess - mean) ** 2, axis=0) / (n - 1))
+        sharpe = np.where(std > 0, mean / std * np.sqrt(TRADING_DAYS), np.nan)
+
+        total = np.nansum(values, axis=0)
+        total_return = 100 * total / capital
+        n_years = (last_date - first_date) / np.timedelta64(1, "D") / 365.25
+        annualized_return = np.where(n_years > 0, 100 * (total / capital) / n_years, np.nan)
+
+        # Drawdown as a fraction of the running peak of cumulative PnL, only
+        # where that peak is positive
+        peak = np.fmax.accumulate(np.where(np.isnan(cum), -np.inf, cum), axis=0)
+        drawdown = np.where((peak > 0) & ~np.isnan(cum), (peak - cum) / peak, 0.0)
+        max_drawdown = 100 * drawdown.max(axis=0)
+        calmar = np.where(np.abs(max_drawdown) > 1e-6, annualized_return / np.abs(max_drawdown), np.nan)
+
+    table = pd.DataFrame({
+        "Total Return (%)": total_return,
+        "Annualized Sharpe": sharpe,
+        "Annualized Return (%)": annualized_return,
+        "Max Drawdown (%)": max_drawdown,
+        "Calmar Ratio": calmar,
+    }, index=pnl.columns)
+
+    if positions is not None:
+        pos = positions.reindex(index=pnl.index, columns=pnl.columns).to_numpy(dtype=np.float64)
+        previous = np.vstack([np.full((1, pos.shape[1]), np.nan), pos[:-1]])
+        exits = (previous != 0) & ~np.isnan(previous) & (pos == 0)
+        # count_num_trades compares the first day with the last (np.roll), so
+        # a series that ends in a position and starts flat counts one more
+        wrap = has_rows & (pos[last.clip(0), np.arange(pos.shape[1])] != 0) \
+            & (pos[first.clip(max=len(pos) - 1), np.arange(pos.shape[1])] == 0)
+        table["Number of Trades"] = exits.sum(axis=0) + wrap
+
+    # Rolling statistics over each series' own trading days
+    excess_frame = pd.DataFrame(np.where(valid, excess, np.nan), index=pnl.index, columns=pnl.columns)
+    rolling = excess_frame.rolling(window, min_periods=window)
+    rolling_std = rolling.std()
+    # NaN on windows without variance, as the full-period Sharpe
+    rolling_sharpe = (rolling.mean() / rolling_std * np.sqrt(TRADING_DAYS)).where(rolling_std > 0)
+    cum_frame = pd.DataFrame(cum, index=pnl.index, columns=pnl.columns)
+    trailing_peak = cum_frame.rolling(window, min_periods=1).max()
+    rolling_drawdown = (100 * (trailing_peak - cum_frame) / trailing_peak).where(trailing_peak > 0, 0.0)
+    rolling_drawdown = rolling_drawdown.where(valid)
+
+    table["Worst Rolling Sharpe"] = rolling_sharpe.min(axis=0)
+    table["Worst Rolling Drawdown (%)"] = rolling_drawdown.max(axis=0)
+    table["Start"] = pd.DatetimeIndex(first_date).where(has_rows)
+    table["End"] = pd.DatetimeIndex(last_date).where(has_rows)
+
+    rolling = pd.DataFrame({
+        "series": np.repeat(np.asarray(pnl.columns, dtype=object), len(pnl)),
+        "date": np.tile(pnl.index.to_numpy(), len(pnl.columns)),
+        "rolling_sharpe": rolling_sharpe.to_numpy().T.ravel(),
+        "rolling_drawdown": rolling_drawdown.to_numpy().T.ravel(),
+    })
+    rolling = rolling[valid.T.ravel()].reset_index(drop=True)
+    return table, rolling
+
+
+def results_metrics(store_dir: Optional[str] = None,
+                    risk_free_rate: float = 0.06,
+                    window: int = ROLLING_WINDOW) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Metrics of every stored pair ('{year}_{a}_{b}'), every year's
+    portfolio ('{year}') and the chained portfolio ('portfolio'), computed
+    in one metrics_table pass over a single (dates x series) matrix, with the
+    capital the dashboard uses: one pair's capital per pair, five per
+    portfolio.
+    """
+    details = read_pair_results(store_dir=store_dir,
+                                columns=["date", "year", "symbol_a", "symbol_b",
+                                         "daily_pnl", "cumulative_pnl", "position"])
+    details["series"] = (details["year"].astype(str) + "_" + details["symbol_a"].astype(str)
+                         + "_" + details["symbol_b"].astype(str))
+    pair_pnl = details.pivot(index="date", columns="series", values="daily_pnl")
+    pair_cum = details.pivot(index="date", columns="series", values="cumulative_pnl")
+    positions = details.pivot(index="date", columns="series", values="position")
+
+    # Each year's portfolio sums its pairs' PnL on the dates any of them traded
+    series_year = details.drop_duplicates("series").set_index("series")["year"].reindex(pair_pnl.columns)
+    year_pnl = pair_pnl.T.groupby(series_year.to_numpy(), sort=True).sum(min_count=1).T
+    year_pnl.columns = [str(year) for year in year_pnl.columns]
+    year_cum = year_pnl.cumsum().where(year_pnl.notna())
+
+    final = read_final_portfolio(store_dir).set_index("date")
+    portfolio_pnl = final[["yearly_pnl"]].set_axis(["portfolio"], axis=1)
+    portfolio_cum = final[["cumulative_pnl"]].set_axis(["portfolio"], axis=1)
+
+    pnl = pd.concat([pair_pnl, year_pnl, portfolio_pnl], axis=1).sort_index()
+    cumulative = pd.concat([pair_cum, year_cum, portfolio_cum], axis=1)
+    capital = np.r_[np.full(pair_pnl.shape[1], CAPITAL_PER_PAIR),
+                    np.full(year_pnl.shape[1] + 1, PAIRS_PER_YEAR * CAPITAL_PER_PAIR)]
+    table, rolling = metrics_table(pnl, capital, cumulative, positions,
+                                   risk_free_rate=risk_free_rate, window=window)
+
+    # Portfolios count the trades of their pairs
+    trades = table["Number of Trades"].loc[pair_pnl.columns]
+    year_trades = trades.groupby(series_year.to_numpy()).sum()
+    table["Number of Trades"] = pd.concat([
+        trades, year_trades.set_axis([str(year) for year in year_trades.index]),
+        pd.Series({"portfolio": trades.sum()})]).astype("int64")
+
+    table["kind"] = ["pair"] * pair_pnl.shape[1] + ["year"] * year_pnl.shape[1] + ["portfolio"]
+    table["year"] = pd.array(list(series_year) + [int(y) for y in year_pnl.columns] + [None], dtype="Int64")
+    return table.rename_axis("series").reset_index(), rolling
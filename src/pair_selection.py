@@ -1,86 +1,444 @@
+import os
 import pandas as pd
 import numpy as np
-from typing import List, Tuple, Dict
-from statsmodels.tsa.stattools import coint
+from typing import List, Tuple, Dict, Optional
+from src.cache import DiskCache, content_hash
+from src.cointegration import batch_coint, parallel_coint
+from src.johansen import batch_johansen
+from src.instrumentation import stage
+
+PAIR_CACHE_DIR = os.path.join("data", "cache", "find_pairs")
+# Bump when find_pairs changes what it returns, so older cache entries are not reused
+PAIR_CACHE_VERSION = 2
+_pair_cache = None
+
+def pair_cache(path: Optional[str] = None) -> DiskCache:
+    """Process-wide disk cache of find_pairs results"""
+    global _pair_cache
+    if _pair_cache is None or (path is not None and _pair_cache.path != path):
+        _pair_cache = DiskCache(path or PAIR_CACHE_DIR)
+    return _pair_cache
+
+def cached_find_pairs(price_matrix: pd.DataFrame,
+                      min_correlation: float = 0.7,
+                      min_coint_pvalue: float = 0.05,
+                      n_jobs: int = 1,
+                      chunk_size: Optional[int] = None,
+                      block_size: Optional[int] = None,
+                      k_neighbours: Optional[int] = None) -> List[Tuple]:
+    """
+    find_pairs memoized in memory and on disk. The key hashes the price
+    matrix contents (dates, symbols and prices), the thresholds and every
+    argument that can change the result: k_neighbours, and the block size
+    of the correlation filter (whose blocked path is not bit-identical to
+    the pandas one). n_jobs and chunk_size do not affect the result and are
+    not part of the key.
+    """
+    cache = pair_cache()
+    key = content_hash(PAIR_CACHE_VERSION, price_matrix, float(min_correlation), float(min_coint_pvalue),
+                       min(block_size or CORR_BLOCK_SIZE, price_matrix.shape[1]), k_neighbours)
+    pairs = cache.get(key)
+    if pairs is None:
+        pairs = find_pairs(price_matrix, min_correlation, min_coint_pvalue, n_jobs=n_jobs,
+                           chunk_size=chunk_size, block_size=block_size, k_neighbours=k_neighbours)
+        cache.put(key, pairs)
+    return pairs
+
+CANDIDATE_DTYPE = np.dtype([('a', np.int32), ('b', np.int32), ('corr', np.float64)])
+# Above this many symbols the correlation filter runs in blocks of this size
+CORR_BLOCK_SIZE = 512
+
+def correlated_pairs(price_matrix: pd.DataFrame,
+                     min_correlation: float = 0.7,
+                     block_size: Optional[int] = None) -> np.ndarray:
+    """
+    Column pairs (a < b) with absolute correlation >= min_correlation, as a
+    CANDIDATE_DTYPE structured array in row-major upper-triangle order.
+    Up to block_size symbols (default CORR_BLOCK_SIZE) the full pandas
+    correlation matrix is thresholded. Larger universes multiply the
+    standardized prices block_size columns at a time, so memory stays
+    O(T*N + block_size^2) and only qualifying pairs are kept; this path
+    expects a matrix without missing values.
+    """
+    n = price_matrix.shape[1]
+    block_size = block_size or CORR_BLOCK_SIZE
+    if block_size >= n:
+        corr = np.abs(price_matrix.corr().to_numpy())
+        i, j = np.triu_indices(n, k=1)
+        keep = corr[i, j] >= min_correlation
+        candidates = np.empty(int(keep.sum()), dtype=CANDIDATE_DTYPE)
+        candidates['a'], candidates['b'], candidates['corr'] = i[keep], j[keep], corr[i[keep], j[keep]]
+        return candidates
+
+    values = price_matrix.to_numpy(dtype=np.float64)
+    centred = values - values.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = centred / np.sqrt((centred ** 2).sum(axis=0))
+    blocks = []
+    for r0 in range(0, n, block_size):
+        r1 = min(r0 + block_size, n)
+        row_blocks = []
+        for c0 in range(r0, n, block_size):
+            c1 = min(c0 + block_size, n)
+            corr = np.abs(scaled[:, r0:r1].T @ scaled[:, c0:c1])
+            i, j = np.nonzero(corr >= min_correlation)
+            upper = i + r0 < j + c0
+            i, j = i[upper], j[upper]
+            block = np.empty(len(i), dtype=CANDIDATE_DTYPE)
+            block['a'], block['b'], block['corr'] = i + r0, j + c0, corr[i, j]
+            row_blocks.append(block)
+        row_blocks = np.concatenate(row_blocks)
+        blocks.append(row_blocks[np.lexsort((row_blocks['b'], row_blocks['a']))])
+    return np.concatenate(blocks) if blocks else np.empty(0, dtype=CANDIDATE_DTYPE)
+
+def _standardize(price_matrix: pd.DataFrame) -> np.ndarray:
+    """Centred, unit-norm price columns: the dot product of two columns is their correlation"""
+    values = price_matrix.to_numpy(dtype=np.float64)
+    centred = values - values.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return centred / np.sqrt((centred ** 2).sum(axis=0))
+
+def nearest_neighbour_pairs(price_matrix: pd.DataFrame,
+                            k: int = 10,
+                            dims: int = 64,
+                            oversample: int = 4,
+                            block_size: int = CORR_BLOCK_SIZE,
+                            seed: int = 0) -> np.ndarray:
+    """
+    Approximate candidate generation for large universes: the k partners of
+    every symbol with the highest absolute price correlation, as a
+    CANDIDATE_DTYPE array (a < b, row-major order, exact correlations).
+    Standardized price columns are projected onto `dims` random Gaussian
+    directions, which preserves their dot products (correlations) up to
+    O(1/sqrt(dims)) noise; k * oversample neighbours per symbol are
+    shortlisted on the projections and re-ranked on the exact correlation.
+    Cost is O(N^2 * dims) for the shortlist instead of O(N^2 * T), and at
+    most N * k pairs reach the cointegration test.
+    """
+    scaled = np.nan_to_num(_standardize(price_matrix))
+    n_dates, n = scaled.shape
+    if n < 2:
+        return np.empty(0, dtype=CANDIDATE_DTYPE)
+    k = min(k, n - 1)
+    shortlist = min(n - 1, k * oversample)
+    rng = np.random.default_rng(seed)
+    sketch = (rng.standard_normal((dims, n_dates)) / np.sqrt(dims)) @ scaled
+
+    partners = np.empty((n, k), dtype=np.int64)
+    exact = np.empty((n, k))
+    for r0 in range(0, n, block_size):
+        r1 = min(r0 + block_size, n)
+        rows = np.arange(r0, r1)
+        approx = np.abs(sketch[:, r0:r1].T @ sketch)
+        approx[rows - r0, rows] = -np.inf
+        near = np.argpartition(-approx, shortlist - 1, axis=1)[:, :shortlist]
+        corr = np.abs(np.einsum('tik,ti->ik', scaled[:, near], scaled[:, r0:r1]))
+        best = np.argsort(-corr, axis=1, kind='stable')[:, :k]
+        partners[r0:r1] = np.take_along_axis(near, best, axis=1)
+        exact[r0:r1] = np.take_along_axis(corr, best, axis=1)
+
+    a = np.repeat(np.arange(n), k)
+    b = partners.ravel()
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    keys, first = np.unique(a * n + b, return_index=True)
+    candidates = np.empty(len(keys), dtype=CANDIDATE_DTYPE)
+    candidates['a'], candidates['b'], candidates['corr'] = keys // n, keys % n, exact.ravel()[first]
+    return candidates
 
 def find_pairs(price_matrix: pd.DataFrame, 
                      min_correlation: float = 0.7,
-                     min_coint_pvalue: float = 0.05) -> List[Tuple]:
-    """Safe pair finding with proper correlation handling"""
+                     min_coint_pvalue: float = 0.05,
+                     n_jobs: int = 1,
+                     chunk_size: Optional[int] = None,
+                     block_size: Optional[int] = None,
+                     k_neighbours: Optional[int] = None) -> List[Tuple]:
+    """
+    Safe pair finding with proper correlation handling.
+    n_jobs > 1 (or -1 for all cores) tests the candidates in a process pool;
+    the result is identical to the serial run. chunk_size is the number of
+    candidate pairs tested per batch, serially or per pool task (None: the
+    defaults of batch_coint and parallel_coint, 512 and 64).
+    block_size computes the correlation filter in blocks for large universes
+    (see correlated_pairs). k_neighbours restricts the candidates to each
+    symbol's k most correlated partners (see nearest_neighbour_pairs) before
+    the correlation filter, for universes of thousands of symbols.
+    """
     valid_pairs = []
     symbols = price_matrix.columns.tolist()
     
-    # Calculate correlation matrix properly
-    corr_matrix = price_matrix.corr().abs()
-    np.fill_diagonal(corr_matrix.values, 0)  # Zero out diagonal
-    
-    # Get upper triangle pairs with high correlation
-    high_corr_pairs = []
-    for i in range(len(corr_matrix.columns)):
-        for j in range(i+1, len(corr_matrix.columns)):
-            if corr_matrix.iloc[i, j] >= min_correlation:
-                a = corr_matrix.columns[i]
-                b = corr_matrix.columns[j]
-                high_corr_pairs.append((a, b))
+    with stage("correlation") as record:
+        # Upper triangle pairs with high correlation
+        if k_neighbours:
+            candidates = nearest_neighbour_pairs(price_matrix, k_neighbours,
+                                                 block_size=block_size or CORR_BLOCK_SIZE)
+            candidates = candidates[candidates['corr'] >= min_correlation]
+        else:
+            candidates = correlated_pairs(price_matrix, min_correlation, block_size)
+        record["items"] = len(candidates)
+    high_corr_pairs = [(symbols[a], symbols[b]) for a, b in zip(candidates['a'].tolist(), candidates['b'].tolist())]
     
     print(f"Testing {len(high_corr_pairs)} correlated pairs...")
     
-    for a, b in high_corr_pairs:
-        try:
-            # Price validation
-            prices_a = price_matrix[a]
-            prices_b = price_matrix[b]
+    with stage("cointegration") as record:
+        # Engle-Granger test for all candidates in one batch
+        idx_a = candidates['a'].astype(np.int64)
+        idx_b = candidates['b'].astype(np.int64)
+        chunking = {"chunk_size": chunk_size} if chunk_size else {}
+        if n_jobs == 1:
+            scores, pvalues = batch_coint(price_matrix.values, idx_a, idx_b, **chunking)
+        else:
+            scores, pvalues = parallel_coint(price_matrix.values, idx_a, idx_b, n_jobs=n_jobs, **chunking)
+        pvalues = pvalues.tolist()
+
+        for (a, b), score, pvalue in zip(high_corr_pairs, scores, pvalues):
+            try:
+                # Price validation
+                prices_a = price_matrix[a]
+                prices_b = price_matrix[b]
             
-            if prices_a.isnull().any() or prices_b.isnull().any():
-                continue
-                
-            # Cointegration test
-            with np.errstate(all='raise'):
-                try:
-                    score, pvalue, _ = coint(prices_a, prices_b)
-                    if not (np.isfinite(score) and np.isfinite(pvalue)):
-                        continue
-                except:
+                if prices_a.isnull().any() or prices_b.isnull().any():
                     continue
 
-            # Skip if not significant
-            if pvalue >= min_coint_pvalue:
-                continue
+                if not (np.isfinite(score) and np.isfinite(pvalue)):
+                    continue
+
+                # Skip if not significant
+                if pvalue >= min_coint_pvalue:
+                    continue
                 
-            # Hedge ratio
-            beta = np.polyfit(prices_b, prices_a, 1)[0]
-            if not np.isfinite(beta) or abs(beta) < 0.1 or abs(beta) > 10:
-                continue
+                # Hedge ratio
+                beta = np.polyfit(prices_b, prices_a, 1)[0]
+                if not np.isfinite(beta) or abs(beta) < 0.1 or abs(beta) > 10:
+                    continue
                 
-            # Spread properties
-            spread = prices_a - beta * prices_b
-            if spread.std() < 1e-6:
-                continue
+                # Spread properties
+                spread = prices_a - beta * prices_b
+                if spread.std() < 1e-6:
+                    continue
                 
-            # Half-life
-            lag = spread.shift(1).dropna()
-            delta = spread.diff().dropna()
-            if len(delta) < 20:
-                continue
+                # Half-life
+                lag = spread.shift(1).dropna()
+                delta = spread.diff().dropna()
+                if len(delta) < 20:
+                    continue
                 
-            try:
-                beta_hl = np.polyfit(lag, delta, 1)[0]
-                half_life = max(5, min(60, -np.log(2)/beta_hl)) if beta_hl < 0 else np.nan
-                if not np.isfinite(half_life):
+                try:
+                    beta_hl = np.polyfit(lag, delta, 1)[0]
+                    half_life = max(5, min(60, -np.log(2)/beta_hl)) if beta_hl < 0 else np.nan
+                    if not np.isfinite(half_life):
+                        continue
+                except:
                     continue
-            except:
-                continue
                 
-            valid_pairs.append((a, b, {
-                'p_value': pvalue,
-                'beta': beta,
-                'half_life': half_life,
-                'spread_std': spread.std()
-            }))
+                valid_pairs.append((a, b, {
+                    'p_value': pvalue,
+                    'beta': beta,
+                    'half_life': half_life,
+                    'spread_std': spread.std()
+                }))
             
-        except Exception as e:
-            print(f"Error testing {a}-{b}: {str(e)}")
-            continue
+            except Exception as e:
+                print(f"Error testing {a}-{b}: {str(e)}")
+                continue
     
+        record["items"] = len(high_corr_pairs)
+
     valid_pairs.sort(key=lambda x: x[2]['p_value'])
-    return valid_pairs
\ No newline at end of file
+    return valid_pairs
+
+def find_pairs_ssd(price_matrix: pd.DataFrame,
+                   n_pairs: int = 20,
+                   block_size: int = CORR_BLOCK_SIZE) -> List[Tuple]:
+    """
+    Distance-method (Gatev et al.) selection: the n_pairs pairs whose
+    normalized price paths (price / first price) have the smallest sum of
+    squared deviations. SSD for all pairs comes from one matrix product,
+    ||x - y||^2 = ||x||^2 + ||y||^2 - 2 x.y, evaluated in row blocks.
+    Returns (a, b, stats) like find_pairs, sorted by SSD; beta is the ratio
+    of first prices, which makes price_a - beta * price_b proportional to
+    the normalized spread.
+    """
+    values = price_matrix.to_numpy(dtype=np.float64)
+    n = values.shape[1]
+    if n < 2 or len(values) == 0:
+        return []
+    normalized = values / values[0]
+    squares = (normalized ** 2).sum(axis=0)
+
+    best_a, best_b, best_ssd = [], [], []
+    for r0 in range(0, n, block_size):
+        r1 = min(r0 + block_size, n)
+        ssd = squares[r0:r1, None] + squares[None, :] - 2 * (normalized[:, r0:r1].T @ normalized)
+        i, j = np.nonzero(np.arange(r0, r1)[:, None] < np.arange(n)[None, :])
+        ssd = np.maximum(ssd[i, j], 0)
+        if len(ssd) > n_pairs:
+            top = np.argpartition(ssd, n_pairs - 1)[:n_pairs]
+            i, j, ssd = i[top], j[top], ssd[top]
+        best_a.append(i + r0)
+        best_b.append(j)
+        best_ssd.append(ssd)
+    best_a, best_b, best_ssd = np.concatenate(best_a), np.concatenate(best_b), np.concatenate(best_ssd)
+    order = np.lexsort((best_b, best_a, best_ssd))[:n_pairs]
+
+    symbols = price_matrix.columns
+    pairs = []
+    for a, b, ssd in zip(best_a[order], best_b[order], best_ssd[order]):
+        spread = normalized[:, a] - normalized[:, b]
+        pairs.append((symbols[a], symbols[b], {
+            'ssd': float(ssd),
+            'beta': values[0, a] / values[0, b],
+            'spread_std': float(spread.std(ddof=1)),
+        }))
+    return pairs
+
+def correlated_baskets(candidates: np.ndarray, n_symbols: int, size: int = 3) -> np.ndarray:
+    """
+    Baskets of `size` columns (i < j < ...) in which every two legs are a
+    correlated pair of `candidates` (a CANDIDATE_DTYPE array, e.g. from
+    correlated_pairs), as a (baskets x size) array in lexicographic order.
+    Baskets grow one leg at a time from the pairs: a basket is extended by
+    every later symbol correlated with all of its legs.
+    """
+    adjacent = np.zeros((n_symbols, n_symbols), dtype=bool)
+    adjacent[candidates['a'], candidates['b']] = True
+    adjacent |= adjacent.T
+    baskets = np.stack([candidates['a'], candidates['b']], axis=1).astype(np.int64)
+    baskets = baskets[np.lexsort((baskets[:, 1], baskets[:, 0]))]
+    later = np.arange(n_symbols)[None, :] > np.arange(n_symbols)[:, None]
+    for _ in range(size - 2):
+        common = later[baskets[:, -1]] & adjacent[baskets].all(axis=1)
+        rows, extra = np.nonzero(common)
+        baskets = np.column_stack([baskets[rows], extra])
+    return baskets.reshape(-1, size)
+
+def find_baskets(price_matrix: pd.DataFrame,
+                 size: int = 3,
+                 min_correlation: float = 0.7,
+                 k_ar_diff: int = 1,
+                 chunk_size: int = 4096,
+                 candidates: Optional[np.ndarray] = None) -> List[Tuple]:
+    """
+    Johansen basket search: every basket of `size` symbols whose legs are
+    pairwise correlated (the correlation filter of find_pairs; pass its
+    correlated_pairs candidates to reuse them) is tested at once with
+    batch_johansen. Baskets whose trace statistic rejects "no
+    cointegration" at 95% are kept, provided the leading eigenvector gives
+    every other leg a weight within find_pairs' hedge ratio bounds (0.1 to
+    10 in absolute value) and the spread mean-reverts.
+    Returns [(symbols, stats)] sorted by trace statistic over its critical
+    value, best first; stats['weights'] (first leg 1) are the basket's
+    weights: backtest_basket(price_matrix[list(symbols)], stats['weights']).
+    """
+    symbols = price_matrix.columns
+    values = price_matrix.to_numpy(dtype=np.float64)
+    with stage("correlation") as record:
+        if candidates is None:
+            candidates = correlated_pairs(price_matrix, min_correlation)
+        baskets = correlated_baskets(candidates, len(symbols), size)
+        # Legs with missing prices cannot be tested
+        baskets = baskets[~np.isnan(values).any(axis=0)[baskets].any(axis=1)]
+        record["items"] = len(baskets)
+    print(f"Testing {len(baskets)} correlated baskets of {size}...")
+
+    with stage("johansen") as record:
+        result = batch_johansen(values, baskets, k_ar_diff=k_ar_diff, chunk_size=chunk_size)
+        record["items"] = len(baskets)
+    trace_stat = result["trace_stat"][:, 0]
+    crit_95 = result["trace_crit"][0, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = result["eigenvectors"][:, :, 0] / result["eigenvectors"][:, :1, 0]
+    hedges = np.abs(weights[:, 1:])
+    keep = (trace_stat > crit_95) & np.isfinite(weights).all(axis=1) \
+        & (hedges >= 0.1).all(axis=1) & (hedges <= 10).all(axis=1)
+    baskets, weights, index = baskets[keep], weights[keep], np.flatnonzero(keep)
+
+    # Spread properties and half-life of all kept baskets at once
+    spread = np.einsum('tbk,bk->tb', values[:, baskets], weights)
+    lag = spread[:-1] - spread[:-1].mean(axis=0)
+    delta = np.diff(spread, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta_hl = (lag * (delta - delta.mean(axis=0))).sum(axis=0) / (lag ** 2).sum(axis=0)
+        half_life = np.where(beta_hl < 0, np.clip(-np.log(2) / beta_hl, 5, 60), np.nan)
+    spread_std = spread.std(axis=0, ddof=1)
+
+    found = []
+    for k in np.flatnonzero(np.isfinite(half_life) & (spread_std >= 1e-6)):
+        i = index[k]
+        found.append((tuple(symbols[baskets[k]]), {
+            'trace_stat': float(trace_stat[i]),
+            'trace_crit_95': float(crit_95),
+            'max_eig_stat': float(result["max_eig_stat"][i, 0]),
+            'eigenvalue': float(result["eigenvalues"][i, 0]),
+            'weights': weights[k].tolist(),
+            'half_life': float(half_life[k]),
+            'spread_std': float(spread_std[k]),
+        }))
+    found.sort(key=lambda basket: -basket[1]['trace_stat'] / basket[1]['trace_crit_95'])
+    return found
+
+# Pair selectors by name: price_matrix -> [(a, b, stats)] sorted best first
+SELECTORS = {
+    'cointegration': cached_find_pairs,
+    'ssd': find_pairs_ssd,
+}
+
+def select_pairs(price_matrix: pd.DataFrame, selector: str = 'cointegration', **kwargs) -> List[Tuple]:
+    """Run the selector registered under `selector` in SELECTORS"""
+    if selector not in SELECTORS:
+        raise ValueError(f"Unknown pair selector {selector!r}, expected one of {sorted(SELECTORS)}")
+    return SELECTORS[selector](price_matrix, **kwargs)
+
+def candidate_recall(years=range(2015, 2025),
+                     ks=(2, 5, 10, 20),
+                     min_correlation: float = 0.7,
+                     min_coint_pvalue: float = 0.05,
+                     n_pairs: int = 5) -> pd.DataFrame:
+    """
+    Recall of nearest_neighbour_pairs against the exhaustive search on the
+    shipped Nifty 50 years, one row per (year, k):
+    candidate_recall - share of exhaustive correlated pairs retrieved;
+    valid_recall     - share of find_pairs' cointegrated pairs retrieved;
+    top_recall       - share of the n_pairs traded pairs that are unchanged;
+    tested_ratio     - candidates tested relative to the exhaustive search.
+    """
+    import main
+    from src.price_cube import load_price_cube
+
+    cube = load_price_cube(list(years))
+    rows = []
+    for year in years:
+        symbols = [s for s in getattr(main, f"nifty50_{year}") if s in cube.symbols_in(year)]
+        price_matrix = cube.price_matrix(year, symbols)
+        if price_matrix.empty:
+            continue
+        exhaustive = correlated_pairs(price_matrix, min_correlation)
+        valid = [(a, b) for a, b, _ in find_pairs(price_matrix, min_correlation, min_coint_pvalue)]
+        columns = price_matrix.columns
+        all_keys = {(columns[a], columns[b]) for a, b in zip(exhaustive['a'], exhaustive['b'])}
+        for k in ks:
+            approx = nearest_neighbour_pairs(price_matrix, k)
+            approx = approx[approx['corr'] >= min_correlation]
+            keys = {(columns[a], columns[b]) for a, b in zip(approx['a'], approx['b'])}
+            # The Engle-Granger test of a pair does not depend on the other
+            # candidates, so the approximate run keeps find_pairs' order
+            kept = [pair for pair in valid if pair in keys]
+            rows.append({
+                'year': year,
+                'k': k,
+                'symbols': len(columns),
+                'exhaustive_candidates': len(all_keys),
+                'candidates': len(keys),
+                'candidate_recall': len(keys & all_keys) / len(all_keys) if all_keys else np.nan,
+                'valid_recall': len(kept) / len(valid) if valid else np.nan,
+                'top_recall': len(set(kept[:n_pairs]) & set(valid[:n_pairs])) / min(n_pairs, len(valid)) if valid else np.nan,
+                'tested_ratio': len(keys) / len(all_keys) if all_keys else np.nan,
+            })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    report = candidate_recall()
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    print()
+    print(report.groupby('k')[['candidate_recall', 'valid_recall', 'top_recall', 'tested_ratio']]
+          .mean().to_string(float_format=lambda x: f"{x:.3f}"))
@@ -0,0 +1,201 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence
+
+from src.data_loader import load_and_validate_data, clean_price_matrix
+
+CUBE_DIR = os.path.join("data", "cube")
+RAW_PATH = os.path.join("data", "raw", "nifty50_{year}.parquet")
+
+
+def _sources(years: Sequence[int]) -> Dict[str, List[int]]:
+    """mtime and size of every raw yearly file, used to detect a stale cube"""
+    sources = {}
+    for year in years:
+        path = RAW_PATH.format(year=year)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            sources[str(year)] = [stat.st_mtime_ns, stat.st_size]
+    return sources
+
+
+def _staging_dir(path: str) -> str:
+    """Empty private directory next to `path` in which a new cube is written"""
+    staging = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    return staging
+
+
+def _swap_in(staging: str, path: str):
+    """
+    Replace the cube directory `path` by the finished `staging` one with
+    renames: readers see either the old or the new cube, never a mix, and
+    processes that still map the old prices.npy keep reading it (the file
+    is unlinked, not overwritten).
+    """
+    old = f"{path}.old-{os.getpid()}"
+    try:
+        os.rename(path, old)
+    except FileNotFoundError:
+        pass
+    os.rename(staging, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _write_index(path: str, index: dict):
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(index, f)
+
+
+def build_price_cube(years: Sequence[int], path: str = CUBE_DIR):
+    """
+    Write the validated close prices of all `years` (load_and_validate_data)
+    as one dense (dates x symbols) float64 array, prices.npy, with a JSON
+    sidecar, index.json, holding the dates, the symbols, each year's row range
+    and the symbols with data in each year. Missing prices are NaN.
+    """
+    yearly_data = load_and_validate_data(list(years))
+    frames = {year: df.pivot(index='date', columns='symbol', values='close')
+              for year, df in sorted(yearly_data.items())}
+    symbols = sorted(set().union(*(frame.columns for frame in frames.values())))
+
+    # Written to a staging directory and swapped in whole, so processes that
+    # still map an older cube keep reading a consistent one
+    staging = _staging_dir(path)
+    n_rows = sum(len(frame) for frame in frames.values())
+    prices = np.lib.format.open_memmap(os.path.join(staging, "prices.npy"), mode="w+",
+                                       dtype=np.float64, shape=(n_rows, len(symbols)))
+    index = {"dates": [], "symbols": symbols, "years": {}, "year_symbols": {},
+             "sources": _sources(years)}
+    row = 0
+    for year, frame in frames.items():
+        frame = frame.reindex(columns=symbols)
+        prices[row:row + len(frame)] = frame.to_numpy(dtype=np.float64)
+        index["dates"] += [d.strftime("%Y-%m-%d") for d in frame.index]
+        index["years"][str(year)] = [row, row + len(frame)]
+        index["year_symbols"][str(year)] = [s for s in symbols if frame[s].notna().any()]
+        row += len(frame)
+    prices.flush()
+    del prices
+
+    _write_index(staging, index)
+    _swap_in(staging, path)
+    print(f"Price cube: {n_rows} dates x {len(symbols)} symbols written to {path}")
+
+
+class PriceCube:
+    """
+    Read-only, memory-mapped view of a cube written by build_price_cube.
+    Row ranges (a year, a warm-up tail) are numpy views into the mapped
+    file; selecting a symbol subset gathers only those columns.
+    """
+
+    def __init__(self, path: str = CUBE_DIR):
+        self.path = path
+        self.prices = np.load(os.path.join(path, "prices.npy"), mmap_mode="r")
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        self.dates = pd.DatetimeIndex(index["dates"])
+        self.symbols = pd.Index(index["symbols"])
+        self.years = {int(year): slice(*rows) for year, rows in index["years"].items()}
+        self.year_symbols = {int(year): symbols for year, symbols in index["year_symbols"].items()}
+        self.sources = index["sources"]
+
+    def symbols_in(self, year: int) -> List[str]:
+        """Symbols with (validated) prices in `year`"""
+        return self.year_symbols[year]
+
+    def frame(self, year: Optional[int] = None, symbols: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        Raw close matrix of one year (all years if None) for `symbols`, in
+        column order of the cube, keeping only dates on which at least one of
+        them traded - i.e. what pivoting those symbols' rows would give.
+        """
+        rows = self.years[year] if year is not None else slice(None)
+        values = self.prices[rows]
+        columns = self.symbols
+        if symbols is not None:
+            cols = np.unique(self.symbols.get_indexer(symbols))
+            cols = cols[cols >= 0]
+            values, columns = values[:, cols], self.symbols[cols]
+        dates = self.dates[rows]
+        traded = ~np.isnan(values).all(axis=1)
+        if not traded.all():
+            values, dates = values[traded], dates[traded]
+        return pd.DataFrame(values, index=dates.rename('date'), columns=columns.rename('symbol'), copy=False)
+
+    def price_matrix(self, year: int, symbols: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """create_clean_price_matrix of `year` restricted to `symbols`, without the pivot"""
+        price_matrix = self.frame(year, symbols)
+        if price_matrix.notna().any().sum() < 20:
+            return pd.DataFrame()
+        return clean_price_matrix(price_matrix)
+
+    def panel(self, symbols: Sequence[str]) -> pd.DataFrame:
+        """Continuous close matrix across all years, gaps forward-filled up to 5 days"""
+        return self.frame(None, symbols).ffill(limit=5)
+
+
+def append_price_cube(cube: PriceCube, year: int, dates: Sequence, prices: np.ndarray) -> PriceCube:
+    """
+    Append new bars of `year` (the cube's last year or the next one) to the
+    cube: `prices` is (len(dates) x cube symbols), NaN where a symbol did not
+    trade. The array file is rewritten with the extra rows and the sidecar
+    records the raw files' current state, so load_price_cube does not
+    rebuild the whole cube for them.
+    """
+    dates = pd.DatetimeIndex(dates)
+    prices = np.asarray(prices, dtype=np.float64).reshape(len(dates), len(cube.symbols))
+    if len(dates) == 0:
+        return cube
+    if year < max(cube.years) or dates[0] <= cube.dates[-1]:
+        raise ValueError("Only bars after the end of the cube can be appended")
+
+    n_rows = len(cube.dates) + len(dates)
+    staging = _staging_dir(cube.path)
+    extended = np.lib.format.open_memmap(os.path.join(staging, "prices.npy"), mode="w+",
+                                         dtype=np.float64, shape=(n_rows, len(cube.symbols)))
+    extended[:len(cube.dates)] = cube.prices
+    extended[len(cube.dates):] = prices
+    extended.flush()
+    del extended
+
+    start = cube.years[year].start if year in cube.years else len(cube.dates)
+    traded = set(cube.year_symbols.get(year, [])) | set(cube.symbols[~np.isnan(prices).all(axis=0)])
+    _write_index(staging, {
+        "dates": [d.strftime("%Y-%m-%d") for d in cube.dates.append(dates)],
+        "symbols": list(cube.symbols),
+        "years": {**{str(y): [rows.start, rows.stop] for y, rows in cube.years.items()},
+                  str(year): [start, n_rows]},
+        "year_symbols": {**{str(y): symbols for y, symbols in cube.year_symbols.items()},
+                         str(year): [s for s in cube.symbols if s in traded]},
+        "sources": _sources(sorted(set(cube.years) | {year})),
+    })
+    _swap_in(staging, cube.path)
+    return PriceCube(cube.path)
+
+
+def load_price_cube(years: Sequence[int], path: str = CUBE_DIR, rebuild: bool = False) -> PriceCube:
+    """
+    Open the price cube, (re)building it first if it is missing, lacks any
+    of `years`, or any of their raw yearly files changed since it was
+    written. A cube holding more years than asked for is used as is, and a
+    rebuild keeps the years it already had, so callers asking for different
+    years do not keep rebuilding it.
+    """
+    index_path = os.path.join(path, "index.json")
+    if not rebuild and os.path.exists(index_path):
+        cube = PriceCube(path)
+        if all(cube.sources.get(year) == source for year, source in _sources(years).items()):
+            return cube
+        print("Price cube is stale, rebuilding")
+        years = sorted(set(years) | {int(year) for year in cube.sources})
+    build_price_cube(years, path)
+    return PriceCube(path)
+
+if __name__ == "__main__":
+    build_price_cube(list(range(2015, 2025)))
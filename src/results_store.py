@@ -0,0 +1,238 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from typing import List, Optional
+
+STORE_DIR = os.path.join("results", "store")
+
+# Prices and signals are fine in float32; money columns stay float64 so the
+# PnL series are stored exactly as the backtest produced them.
+PAIR_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("pair", pa.dictionary(pa.int32(), pa.string())),
+    ("symbol_a", pa.dictionary(pa.int32(), pa.string())),
+    ("symbol_b", pa.dictionary(pa.int32(), pa.string())),
+    ("price_a", pa.float32()),
+    ("price_b", pa.float32()),
+    ("spread", pa.float32()),
+    ("zscore", pa.float32()),
+    ("position", pa.int8()),
+    ("quantity_a", pa.int32()),
+    ("quantity_b", pa.int32()),
+    ("daily_pnl", pa.float64()),
+    ("cumulative_pnl", pa.float64()),
+    ("bh_pnl_a", pa.float64()),
+    ("bh_pnl_b", pa.float64()),
+])
+
+YEARLY_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("yearly_pnl", pa.float64()),
+    ("cumulative_pnl", pa.float64()),
+])
+
+YEAR_PARTITIONING = ds.partitioning(pa.schema([("year", pa.int16())]), flavor="hive")
+
+
+def _path(name: str, store_dir: Optional[str] = None) -> str:
+    return os.path.join(store_dir or STORE_DIR, name)
+
+
+def store_exists(store_dir: Optional[str] = None) -> bool:
+    return os.path.isdir(_path("pairs", store_dir))
+
+
+def store_version(store_dir: Optional[str] = None) -> tuple:
+    """
+    (name, mtime) of every partition directory and of the final portfolio and
+    metrics files.
+    Rewriting any year replaces the files in its partition, which changes the
+    directory's mtime, so this identifies a results run without reading data.
+    """
+    version = []
+    for name in ("pairs", "yearly"):
+        root = _path(name, store_dir)
+        if os.path.isdir(root):
+            version += sorted((f"{name}/{e.name}", e.stat().st_mtime_ns) for e in os.scandir(root) if e.is_dir())
+    for name in ("final_portfolio.parquet", "metrics.parquet"):
+        path = _path(name, store_dir)
+        if os.path.exists(path):
+            version.append((name, os.stat(path).st_mtime_ns))
+    return tuple(version)
+
+
+def _to_table(df: pd.DataFrame, schema: pa.Schema, year: int) -> pa.Table:
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    for field in schema:
+        if field.name not in df:
+            df[field.name] = None
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    return table.append_column("year", pa.array([year] * len(table), pa.int16()))
+
+
+def _write(table: pa.Table, name: str, store_dir: Optional[str], basename: str, replace: bool):
+    ds.write_dataset(
+        table, _path(name, store_dir), format="parquet",
+        partitioning=YEAR_PARTITIONING,
+        basename_template=basename + "-{i}.parquet",
+        existing_data_behavior="delete_matching" if replace else "overwrite_or_ignore",
+    )
+
+
+def write_pair_results(year: int, pair_frames: List[pd.DataFrame],
+                       store_dir: Optional[str] = None, append_tag: Optional[str] = None):
+    """
+    Write one year's pair details (as produced in main.process_year, with
+    'pair', 'symbol_a' and 'symbol_b' columns) into the year=YYYY partition
+    of the pairs dataset, replacing what was there.
+    append_tag adds a new fragment next to the existing files instead.
+    """
+    df = pd.concat(pair_frames, ignore_index=True)
+    df["position"] = df["position"].astype("int8")
+    df["quantity_a"] = df["quantity_a"].astype("int32")
+    df["quantity_b"] = df["quantity_b"].astype("int32")
+    _write(_to_table(df, PAIR_SCHEMA, year), "pairs", store_dir,
+           append_tag or "part", replace=append_tag is None)
+
+
+def write_yearly_results(year: int, yearly_pnl: pd.DataFrame,
+                         store_dir: Optional[str] = None, append_tag: Optional[str] = None):
+    """Write one year's aggregated portfolio PnL into the yearly dataset"""
+    _write(_to_table(yearly_pnl, YEARLY_SCHEMA, year), "yearly", store_dir,
+           append_tag or "part", replace=append_tag is None)
+
+
+def write_final_portfolio(final_results: pd.DataFrame, store_dir: Optional[str] = None):
+    """Write the chained multi-year portfolio PnL (single small file)"""
+    os.makedirs(store_dir or STORE_DIR, exist_ok=True)
+    df = final_results[["date", "yearly_pnl", "cumulative_pnl", "year"]].copy()
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    df["year"] = df["year"].astype("int16")
+    df.to_parquet(_path("final_portfolio.parquet", store_dir), index=False)
+
+
+def write_metrics(table: pd.DataFrame, rolling: pd.DataFrame, store_dir: Optional[str] = None):
+    """
+    Write the metrics table (one row per pair, year and the portfolio, see
+    src.metrics.results_metrics) and the rolling metrics, sorted by series so
+    that reading one series only touches its row groups.
+    """
+    os.makedirs(store_dir or STORE_DIR, exist_ok=True)
+    table.to_parquet(_path("metrics.parquet", store_dir), index=False)
+    rolling.sort_values(["series", "date"], kind="stable").to_parquet(
+        _path("rolling_metrics.parquet", store_dir), index=False, row_group_size=4096)
+
+
+def metrics_exist(store_dir: Optional[str] = None) -> bool:
+    return os.path.exists(_path("metrics.parquet", store_dir))
+
+
+def read_metrics(store_dir: Optional[str] = None) -> pd.DataFrame:
+    return pq.read_table(_path("metrics.parquet", store_dir)).to_pandas(date_as_object=False)
+
+
+def read_rolling_metrics(series: Optional[str] = None, store_dir: Optional[str] = None) -> pd.DataFrame:
+    """Rolling Sharpe and drawdown of one series (all if None)"""
+    filters = [("series", "==", series)] if series is not None else None
+    return pq.read_table(_path("rolling_metrics.parquet", store_dir), filters=filters).to_pandas(date_as_object=False)
+
+
+def write_book(year: int, pairs: list, state: dict, last_date, params: dict,
+               store_dir: Optional[str] = None):
+    """
+    Persist the live book of `year` - its (a, b, beta) pairs, the streaming
+    engine state after `last_date` and the engine parameters - so the
+    end-of-day update can resume it. One book per year, book/YYYY.npz.
+    """
+    os.makedirs(_path("book", store_dir), exist_ok=True)
+    meta = {
+        "year": int(year),
+        "last_date": pd.Timestamp(last_date).strftime("%Y-%m-%d"),
+        "pairs": [[a, b, float(beta)] for a, b, beta in pairs],
+        "params": params,
+    }
+    path = _path(os.path.join("book", f"{year}.npz"), store_dir)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **state)
+    os.replace(path + ".tmp", path)
+
+
+def read_book(year: Optional[int] = None, store_dir: Optional[str] = None) -> Optional[dict]:
+    """The book of `year` (latest year if None) as written by write_book, or None"""
+    root = _path("book", store_dir)
+    years = sorted(int(f[:-4]) for f in os.listdir(root) if f.endswith(".npz")) if os.path.isdir(root) else []
+    if year is None and years:
+        year = years[-1]
+    if year not in years:
+        return None
+    with np.load(_path(os.path.join("book", f"{year}.npz"), store_dir)) as data:
+        book = json.loads(str(data["meta"]))
+        book["state"] = {name: data[name] for name in data.files if name != "meta"}
+    book["pairs"] = [tuple(pair) for pair in book["pairs"]]
+    book["last_date"] = pd.Timestamp(book["last_date"])
+    return book
+
+
+def _read(name: str, store_dir: Optional[str], filter_expr, columns=None) -> pd.DataFrame:
+    dataset = ds.dataset(_path(name, store_dir), format="parquet", partitioning=YEAR_PARTITIONING)
+    table = dataset.to_table(columns=columns, filter=filter_expr)
+    df = table.to_pandas(date_as_object=False)
+    if "date" in df:
+        df = df.sort_values(["date"], kind="stable").reset_index(drop=True)
+    return df
+
+
+def read_pair_results(year: Optional[int] = None, pair: Optional[str] = None,
+                      columns: Optional[List[str]] = None,
+                      store_dir: Optional[str] = None) -> pd.DataFrame:
+    """Pair details filtered by year and/or pair ('A-B'); filters are pushed down to Parquet"""
+    expr = None
+    if year is not None:
+        expr = ds.field("year") == year
+    if pair is not None:
+        pair_expr = ds.field("pair") == pair
+        expr = pair_expr if expr is None else expr & pair_expr
+    df = _read("pairs", store_dir, expr, columns)
+    if "pair" in df and "date" in df:
+        df = df.sort_values(["pair", "date"], kind="stable").reset_index(drop=True)
+    return df
+
+
+def list_pairs(store_dir: Optional[str] = None) -> pd.DataFrame:
+    """One row per stored (year, pair) with its legs"""
+    df = _read("pairs", store_dir, None, columns=["year", "pair", "symbol_a", "symbol_b"])
+    df = df.astype({"pair": str, "symbol_a": str, "symbol_b": str})
+    return df.drop_duplicates().sort_values(["year", "pair"]).reset_index(drop=True)
+
+
+def read_yearly_results(year: Optional[int] = None, store_dir: Optional[str] = None) -> pd.DataFrame:
+    expr = ds.field("year") == year if year is not None else None
+    return _read("yearly", store_dir, expr)
+
+
+def list_years(store_dir: Optional[str] = None) -> List[int]:
+    df = _read("yearly", store_dir, None, columns=["year"])
+    return sorted(int(y) for y in df["year"].unique())
+
+
+def read_final_portfolio(store_dir: Optional[str] = None) -> pd.DataFrame:
+    return pq.read_table(_path("final_portfolio.parquet", store_dir)).to_pandas(date_as_object=False)
+
+
+def delete_year(year: int, store_dir: Optional[str] = None):
+    """Remove everything stored for one year: its pair and yearly partitions and its book"""
+    for name in ("pairs", "yearly"):
+        shutil.rmtree(_path(os.path.join(name, f"year={year}"), store_dir), ignore_errors=True)
+    book = _path(os.path.join("book", f"{year}.npz"), store_dir)
+    if os.path.exists(book):
+        os.remove(book)
+
+
+def clear_store(store_dir: Optional[str] = None):
+    shutil.rmtree(store_dir or STORE_DIR, ignore_errors=True)
@@ -0,0 +1,252 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from numba import njit
+from typing import Dict, Optional
+
+from src.backtesting import _pnl_kernel
+from src.metrics import TRADING_DAYS, CAPITAL_PER_PAIR
+from src.results_store import read_book, read_pair_results, read_yearly_results
+from src.utils import pool_context
+
+N_SAMPLES = 10_000
+MEAN_BLOCK = 20   # mean block length of the stationary bootstrap, in days
+CHUNK_SIZE = 1_000
+BH_CAPITAL = 500_000  # per leg, as main.buy_and_hold_pnl is called
+
+
+def stationary_bootstrap_indices(n: int, n_samples: int, mean_block: float,
+                                 rng: np.random.Generator) -> np.ndarray:
+    """
+    (n_samples x n) row indices of Politis-Romano stationary bootstrap
+    resamples: blocks start at uniform random rows, have geometric lengths
+    with mean `mean_block` and wrap around the end of the series.
+    """
+    starts = rng.integers(0, n, size=(n_samples, n))
+    new_block = rng.random((n_samples, n)) < 1.0 / mean_block
+    new_block[:, 0] = True
+    # Column at which each position's block began, and the offset into it
+    columns = np.arange(n)
+    block_start = np.maximum.accumulate(np.where(new_block, columns, 0), axis=1)
+    first_row = np.take_along_axis(starts, block_start, axis=1)
+    return (first_row + columns - block_start) % n
+
+
+def sharpe_ratio(pnl: np.ndarray, capital: float, risk_free_rate: float = 0.06) -> np.ndarray:
+    """Annualized Sharpe of daily PnL along the last axis (metrics.metrics_table's definition)"""
+    excess = pnl / capital - ((1 + risk_free_rate) ** (1 / TRADING_DAYS) - 1)
+    std = excess.std(axis=-1, ddof=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(std > 0, excess.mean(axis=-1) / std * np.sqrt(TRADING_DAYS), np.nan)
+
+
+def max_drawdown(pnl: np.ndarray) -> np.ndarray:
+    """Max drawdown (%) of the cumulative PnL along the last axis, relative to positive peaks"""
+    cumulative = np.cumsum(pnl, axis=-1)
+    peak = np.maximum.accumulate(cumulative, axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdown = np.where(peak > 0, (peak - cumulative) / peak, 0.0)
+    return 100 * drawdown.max(axis=-1)
+
+
+def _bootstrap_chunk(pnl, benchmark, capital, risk_free_rate, mean_block, n_samples, seed):
+    """Sharpe, max drawdown and excess over the benchmark of n_samples resamples"""
+    rng = np.random.default_rng(seed)
+    indices = stationary_bootstrap_indices(len(pnl), n_samples, mean_block, rng)
+    samples = pnl[indices]
+    excess = (samples - benchmark[indices]).sum(axis=1) if benchmark is not None else None
+    return sharpe_ratio(samples, capital, risk_free_rate), max_drawdown(samples), excess
+
+
+@njit(cache=True)
+def _random_entry_kernel(price_a, price_b, zscore, beta, exit_z, entry_prob, uniforms,
+                         cost_rate, book_size, stop_loss_pct):
+    """
+    Total PnL of one null strategy per row of `uniforms`: while flat it
+    enters on a random day (probability entry_prob) against the sign of the
+    z-score, and exits by backtest_pair's exit rule on the same z-score path.
+    """
+    n_samples, n = uniforms.shape
+    totals = np.zeros(n_samples)
+    for s in range(n_samples):
+        positions = np.zeros(n)
+        for i in range(1, n):
+            if positions[i-1] == 0:
+                if uniforms[s, i] < entry_prob and zscore[i] == zscore[i]:
+                    positions[i] = 1 if zscore[i] < 0 else -1
+            elif ((positions[i-1] == 1 and zscore[i] > -exit_z) or
+                  (positions[i-1] == -1 and zscore[i] < exit_z)):
+                positions[i] = 0
+            else:
+                positions[i] = positions[i-1]
+        cumulative_pnl = _pnl_kernel(price_a, price_b, positions, beta,
+                                     cost_rate, book_size, stop_loss_pct)[4]
+        totals[s] = cumulative_pnl[-1]
+    return totals
+
+
+def _random_entry_chunk(price_a, price_b, zscore, beta, exit_z, entry_prob,
+                        cost_rate, book_size, stop_loss_pct, n_samples, seed):
+    uniforms = np.random.default_rng(seed).random((n_samples, len(zscore)))
+    return _random_entry_kernel(price_a, price_b, zscore, float(beta), float(exit_z), float(entry_prob),
+                                uniforms, float(cost_rate), float(book_size), float(stop_loss_pct))
+
+
+def _run_chunks(func, args, n_samples: int, seed: int, n_jobs: int, chunk_size: int = CHUNK_SIZE) -> list:
+    """
+    Run func(*args, chunk_samples, chunk_seed) over chunks of n_samples.
+    Every chunk has its own child seed of `seed`, so results do not depend
+    on n_jobs. Workers are started with utils.pool_context.
+    """
+    sizes = [min(chunk_size, n_samples - start) for start in range(0, n_samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if n_jobs == 1 or len(sizes) == 1:
+        return [func(*args, size, child) for size, child in zip(sizes, seeds)]
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(sizes)), mp_context=pool_context()) as pool:
+        futures = [pool.submit(func, *args, size, child) for size, child in zip(sizes, seeds)]
+        return [future.result() for future in futures]
+
+
+def bootstrap_test(pnl: np.ndarray,
+                   capital: float,
+                   benchmark: Optional[np.ndarray] = None,
+                   n_samples: int = N_SAMPLES,
+                   mean_block: float = MEAN_BLOCK,
+                   confidence: float = 0.95,
+                   risk_free_rate: float = 0.06,
+                   seed: int = 0,
+                   n_jobs: int = 1) -> Dict[str, float]:
+    """
+    Stationary block bootstrap of a daily PnL series: confidence intervals
+    for the annualized Sharpe and the max drawdown, the p-value of
+    Sharpe <= 0 and, with a benchmark daily PnL series on the same days
+    (resampled with the same indices), the p-value of not beating it.
+    """
+    pnl = np.nan_to_num(np.asarray(pnl, dtype=np.float64))
+    if benchmark is not None:
+        benchmark = np.nan_to_num(np.asarray(benchmark, dtype=np.float64))
+    chunks = _run_chunks(_bootstrap_chunk, (pnl, benchmark, capital, risk_free_rate, mean_block),
+                         n_samples, seed, n_jobs)
+    sharpe = np.concatenate([chunk[0] for chunk in chunks])
+    drawdown = np.concatenate([chunk[1] for chunk in chunks])
+    tail = (1 - confidence) / 2
+    result = {
+        "sharpe": float(sharpe_ratio(pnl, capital, risk_free_rate)),
+        "sharpe_low": float(np.nanquantile(sharpe, tail)),
+        "sharpe_high": float(np.nanquantile(sharpe, 1 - tail)),
+        "p_sharpe": float((np.sum(sharpe <= 0) + 1) / (n_samples + 1)),
+        "max_drawdown": float(max_drawdown(pnl)),
+        "drawdown_low": float(np.quantile(drawdown, tail)),
+        "drawdown_high": float(np.quantile(drawdown, 1 - tail)),
+    }
+    if benchmark is not None:
+        excess = np.concatenate([chunk[2] for chunk in chunks])
+        result["benchmark_pnl"] = float(benchmark.sum())
+        result["p_vs_benchmark"] = float((np.sum(excess <= 0) + 1) / (n_samples + 1))
+    return result
+
+
+def random_entry_test(price_a: np.ndarray,
+                      price_b: np.ndarray,
+                      zscore: np.ndarray,
+                      positions: np.ndarray,
+                      beta: float,
+                      observed_pnl: float,
+                      exit_z: float = 0.15,
+                      n_samples: int = N_SAMPLES,
+                      cost_rate: float = 0.001,
+                      book_size: float = 1_000_000,
+                      stop_loss_pct: float = 0.10,
+                      seed: int = 0,
+                      n_jobs: int = 1) -> Dict[str, float]:
+    """
+    Monte Carlo test of a pair's entry signal: n_samples null strategies
+    trade the same prices and z-score path, entering at random times (as
+    often as the strategy did) and exiting by the same rule. Returns the
+    null's mean and 95% range of total PnL and the p-value of the observed
+    total PnL.
+    """
+    flat = positions[:-1] == 0
+    entries = np.sum(flat & (positions[1:] != 0))
+    entry_prob = entries / max(flat.sum(), 1)
+    args = tuple(np.ascontiguousarray(x, dtype=np.float64) for x in (price_a, price_b, zscore)) + (
+        beta, exit_z, entry_prob, cost_rate, book_size, stop_loss_pct)
+    totals = np.concatenate(_run_chunks(_random_entry_chunk, args, n_samples, seed, n_jobs))
+    return {
+        "random_entry_mean": float(totals.mean()),
+        "random_entry_low": float(np.quantile(totals, 0.025)),
+        "random_entry_high": float(np.quantile(totals, 0.975)),
+        "p_random_entry": float((np.sum(totals >= observed_pnl) + 1) / (n_samples + 1)),
+    }
+
+
+def buy_and_hold_daily(prices: np.ndarray, capital: float = BH_CAPITAL) -> np.ndarray:
+    """Daily PnL of main.buy_and_hold_pnl's position; sums to its total PnL"""
+    return np.r_[0.0, np.diff(prices)] * (capital / prices[0])
+
+
+def significance_report(year: int,
+                        n_samples: int = N_SAMPLES,
+                        mean_block: float = MEAN_BLOCK,
+                        seed: int = 0,
+                        n_jobs: int = 1,
+                        store_dir: Optional[str] = None,
+                        verbose: bool = False) -> pd.DataFrame:
+    """
+    Bootstrap and random-entry tests of every pair traded in `year` and of
+    the year's portfolio, from the results store. The benchmark of a pair is
+    buy-and-hold of both legs; that of the portfolio, of every pair's legs.
+    verbose prints each pair as it is tested.
+    """
+    details = read_pair_results(year, store_dir=store_dir)
+    book = read_book(year, store_dir)
+    if details.empty or book is None:
+        raise ValueError(f"No stored results for {year}")
+    betas = {f"{a}-{b}": beta for a, b, beta in book["pairs"]}
+    exit_z = book["params"].get("exit_z", 0.15)
+
+    rows = []
+    benchmarks = []
+    for pair, df in details.groupby("pair", observed=True, sort=False):
+        price_a = df["price_a"].to_numpy(dtype=np.float64)
+        price_b = df["price_b"].to_numpy(dtype=np.float64)
+        pnl = df["daily_pnl"].to_numpy()
+        benchmark = buy_and_hold_daily(price_a) + buy_and_hold_daily(price_b)
+        benchmarks.append(pd.Series(benchmark, index=df["date"].to_numpy()))
+        if verbose:
+            print(f"Testing {pair}...")
+        row = {"series": pair, "pnl": pnl.sum()}
+        row.update(bootstrap_test(pnl, CAPITAL_PER_PAIR, benchmark, n_samples, mean_block,
+                                  seed=seed, n_jobs=n_jobs))
+        # Prices and z-scores are stored as float32: close enough for a null
+        row.update(random_entry_test(price_a, price_b, df["zscore"].to_numpy(dtype=np.float64),
+                                     df["position"].to_numpy(), betas[str(pair)], pnl.sum(),
+                                     exit_z, n_samples, seed=seed, n_jobs=n_jobs))
+        rows.append(row)
+
+    yearly = read_yearly_results(year, store_dir)
+    benchmark = pd.concat(benchmarks, axis=1).fillna(0).sum(axis=1).reindex(yearly["date"].to_numpy(), fill_value=0)
+    row = {"series": str(year), "pnl": yearly["yearly_pnl"].sum()}
+    row.update(bootstrap_test(yearly["yearly_pnl"].to_numpy(), len(rows) * CAPITAL_PER_PAIR,
+                              benchmark.to_numpy(), n_samples, mean_block, seed=seed, n_jobs=n_jobs))
+    rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Significance of a year's pair and portfolio PnL")
+    parser.add_argument("year", type=int)
+    parser.add_argument("--samples", type=int, default=N_SAMPLES, help="resamples / null strategies per test")
+    parser.add_argument("--block", type=float, default=MEAN_BLOCK, help="mean bootstrap block length (days)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes (-1 for all cores)")
+    args = parser.parse_args()
+
+    report = significance_report(args.year, args.samples, args.block, args.seed, args.jobs, verbose=True)
+    os.makedirs("results", exist_ok=True)
+    report.to_csv(f"results/significance_{args.year}.csv", index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report.round(4).to_string(index=False))
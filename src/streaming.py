@@ -0,0 +1,325 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from numba import njit
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+RAW_PATH = os.path.join("data", "raw", "nifty50_{year}.parquet")
+
+# Per-pair state carried between ticks (see StreamingEngine.get_state)
+STATE_FIELDS = [
+    "beta", "ring", "head", "count", "mean", "m2", "ticks",
+    "position", "quantity_a", "quantity_b", "prev_a", "prev_b",
+    "cumulative_pnl", "stopped", "num_trades",
+]
+
+
+@njit(cache=True)
+def _tick_kernel(price_a, price_b, beta, ring, head, count, mean, m2, ticks,
+                 position, quantity_a, quantity_b, prev_a, prev_b,
+                 cumulative_pnl, stopped, num_trades,
+                 spread, zscore, pnl,
+                 entry_z, exit_z, cost_rate, book_size, stop_loss_pct, refresh_every):
+    """
+    Advance every pair by one bar, in place. Per pair this is the body of
+    _backtest_kernel's loop plus a sliding-window update of the spread's
+    mean and sum of squared deviations (Welford), so the z-score is that of
+    rolling(window).shift(1) up to rounding.
+    """
+    window = ring.shape[0]
+    for k in range(len(beta)):
+        pa = price_a[k]
+        pb = price_b[k]
+        if np.isnan(pa) or np.isnan(pb):
+            spread[k] = np.nan
+            zscore[k] = np.nan
+            pnl[k] = 0.0
+            continue
+        s = pa - beta[k] * pb
+        spread[k] = s
+
+        if count[k] == window and m2[k] > 0:
+            zscore[k] = (s - mean[k]) / np.sqrt(m2[k] / (window - 1))
+        elif count[k] == window and s != mean[k]:
+            zscore[k] = np.inf if s > mean[k] else -np.inf  # flat window, as x / 0.0
+        else:
+            zscore[k] = np.nan
+        z = zscore[k]
+
+        # Position state machine (calculate_positions); the first bar is flat
+        prev_position = position[k]
+        if ticks[k] > 0 and not stopped[k]:
+            if prev_position == 0:
+                if z < -entry_z:
+                    position[k] = 1
+                elif z > entry_z:
+                    position[k] = -1
+            elif ((prev_position == 1 and z > -exit_z) or
+                  (prev_position == -1 and z < exit_z)):
+                position[k] = 0
+
+        # Mark-to-market on yesterday's quantities, costs on position changes
+        p = 0.0
+        if ticks[k] > 0 and not stopped[k]:
+            p = (quantity_a[k] * prev_a[k] * ((pa - prev_a[k]) / prev_a[k]) +
+                 quantity_b[k] * prev_b[k] * ((pb - prev_b[k]) / prev_b[k]))
+            if position[k] != prev_position:
+                p -= cost_rate * book_size * abs(position[k] - prev_position)
+        pnl[k] = p
+        cumulative_pnl[k] += p
+
+        if not stopped[k]:
+            abs_beta = abs(beta[k])
+            notional_a = book_size / (1 + abs_beta)
+            notional_b = book_size * abs_beta / (1 + abs_beta)
+            quantity_a[k] = np.rint((notional_a / pa) * position[k])
+            quantity_b[k] = np.rint((-np.sign(beta[k]) * notional_b / pb) * position[k])
+            if cumulative_pnl[k] < -stop_loss_pct * book_size:
+                # Stop-loss: flat for the rest of the run
+                position[k] = 0
+                quantity_a[k] = 0
+                quantity_b[k] = 0
+                stopped[k] = True
+        if prev_position != 0 and position[k] == 0:
+            num_trades[k] += 1
+
+        # Slide the spread window
+        if count[k] < window:
+            ring[head[k], k] = s
+            count[k] += 1
+            delta = s - mean[k]
+            mean[k] += delta / count[k]
+            m2[k] += delta * (s - mean[k])
+        else:
+            old = ring[head[k], k]
+            ring[head[k], k] = s
+            new_mean = mean[k] + (s - old) / window
+            m2[k] += (s - old) * (s - new_mean + old - mean[k])
+            mean[k] = new_mean
+        head[k] = (head[k] + 1) % window
+
+        ticks[k] += 1
+        if refresh_every > 0 and ticks[k] % refresh_every == 0 and count[k] == window:
+            # Recompute from the buffer to bound floating-point drift
+            total = 0.0
+            for i in range(window):
+                total += ring[i, k]
+            mean[k] = total / window
+            ssd = 0.0
+            for i in range(window):
+                ssd += (ring[i, k] - mean[k]) ** 2
+            m2[k] = ssd
+
+        prev_a[k] = pa
+        prev_b[k] = pb
+
+
+class StreamingEngine:
+    """
+    Live counterpart of backtest_pair for many pairs at once: each bar
+    updates spread, rolling z-score, position, quantities and PnL of every
+    pair in O(1), keeping only a ring buffer of the last `window` spreads.
+
+    on_bar takes one price per symbol of the engine's universe; NaN means
+    no print, and the last known price is used instead (as the batch
+    backtest forward-fills). Pairs start once both legs have printed.
+    """
+
+    def __init__(self,
+                 symbols: Sequence[str],
+                 pairs: Sequence[Tuple[str, str, float]],
+                 entry_z: float = 1.5,
+                 exit_z: float = 0.15,
+                 window: int = 30,
+                 cost_rate: float = 0.001,
+                 book_size: float = 1_000_000,
+                 stop_loss_pct: float = 0.10,
+                 refresh_every: int = 1000):
+        self.symbols = pd.Index(symbols)
+        self.pairs = [(a, b) for a, b, _ in pairs]
+        self.idx_a = self.symbols.get_indexer([a for a, _, _ in pairs])
+        self.idx_b = self.symbols.get_indexer([b for _, b, _ in pairs])
+        if (self.idx_a < 0).any() or (self.idx_b < 0).any():
+            raise ValueError("Pair legs must be in the engine's symbols")
+        self.entry_z = float(entry_z)
+        self.exit_z = float(exit_z)
+        self.cost_rate = float(cost_rate)
+        self.book_size = float(book_size)
+        self.stop_loss_pct = float(stop_loss_pct)
+        self.refresh_every = int(refresh_every)
+        self.last_price = np.full(len(self.symbols), np.nan)
+
+        n = len(pairs)
+        self.beta = np.array([beta for _, _, beta in pairs], dtype=np.float64)
+        self.ring = np.zeros((window, n))
+        self.head = np.zeros(n, dtype=np.int64)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.position = np.zeros(n)
+        self.quantity_a = np.zeros(n)
+        self.quantity_b = np.zeros(n)
+        self.prev_a = np.full(n, np.nan)
+        self.prev_b = np.full(n, np.nan)
+        self.cumulative_pnl = np.zeros(n)
+        self.stopped = np.zeros(n, dtype=np.bool_)
+        self.num_trades = np.zeros(n, dtype=np.int64)
+        self.spread = np.full(n, np.nan)
+        self.zscore = np.full(n, np.nan)
+        self.pnl = np.zeros(n)
+
+    @property
+    def window(self) -> int:
+        return self.ring.shape[0]
+
+    def on_bar(self, prices: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Advance all pairs by one bar. Returns this bar's per-pair arrays
+        (views of the engine state, overwritten by the next bar).
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        self.last_price = np.where(np.isnan(prices), self.last_price, prices)
+        _tick_kernel(
+            self.last_price[self.idx_a], self.last_price[self.idx_b], self.beta,
+            self.ring, self.head, self.count, self.mean, self.m2, self.ticks,
+            self.position, self.quantity_a, self.quantity_b, self.prev_a, self.prev_b,
+            self.cumulative_pnl, self.stopped, self.num_trades,
+            self.spread, self.zscore, self.pnl,
+            self.entry_z, self.exit_z, self.cost_rate, self.book_size,
+            self.stop_loss_pct, self.refresh_every
+        )
+        return {
+            "price_a": self.prev_a,
+            "price_b": self.prev_b,
+            "spread": self.spread,
+            "zscore": self.zscore,
+            "position": self.position,
+            "quantity_a": self.quantity_a,
+            "quantity_b": self.quantity_b,
+            "daily_pnl": self.pnl,
+            "cumulative_pnl": self.cumulative_pnl,
+        }
+
+    def snapshot(self) -> pd.DataFrame:
+        """Current state, one row per pair"""
+        return pd.DataFrame({
+            "symbol_a": [a for a, _ in self.pairs],
+            "symbol_b": [b for _, b in self.pairs],
+            "beta": self.beta,
+            "price_a": self.prev_a,
+            "price_b": self.prev_b,
+            "spread": self.spread,
+            "zscore": self.zscore,
+            "position": self.position,
+            "quantity_a": self.quantity_a,
+            "quantity_b": self.quantity_b,
+            "daily_pnl": self.pnl,
+            "cumulative_pnl": self.cumulative_pnl,
+            "num_trades": self.num_trades,
+            "stopped": self.stopped,
+        })
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """Copies of the per-pair state needed to resume with set_state"""
+        return {name: getattr(self, name).copy() for name in STATE_FIELDS}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        for name in STATE_FIELDS:
+            setattr(self, name, np.array(state[name], dtype=getattr(self, name).dtype))
+        # Legs' last prices, so NaN prints are filled on the first resumed bar
+        self.last_price[self.idx_a] = np.where(np.isnan(self.prev_a), self.last_price[self.idx_a], self.prev_a)
+        self.last_price[self.idx_b] = np.where(np.isnan(self.prev_b), self.last_price[self.idx_b], self.prev_b)
+
+    def run(self, feed) -> pd.DataFrame:
+        """
+        Consume (date, prices) bars and return every pair's rows, in the
+        layout of backtest_pair's details plus 'symbol_a'/'symbol_b'.
+        """
+        frames = []
+        for date, prices in feed:
+            bar = self.on_bar(prices)
+            frames.append(pd.DataFrame({"date": date, **{k: v.copy() for k, v in bar.items()}}))
+        if not frames:
+            return pd.DataFrame()
+        out = pd.concat(frames, ignore_index=True)
+        n_pairs = len(self.pairs)
+        out.insert(1, "symbol_a", [a for a, _ in self.pairs] * len(frames))
+        out.insert(2, "symbol_b", [b for _, b in self.pairs] * len(frames))
+        out.index = pd.MultiIndex.from_arrays([np.repeat(np.arange(len(frames)), n_pairs),
+                                               np.tile(np.arange(n_pairs), len(frames))],
+                                              names=["bar", "pair"])
+        return out
+
+
+def replay_book(price_matrix: pd.DataFrame,
+                pairs: Sequence[Tuple[str, str, float]],
+                warmup: Optional[pd.DataFrame] = None,
+                **kwargs) -> StreamingEngine:
+    """
+    Engine for `pairs` advanced through the warm-up rows and price_matrix,
+    i.e. the state the batch backtest of main.process_year ends in. Pairs
+    with a leg missing from the warm-up start on price_matrix's first row.
+    """
+    n_warmup = 0
+    if warmup is not None and not warmup.empty:
+        n_warmup = len(warmup)
+        price_matrix = pd.concat([warmup.reindex(columns=price_matrix.columns), price_matrix])
+    engine = StreamingEngine(price_matrix.columns, pairs, **kwargs)
+    values = price_matrix.to_numpy(dtype=np.float64)
+    # A symbol with gaps in the warm-up sits the whole warm-up out, so its
+    # pairs start cold like in stack_pairs
+    values[:n_warmup, np.isnan(values[:n_warmup]).any(axis=0)] = np.nan
+    for prices in values:
+        engine.on_bar(prices)
+    return engine
+
+
+def replay_feed(years: Sequence[int],
+                symbols: Sequence[str],
+                start: Optional[str] = None,
+                path: str = RAW_PATH) -> Iterator[Tuple[pd.Timestamp, np.ndarray]]:
+    """
+    Stand-in for a market-data feed: the daily closes of `symbols` from the
+    raw yearly parquet files, one (date, prices) bar per trading day in
+    date order, prices aligned to `symbols` with NaN for symbols that did
+    not trade. Only the date/symbol/close columns of the requested symbols
+    are read.
+    """
+    symbols = pd.Index(symbols)
+    for year in years:
+        dataset = ds.dataset(path.format(year=year), format="parquet")
+        flt = ds.field("symbol").isin(list(symbols))
+        if start is not None:
+            flt = flt & (ds.field("date") >= pd.Timestamp(start))
+        df = dataset.to_table(columns=["date", "symbol", "close"], filter=flt).to_pandas()
+        df = df.dropna().drop_duplicates(["date", "symbol"])
+        if df.empty:
+            continue
+        bars = df.pivot(index="date", columns="symbol", values="close").reindex(columns=symbols).sort_index()
+        values = bars.to_numpy(dtype=np.float64)
+        for i, date in enumerate(bars.index):
+            yield date, values[i]
+
+
+if __name__ == "__main__":
+    import time
+    import main
+    from src.price_cube import load_price_cube
+    from src.pair_selection import cached_find_pairs
+
+    # Replay 2024 through pairs selected on 2023
+    cube = load_price_cube(list(range(2015, 2025)))
+    symbols = [s for s in main.nifty50_2023 if s in cube.symbols_in(2023)]
+    pairs = [(a, b, stats["beta"]) for a, b, stats in cached_find_pairs(cube.price_matrix(2023, symbols))]
+    engine = StreamingEngine(cube.symbols, pairs)
+    bars = list(replay_feed([2024], cube.symbols))
+    engine.on_bar(bars[0][1])  # first bar includes loading the compiled kernel
+    start = time.perf_counter()
+    for _, prices in bars[1:]:
+        engine.on_bar(prices)
+    elapsed = time.perf_counter() - start
+    print(engine.snapshot().to_string(index=False))
+    print(f"{len(bars) - 1} bars x {len(pairs)} pairs in {elapsed * 1000:.1f} ms "
+          f"({elapsed / (len(bars) - 1) * 1e6:.1f} us per bar)")
@@ -0,0 +1,197 @@
+import itertools
+import math
+import numpy as np
+import pandas as pd
+from numba import njit, prange
+from typing import Dict, List, Sequence
+
+from src.pair_selection import cached_find_pairs
+from src.backtesting import _backtest_kernel, stack_pairs, rolling_zscore
+
+GRID_COLUMNS = ["window", "entry_z", "exit_z", "cost_rate", "stop_loss_pct"]
+
+
+def prepare_sweep(tasks: list, n_pairs: int = 5) -> List[Dict[str, object]]:
+    """
+    Select pairs once per year and stack their prices/spreads.
+    tasks: (year, price_matrix, warmup) tuples as built by main.prepare_tasks.
+    Rolling z-scores are added lazily, once per window, by evaluate_grid.
+    """
+    inputs = []
+    for year, price_matrix, warmup in tasks:
+        if price_matrix.empty:
+            continue
+        pairs = cached_find_pairs(price_matrix)[:n_pairs]
+        if not pairs:
+            continue
+        arrays = stack_pairs(price_matrix, [(a, b, stats['beta']) for a, b, stats in pairs], warmup)
+        arrays["year"] = year
+        arrays["zscore"] = {}
+        inputs.append(arrays)
+    return inputs
+
+
+def parameter_grid(window: Sequence[int] = (30,),
+                   entry_z: Sequence[float] = (1.5,),
+                   exit_z: Sequence[float] = (0.15,),
+                   cost_rate: Sequence[float] = (0.001,),
+                   stop_loss_pct: Sequence[float] = (0.10,)) -> pd.DataFrame:
+    """Cartesian product of strategy parameters, one row per grid point"""
+    return pd.DataFrame(list(itertools.product(window, entry_z, exit_z, cost_rate, stop_loss_pct)),
+                        columns=GRID_COLUMNS)
+
+
+@njit(cache=True, parallel=True)
+def _sweep_kernel(prices_a, prices_b, zscores, betas, starts, n_warmup,
+                  entry_z, exit_z, cost_rate, stop_loss_pct, book_size):
+    """Portfolio daily PnL and trade count of one year for every grid point"""
+    n_days, n_pairs = zscores.shape
+    n_grid = len(entry_z)
+    daily_pnl = np.zeros((n_grid, n_days - n_warmup))
+    num_trades = np.zeros(n_grid, dtype=np.int64)
+    for g in prange(n_grid):
+        for k in range(n_pairs):
+            s = starts[k]
+            positions, _, _, pnl, _, _ = _backtest_kernel(
+                np.ascontiguousarray(prices_a[s:, k]),
+                np.ascontiguousarray(prices_b[s:, k]),
+                np.ascontiguousarray(zscores[s:, k]),
+                betas[k], entry_z[g], exit_z[g], cost_rate[g], book_size, stop_loss_pct[g]
+            )
+            # Only the current period counts (warm-up rows are sliced off)
+            first = n_warmup - s
+            for i in range(first, len(pnl)):
+                daily_pnl[g, s + i - n_warmup] += pnl[i]
+            for i in range(first, len(positions)):
+                prev = positions[i - 1] if i > first else positions[len(positions) - 1]
+                if prev != 0 and positions[i] == 0:
+                    num_trades[g] += 1
+    return daily_pnl, num_trades
+
+
+def _metrics(daily_pnl: np.ndarray, years: float, capital: float, risk_free_rate: float) -> Dict[str, np.ndarray]:
+    """compute_metrics / compute_max_drawdown for every row of a (grid x days) PnL matrix"""
+    daily_return = daily_pnl / capital
+    rf_daily = (1 + risk_free_rate) ** (1 / 252) - 1
+    excess = daily_return - rf_daily
+    std = excess.std(axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, excess.mean(axis=1) / std * np.sqrt(252), np.nan)
+
+    total = daily_pnl.sum(axis=1)
+    total_return = 100 * total / capital
+    annualized_return = total_return / years if years > 0 else np.full(len(total), np.nan)
+
+    cumulative = np.cumsum(daily_pnl, axis=1)
+    peak = np.maximum.accumulate(cumulative, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(peak > 0, (peak - cumulative) / peak, 0.0)
+    max_dd = 100 * drawdown.max(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calmar = np.where(max_dd > 1e-6, annualized_return / max_dd, np.nan)
+
+    return {
+        "total_pnl": total,
+        "total_return_pct": total_return,
+        "annualized_return_pct": annualized_return,
+        "sharpe": sharpe,
+        "max_drawdown_pct": max_dd,
+        "calmar": calmar,
+    }
+
+
+def evaluate_grid(inputs: List[Dict[str, object]],
+                  grid: pd.DataFrame,
+                  book_size: float = 1_000_000,
+                  n_pairs: int = 5,
+                  risk_free_rate: float = 0.06) -> pd.DataFrame:
+    """
+    Evaluate every grid point on the prepared years and return a tidy table
+    (grid columns + metrics of the chained portfolio). Rolling statistics are
+    computed once per (year, window); all (entry, exit, cost, stop-loss)
+    points sharing a window go through the position state machine in one
+    compiled pass.
+    """
+    grid = grid.reset_index(drop=True)
+    capital = n_pairs * book_size
+    daily_pnl = np.zeros((len(grid), sum(len(a["dates"]) - a["n_warmup"] for a in inputs)))
+    num_trades = np.zeros(len(grid), dtype=np.int64)
+
+    for window, rows in grid.groupby("window").groups.items():
+        rows = np.asarray(rows)
+        params = grid.loc[rows]
+        offset = 0
+        for arrays in inputs:
+            if window not in arrays["zscore"]:
+                arrays["zscore"][window] = rolling_zscore(arrays["spread"], arrays["starts"], int(window))
+            pnl, trades = _sweep_kernel(
+                arrays["price_a"], arrays["price_b"], arrays["zscore"][window],
+                arrays["beta"], arrays["starts"], arrays["n_warmup"],
+                params["entry_z"].to_numpy(dtype=np.float64),
+                params["exit_z"].to_numpy(dtype=np.float64),
+                params["cost_rate"].to_numpy(dtype=np.float64),
+                params["stop_loss_pct"].to_numpy(dtype=np.float64),
+                float(book_size)
+            )
+            daily_pnl[rows, offset:offset + pnl.shape[1]] = pnl
+            num_trades[rows] += trades
+            offset += pnl.shape[1]
+
+    if inputs:
+        first = inputs[0]["dates"][inputs[0]["n_warmup"]]
+        years = (inputs[-1]["dates"][-1] - first).days / 365.25
+    else:
+        years = 0.0
+    results = grid.copy()
+    for name, values in _metrics(daily_pnl, years, capital, risk_free_rate).items():
+        results[name] = values
+    results["num_trades"] = num_trades
+    return results
+
+
+def successive_halving(inputs: List[Dict[str, object]],
+                       grid: pd.DataFrame,
+                       eta: int = 3,
+                       metric: str = "sharpe",
+                       min_years: int = 1,
+                       **kwargs) -> pd.DataFrame:
+    """
+    Successive-halving search: score every grid point on the first few
+    years, keep the best 1/eta, and re-score the survivors on eta times as
+    many years until the full history is used.
+    Returns all evaluations with a 'years' column giving each rung's budget;
+    the rows with the largest budget are the final ranking.
+    """
+    n_years = len(inputs)
+    budgets = [n_years]
+    while budgets[0] > min_years and math.ceil(budgets[0] / eta) < budgets[0]:
+        budgets.insert(0, max(min_years, math.ceil(budgets[0] / eta)))
+
+    candidates = grid.reset_index(drop=True)
+    rungs = []
+    for rung, budget in enumerate(budgets):
+        scored = evaluate_grid(inputs[:budget], candidates, **kwargs)
+        scored["years"] = budget
+        scored = scored.sort_values(metric, ascending=False, na_position="last", kind="stable")
+        rungs.append(scored)
+        if rung < len(budgets) - 1:
+            keep = max(1, len(candidates) // eta)
+            candidates = scored[GRID_COLUMNS].head(keep)
+    return pd.concat(rungs, ignore_index=True)
+
+
+if __name__ == "__main__":
+    import main
+    from src.price_cube import load_price_cube
+
+    years = list(range(2015, 2025))
+    tasks = main.prepare_tasks(load_price_cube(years), years)
+    inputs = prepare_sweep(tasks)
+    grid = parameter_grid(window=(20, 30, 45, 60),
+                          entry_z=(1.0, 1.25, 1.5, 1.75, 2.0, 2.5),
+                          exit_z=(0.0, 0.15, 0.3, 0.5),
+                          cost_rate=(0.0005, 0.001),
+                          stop_loss_pct=(0.05, 0.10, 0.20))
+    results = successive_halving(inputs, grid)
+    final = results[results["years"] == results["years"].max()]
+    print(final.head(20).to_string(index=False))
@@ -1,30 +1,27 @@
+import multiprocessing
 import os
+import numpy as np
 import pandas as pd
 
-PAIR_FIELDS = [
-    "date", "price_a", "price_b", "spread", "zscore", "position",
-    "quantity_a", "quantity_b", "daily_pnl", "cumulative_pnl"
-]
-
-def save_pair_results(results, year, a, b):
-    """Save detailed pairwise backtest results to CSV."""
-    df = results.get("details")
-    if df is None:
-        return
-    # Ensure correct columns and order
-    df = df[PAIR_FIELDS]
-    outdir = f"results"
-    os.makedirs(outdir, exist_ok=True)
-    fname = f"{year}_{a}_{b}.csv"
-    df.to_csv(os.path.join(outdir, fname), index=False)
-
-import pandas as pd
-import os
+def pool_context():
+    """
+    Multiprocessing context for the process pools: workers start from a fork
+    server, or are spawned where there is none. Forking a process that
+    already runs numba's parallel threads (TBB) can hang it at exit.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
 
-def aggregate_yearly_results(year_results, year):
+def aggregate_yearly_results(year_results, year, path=None):
     """
     year_results: list of DataFrames, each with 'date' and 'daily_pnl'
-    Returns: DataFrame with 'date', 'yearly_pnl', 'cumulative_pnl'
+    Returns: DataFrame with 'date', 'pnl_1'..'pnl_n' (one per pair),
+    'yearly_pnl', 'cumulative_pnl' and 'year'
+    The union of the pairs' dates is built once and each pair's daily_pnl is
+    scattered into one preallocated (pairs x dates) array, zero where the
+    pair has no PnL, so the cost grows linearly with the number of pairs.
+    path, if given, writes the result once: Parquet for a .parquet path,
+    CSV otherwise.
     """
     # Ensure all results are DataFrames
     dfs = []
@@ -36,37 +33,26 @@ def aggregate_yearly_results(year_results, year):
             df = res
         else:
             raise ValueError("Each result must be a DataFrame or dict with 'date'")
-        dfs.append(df[['date', 'daily_pnl']].rename(columns={'daily_pnl': f"pnl_{len(dfs)+1}"}))
+        dfs.append(df)
+
+    dates = [pd.to_datetime(df['date']).to_numpy() for df in dfs]
+    all_dates = np.unique(np.concatenate(dates))
+    pnl = np.zeros((len(dfs), len(all_dates)))
+    for k, (df, pair_dates) in enumerate(zip(dfs, dates)):
+        pnl[k, np.searchsorted(all_dates, pair_dates)] = df['daily_pnl'].to_numpy(dtype=np.float64)
+    np.nan_to_num(pnl, copy=False, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    # Summed pair by pair in order, as a row sum over the pair columns would
+    yearly_pnl = pnl.sum(axis=0)
 
-    # Merge on date
-    merged = dfs[0]
-    for df in dfs[1:]:
-        merged = pd.merge(merged, df, on='date', how='outer')
-    merged = merged.sort_values('date').fillna(0)
-    merged['yearly_pnl'] = merged.iloc[:, 1:].sum(axis=1)
-    merged['cumulative_pnl'] = merged['yearly_pnl'].cumsum()
+    merged = pd.DataFrame({'date': all_dates, **{f"pnl_{k + 1}": pnl[k] for k in range(len(dfs))}})
+    merged['yearly_pnl'] = yearly_pnl
+    merged['cumulative_pnl'] = yearly_pnl.cumsum()
     merged['year'] = year
 
-    # Save to CSV
-    os.makedirs("results", exist_ok=True)
-    merged.to_csv(f"results/{year}_yearly_pnl.csv", index=False)
+    if path is not None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path.endswith(".parquet"):
+            merged.to_parquet(path, index=False)
+        else:
+            merged.to_csv(path, index=False)
     return merged
-
-def aggregate_final_portfolio(years):
-    """Concatenate yearly pnl for continuous cumulative pnl and save final csv."""
-    all_years = []
-    last_cum = 0
-    for year in years:
-        f = f"results/{year}_yearly_pnl.csv"
-        if not os.path.exists(f):
-            continue
-        df = pd.read_csv(f)
-        df["cumulative_pnl"] = df["yearly_pnl"].cumsum() + last_cum
-        last_cum = df["cumulative_pnl"].iloc[-1]
-        df["year"] = year
-        all_years.append(df)
-    if all_years:
-        final = pd.concat(all_years, ignore_index=True)
-        final.to_csv("results/final_portfolio_pnl.csv", index=False)
-        return final
-    return None
\ No newline at end of file
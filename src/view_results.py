@@ -3,8 +3,32 @@ import pandas as pd
 import plotly.graph_objs as go
 import os
 import numpy as np
+import sys
+
+# Allow `streamlit run src/view_results.py` from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.results_store import (
+    store_exists, store_version, list_pairs, list_years, read_pair_results, read_yearly_results, read_final_portfolio,
+    metrics_exist, read_metrics, read_rolling_metrics
+)
+from src.cache import memoize, cache_stats
+from src.instrumentation import list_run_reports, read_run_report
 
 RESULTS_DIR = "results"
+CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+def results_version(*args, **kwargs):
+    """Identifies the current results run: store partitions' mtimes, or every result CSV's mtime"""
+    if store_exists():
+        return store_version()
+    return tuple(sorted((e.name, e.stat().st_mtime_ns) for e in os.scandir(RESULTS_DIR) if e.name.endswith('.csv')))
+
+def file_version(filename=None, *args, **kwargs):
+    """Path + mtime of a single result CSV (the whole run when reading from the store)"""
+    if store_exists() or filename is None:
+        return results_version()
+    path = os.path.join(RESULTS_DIR, filename)
+    return (path, os.stat(path).st_mtime_ns)
 
 def compute_metrics(df, n_pairs=5, capital_per_pair=1_000_000, risk_free_rate=0.06):
     """Compute portfolio performance metrics from a DataFrame, with risk-free rate."""
@@ -58,7 +82,17 @@ def count_num_trades(position_series):
     # The number of trades is the number of exits (round-trips)
     return int(np.sum(exits))
 
+@memoize("view_results.store_pairs", max_entries=4, version=results_version)
+def _store_pairs():
+    """Map '{year}_{a}_{b}' labels to (year, pair) keys of the results store"""
+    pairs = list_pairs()
+    return {f"{year}_{a}_{b}": (year, pair)
+            for year, pair, a, b in zip(pairs['year'], pairs['pair'], pairs['symbol_a'], pairs['symbol_b'])}
+
+@memoize("view_results.pair_files", max_entries=4, version=results_version)
 def get_pair_files():
+    if store_exists():
+        return sorted(_store_pairs())
     return sorted([f for f in os.listdir(RESULTS_DIR) if f.endswith('.csv') and '_yearly_pnl' not in f and 'final_portfolio_pnl' not in f])
 
 def compute_max_drawdown(series):
@@ -75,24 +109,120 @@ def compute_max_drawdown(series):
     max_dd = np.max(drawdown) if np.any(valid) else 0.0
     return max_dd * 100
 
+@memoize("view_results.yearly_files", max_entries=4, version=results_version)
 def get_yearly_files():
+    if store_exists():
+        return [f"{year}_yearly_pnl" for year in list_years()]
     return sorted([f for f in os.listdir(RESULTS_DIR) if '_yearly_pnl.csv' in f])
 
+@memoize("view_results.pair_df", max_entries=512, max_bytes=CACHE_MAX_BYTES, version=file_version)
 def load_pair_df(filename):
+    if store_exists():
+        year, pair = _store_pairs()[filename]
+        return read_pair_results(year=year, pair=pair)
     df = pd.read_csv(os.path.join(RESULTS_DIR, filename))
     df['date'] = pd.to_datetime(df['date'])
     return df
 
+@memoize("view_results.year_pair_dfs", max_entries=32, max_bytes=CACHE_MAX_BYTES, version=results_version)
+def load_year_pair_dfs(year):
+    """(pair label, DataFrame) for every pair traded in `year`, in label order"""
+    if store_exists():
+        df = read_pair_results(year=int(year))
+        pair_dfs = [(f"{year}_{pair_df['symbol_a'].iloc[0]}_{pair_df['symbol_b'].iloc[0]}", pair_df.reset_index(drop=True))
+                    for _, pair_df in df.groupby('pair', observed=True)]
+        return sorted(pair_dfs, key=lambda item: item[0])
+    return [(f, load_pair_df(f)) for f in get_pair_files() if f.startswith(f"{year}_")]
+
+@memoize("view_results.yearly_df", max_entries=32, max_bytes=CACHE_MAX_BYTES, version=file_version)
 def load_yearly_df(filename):
+    if store_exists():
+        return read_yearly_results(year=int(filename.split('_')[0]))
     df = pd.read_csv(os.path.join(RESULTS_DIR, filename))
     df['date'] = pd.to_datetime(df['date'])
     return df
 
+@memoize("view_results.aggregated_df", max_entries=4, version=lambda: file_version("final_portfolio_pnl.csv"))
 def load_aggregated_df():
+    if store_exists():
+        return read_final_portfolio()
     df = pd.read_csv(os.path.join(RESULTS_DIR, "final_portfolio_pnl.csv"))
     df['date'] = pd.to_datetime(df['date'])
     return df
 
+@memoize("view_results.metrics_table", max_entries=4, version=results_version)
+def load_metrics_table():
+    """Metrics precomputed by main.py (src.metrics), indexed by series, or None"""
+    if store_exists() and metrics_exist():
+        return read_metrics().set_index('series')
+    return None
+
+def lookup_metrics(series):
+    """Precomputed metrics of a pair label, a year or 'portfolio', in compute_metrics' format"""
+    table = load_metrics_table()
+    if table is None or series not in table.index:
+        return None
+    row = table.loc[series]
+    metrics = {key: row[key] for key in
+               ["Total Return (%)", "Annualized Sharpe", "Annualized Return (%)", "Max Drawdown (%)", "Calmar Ratio"]}
+    metrics["Number of Trades"] = int(row["Number of Trades"])
+    metrics["Period"] = f"{row['Start'].strftime('%Y-%m-%d')} to {row['End'].strftime('%Y-%m-%d')}"
+    return metrics
+
+@memoize("view_results.pair_metrics", max_entries=512, version=file_version)
+def pair_metrics(filename):
+    metrics = lookup_metrics(filename)
+    if metrics is not None:
+        return metrics
+    df = load_pair_df(filename)
+    metrics = compute_metrics(df, n_pairs=1)
+    metrics["Number of Trades"] = count_num_trades(df['position'])
+    return metrics
+
+@memoize("view_results.year_portfolio", max_entries=32, max_bytes=CACHE_MAX_BYTES, version=results_version)
+def year_portfolio(year):
+    """Average cumulative PnL curve and metrics of the pairs traded in `year`"""
+    pair_dfs = [pair_df for _, pair_df in load_year_pair_dfs(year)]
+
+    # Align all pair DataFrames by date (outer join), then take the mean row-wise
+    aligned = [df.set_index('date')['cumulative_pnl'] for df in pair_dfs]
+    avg_df = pd.concat(aligned, axis=1)
+    avg_df.columns = [f'pair_{i}' for i in range(len(aligned))]
+    avg_df['avg_cumulative_pnl'] = avg_df.mean(axis=1)
+    avg_df = avg_df.reset_index()
+
+    metrics = lookup_metrics(str(year))
+    if metrics is not None:
+        return avg_df, metrics
+    total_trades = sum(count_num_trades(pair_df['position']) for pair_df in pair_dfs if 'position' in pair_df)
+
+    # Aggregate the 5 pairs for metrics
+    agg_df = pd.concat(pair_dfs)
+    agg_df = agg_df.groupby('date').agg({'daily_pnl': 'sum'}).reset_index()
+    agg_df['cumulative_pnl'] = agg_df['daily_pnl'].cumsum()
+    metrics = compute_metrics(agg_df)
+    metrics["Number of Trades"] = total_trades
+    return avg_df, metrics
+
+@memoize("view_results.aggregated_metrics", max_entries=4, version=results_version)
+def aggregated_metrics():
+    metrics = lookup_metrics('portfolio')
+    if metrics is not None:
+        return metrics
+    # Count total trades across all pairs and years
+    total_trades = 0
+    for yearly_file in get_yearly_files():
+        for _, pair_df in load_year_pair_dfs(yearly_file.split('_')[0]):
+            if 'position' in pair_df:
+                total_trades += count_num_trades(pair_df['position'])
+    metrics = compute_metrics(load_aggregated_df())
+    metrics["Number of Trades"] = total_trades
+    return metrics
+
+@memoize("view_results.run_report", max_entries=16, version=lambda path: (path, os.stat(path).st_mtime_ns))
+def load_run_report(path):
+    return read_run_report(path)
+
 def plot_line_chart(df, y_col, title, name, color, width=3):
     fig = go.Figure()
     fig.add_trace(go.Scatter(
@@ -133,7 +263,7 @@ def main():
     st.sidebar.title("Navigation")
     view = st.sidebar.radio(
     "Navigation",
-    ["Methodology", "Aggregated Portfolio", "Pairwise PnL", "Yearly Portfolio"],
+    ["Methodology", "Aggregated Portfolio", "Pairwise PnL", "Yearly Portfolio", "Run Report"],
     index=1
 )   
     if view == "Methodology":
@@ -222,10 +352,7 @@ def main():
                             annotation_text="Buy & Hold B", annotation_position="bottom left")
 
         st.plotly_chart(fig, use_container_width=True)
-        num_trades = count_num_trades(df['position'])
-        metrics = compute_metrics(df, n_pairs=1)
-        metrics["Number of Trades"] = num_trades
-        display_metrics(metrics)
+        display_metrics(pair_metrics(pair))
         with st.expander("ℹ️ **Metric Definitions**", expanded=False):
             st.markdown("""
 - **Total Return (%):**  
@@ -254,17 +381,9 @@ def main():
         years = [f.split('_')[0] for f in yearly_files]
         year = st.sidebar.selectbox("Select Year", years)
 
-        # Find all pair files for the selected year
-        pair_files = sorted([f for f in os.listdir(RESULTS_DIR)
-                            if f.startswith(year + "_") and f.endswith(".csv") and "yearly_pnl" not in f])
-
         color_palette = ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A']
         fig = go.Figure()
-        pair_dfs = []
-        total_trades = 0
-        for i, pair_file in enumerate(pair_files):
-            pair_df = pd.read_csv(os.path.join(RESULTS_DIR, pair_file))
-            pair_df['date'] = pd.to_datetime(pair_df['date'])
+        for i, (pair_file, pair_df) in enumerate(load_year_pair_dfs(year)):
             pair_name = pair_file.replace(f"{year}_", "").replace(".csv", "")
             fig.add_trace(go.Scatter(
                 x=pair_df['date'],
@@ -275,16 +394,7 @@ def main():
                 opacity=0.4,
                 hovertemplate=f"<b>{pair_name}</b><br>Date: %{{x}}<br>Cum. PnL: %{{y:.2f}}<extra></extra>"
             ))
-            pair_dfs.append(pair_df)
-            if 'position' in pair_df:
-                total_trades += count_num_trades(pair_df['position'])
-
-        # Align all pair DataFrames by date (outer join), then take the mean row-wise
-        aligned = [df.set_index('date')['cumulative_pnl'] for df in pair_dfs]
-        avg_df = pd.concat(aligned, axis=1)
-        avg_df.columns = [f'pair_{i}' for i in range(len(aligned))]
-        avg_df['avg_cumulative_pnl'] = avg_df.mean(axis=1)
-        avg_df = avg_df.reset_index()
+        avg_df, metrics = year_portfolio(year)
 
         # Add average line to the chart (thicker, dashed, more visible)
         fig.add_trace(go.Scatter(
@@ -326,12 +436,6 @@ def main():
         )
         st.plotly_chart(fig, use_container_width=True)
 
-        # Aggregate the 5 pairs for metrics
-        agg_df = pd.concat(pair_dfs)
-        agg_df = agg_df.groupby('date').agg({'daily_pnl': 'sum'}).reset_index()
-        agg_df['cumulative_pnl'] = agg_df['daily_pnl'].cumsum()
-        metrics = compute_metrics(agg_df)
-        metrics["Number of Trades"] = total_trades
         st.markdown("### Performance Metrics")
         col1, col2 = st.columns(2)
         col3, col4 = st.columns(2)
@@ -365,13 +469,6 @@ def main():
 
     elif view == "Aggregated Portfolio":
         df = load_aggregated_df()
-        # Count total trades across all pairs and years
-        total_trades = 0
-        # Optionally, parse all pair files in results for total trades
-        for f in get_pair_files():
-            pair_df = load_pair_df(f)
-            if 'position' in pair_df:
-                total_trades += count_num_trades(pair_df['position'])
         fig = go.Figure()
         fig.add_trace(go.Scatter(
             x=df['date'],
@@ -405,9 +502,16 @@ def main():
             margin=dict(l=40, r=40, t=80, b=40)
         )
         st.plotly_chart(fig, use_container_width=True)
-        metrics = compute_metrics(df)
-        metrics["Number of Trades"] = total_trades
-        display_metrics(metrics)
+        display_metrics(aggregated_metrics())
+        if load_metrics_table() is not None:
+            with st.expander("Rolling Sharpe & Drawdown (63 days)", expanded=False):
+                rolling = read_rolling_metrics('portfolio')
+                st.plotly_chart(plot_line_chart(rolling, 'rolling_sharpe', "Rolling Sharpe", "Rolling Sharpe",
+                                                '#0099C6', width=2).update_layout(yaxis_title="Sharpe"),
+                                use_container_width=True)
+                st.plotly_chart(plot_line_chart(rolling, 'rolling_drawdown', "Drawdown from 63-Day Peak (%)",
+                                                "Drawdown", '#EF553B', width=2).update_layout(yaxis_title="Drawdown (%)"),
+                                use_container_width=True)
         with st.expander("ℹ️ **Metric Definitions**", expanded=False):
             st.markdown("""
 - **Total Return (%):**  
@@ -430,6 +534,36 @@ def main():
 - **Number of Trades:**  
   The number of round-trip trades (entry and exit) executed in the period.
     """)
+    elif view == "Run Report":
+        reports = list_run_reports()
+        if not reports:
+            st.info("No run reports yet - run `python main.py --report` to record one.")
+        else:
+            path = st.sidebar.selectbox("Select Run", reports, format_func=lambda p: os.path.basename(p)[:-5])
+            report, stages = load_run_report(path)
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Wall Time (s)", f"{report['wall_s']:.2f}")
+            rss_peak = pd.to_numeric(stages['rss_peak_mb'], errors='coerce').max()
+            col2.metric("Peak RSS (MB)", f"{rss_peak:.0f}" if pd.notna(rss_peak) else "N/A")
+            col3.metric("Total PnL", f"{report['total_pnl']:,.2f}" if report.get('total_pnl') is not None else "N/A")
+            st.markdown(f"**Mode:** {report['mode']} · **Selector:** {report['selector']} · "
+                        f"**Workers:** {report['workers']} · **Created:** {report['created']}")
+
+            by_year = stages.dropna(subset=['year']).pivot_table(
+                index='year', columns='stage', values='wall_s', aggfunc='sum', sort=False)
+            fig = go.Figure()
+            for stage_name in by_year.columns:
+                fig.add_trace(go.Bar(x=by_year.index.astype(int), y=by_year[stage_name], name=stage_name))
+            fig.update_layout(barmode='stack', title="Wall Time per Year and Stage",
+                              xaxis_title="Year", yaxis_title="Seconds", template="plotly_dark")
+            st.plotly_chart(fig, use_container_width=True)
+
+            st.markdown("### Stage Totals")
+            st.dataframe(pd.DataFrame(report['totals']), hide_index=True, use_container_width=True)
+            with st.expander("All stages", expanded=False):
+                st.dataframe(stages, hide_index=True, use_container_width=True)
+    with st.sidebar.expander("Cache statistics", expanded=False):
+        st.dataframe(cache_stats(), hide_index=True)
     st.markdown(
         "<hr><div style='text-align: center; color: #9A8C98;'></div>",
         unsafe_allow_html=True
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from src.backtesting import backtest_pairs
+from src.cointegration import engle_granger_stats, mackinnon_pvalues
+
+
+class RollingMoments:
+    """
+    Running sums and cross-products of the columns of a price panel over a
+    sliding window of rows. Moving the window only touches the rows that
+    enter or leave it, so correlations and OLS hedge ratios for every pair
+    cost O(N^2) per day moved instead of O(N^2 * lookback).
+
+    Prices are shifted by a per-column reference level to keep the sums well
+    conditioned; refresh_every > 0 rebuilds the sums from scratch after that
+    many updates to bound floating-point drift. Missing prices contribute
+    nothing and are counted, so columns with gaps in the window can be
+    excluded via complete().
+    """
+
+    def __init__(self, values: np.ndarray, refresh_every: int = 24):
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        first_valid = np.argmax(~missing, axis=0)
+        self.shift = values[first_valid, np.arange(values.shape[1])]
+        self.shift[np.isnan(self.shift)] = 0.0
+        self.x = np.where(missing, 0.0, values - self.shift)
+        self.missing = missing.astype(np.int64)
+        self.refresh_every = refresh_every
+        self.start = self.stop = 0
+        self._reset()
+
+    def _reset(self):
+        n_cols = self.x.shape[1]
+        self.n = 0
+        self.sum = np.zeros(n_cols)
+        self.cross = np.zeros((n_cols, n_cols))
+        self.nan_count = np.zeros(n_cols, dtype=np.int64)
+        self.updates = 0
+
+    def _accumulate(self, start: int, stop: int, sign: int):
+        if stop <= start:
+            return
+        block = self.x[start:stop]
+        self.n += sign * (stop - start)
+        self.sum += sign * block.sum(axis=0)
+        self.cross += sign * (block.T @ block)
+        self.nan_count += sign * self.missing[start:stop].sum(axis=0)
+
+    def move_to(self, start: int, stop: int):
+        """Slide the window to rows [start, stop)"""
+        overlap = start < self.stop and stop > self.start and start >= self.start
+        self.updates += 1
+        if not overlap or (self.refresh_every and self.updates > self.refresh_every):
+            self._reset()
+            self._accumulate(start, stop, +1)
+        else:
+            self._accumulate(self.start, start, -1)
+            self._accumulate(self.stop, stop, +1)
+        self.start, self.stop = start, stop
+
+    def complete(self) -> np.ndarray:
+        """Columns without missing prices in the current window"""
+        return self.nan_count == 0
+
+    def mean(self) -> np.ndarray:
+        return self.sum / self.n + self.shift
+
+    def covariance(self) -> np.ndarray:
+        m = self.sum / self.n
+        return (self.cross - self.n * np.outer(m, m)) / (self.n - 1)
+
+    def correlation(self) -> np.ndarray:
+        cov = self.covariance()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(np.diag(cov))
+            return cov / np.outer(std, std)
+
+    def hedge_ratios(self, idx_a: np.ndarray, idx_b: np.ndarray):
+        """OLS slope and intercept of a on b (with constant) for every pair"""
+        cov = self.covariance()
+        mean = self.mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = cov[idx_a, idx_b] / cov[idx_b, idx_b]
+        return beta, mean[idx_a] - beta * mean[idx_b]
+
+
+def select_pairs(moments: RollingMoments,
+                 values: np.ndarray,
+                 eligible: np.ndarray,
+                 min_correlation: float = 0.7,
+                 min_coint_pvalue: float = 0.05) -> pd.DataFrame:
+    """
+    find_pairs on the moments' current window: correlation filter, Engle-
+    Granger test and the same beta/spread/half-life checks, with the
+    correlations and hedge ratios read from the running sums.
+    Returns one row per valid pair, sorted by p-value.
+    """
+    columns = ['idx_a', 'idx_b', 'p_value', 'beta', 'half_life', 'spread_std']
+    cols = np.flatnonzero(eligible & moments.complete())
+    corr = np.abs(moments.correlation()[np.ix_(cols, cols)])
+    i, j = np.triu_indices(len(cols), k=1)
+    keep = corr[i, j] >= min_correlation
+    idx_a, idx_b = cols[i[keep]], cols[j[keep]]
+    if len(idx_a) == 0:
+        return pd.DataFrame(columns=columns)
+
+    window = values[moments.start:moments.stop]
+    beta, alpha = moments.hedge_ratios(idx_a, idx_b)
+    resid = window[:, idx_a] - alpha - beta * window[:, idx_b]
+    stats = engle_granger_stats(resid, corr[i[keep], j[keep]] ** 2)
+    pvalues = mackinnon_pvalues(stats, regression="c", N=2)
+
+    # Hedge ratio, spread and half-life checks as in find_pairs
+    spread = window[:, idx_a] - beta * window[:, idx_b]
+    spread_std = spread.std(axis=0, ddof=1)
+    lag = spread[:-1] - spread[:-1].mean(axis=0)
+    delta = np.diff(spread, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta_hl = np.sum(lag * (delta - delta.mean(axis=0)), axis=0) / np.sum(lag ** 2, axis=0)
+        half_life = np.clip(-np.log(2) / beta_hl, 5, 60)
+    valid = (np.isfinite(stats) & np.isfinite(pvalues) & (pvalues < min_coint_pvalue)
+             & np.isfinite(beta) & (np.abs(beta) >= 0.1) & (np.abs(beta) <= 10)
+             & (spread_std >= 1e-6) & (beta_hl < 0) & (len(delta) >= 20))
+
+    selected = pd.DataFrame({
+        'idx_a': idx_a, 'idx_b': idx_b, 'p_value': pvalues, 'beta': beta,
+        'half_life': half_life, 'spread_std': spread_std
+    })[valid]
+    return selected.sort_values('p_value', kind='stable').reset_index(drop=True)
+
+
+def walk_forward(panel: pd.DataFrame,
+                 universes: Dict[int, List[str]],
+                 lookback: int = 250,
+                 n_pairs: int = 5,
+                 min_correlation: float = 0.7,
+                 min_coint_pvalue: float = 0.05,
+                 entry_z: float = 1.5,
+                 exit_z: float = 0.15,
+                 window: int = 30,
+                 start: Optional[str] = None,
+                 **backtest_kwargs) -> Dict[str, pd.DataFrame]:
+    """
+    Monthly walk-forward: at the first trading day of each month select
+    pairs on the trailing `lookback` days, then trade them until the month
+    ends (positions start flat each month, z-scores warmed up on the
+    preceding `window` days). The index universe is that of the month's year.
+    Pairs whose legs have gaps during the month are not traded.
+
+    Returns {'daily': date, period_pnl, cumulative_pnl;
+             'selections': one row per selected pair and period}.
+    """
+    dates = panel.index
+    values = panel.to_numpy(dtype=np.float64)
+    symbols = panel.columns
+    months = pd.Series(np.arange(len(dates)), index=dates).groupby(dates.to_period('M')).first()
+    starts = [s for s in months.to_numpy() if s >= lookback]
+    if start is not None:
+        starts = [s for s in starts if dates[s] >= pd.Timestamp(start)]
+    boundaries = starts + [len(dates)]
+
+    moments = RollingMoments(values)
+    daily = []
+    selections = []
+    for period_start, period_stop in zip(boundaries[:-1], boundaries[1:]):
+        year = dates[period_start].year
+        if year not in universes:
+            continue
+        moments.move_to(period_start - lookback, period_start)
+        eligible = symbols.isin(universes[year])
+        trade = values[period_start:period_stop]
+        eligible &= ~np.isnan(trade).any(axis=0)
+        selected = select_pairs(moments, values, eligible, min_correlation, min_coint_pvalue).head(n_pairs)
+
+        period_dates = dates[period_start:period_stop]
+        period_pnl = np.zeros(len(period_dates))
+        if not selected.empty:
+            pairs = [(symbols[a], symbols[b], beta) for a, b, beta in
+                     zip(selected['idx_a'], selected['idx_b'], selected['beta'])]
+            results = backtest_pairs(panel.iloc[period_start:period_stop], pairs,
+                                     entry_z=entry_z, exit_z=exit_z, window=window,
+                                     warmup=panel.iloc[max(0, period_start - window):period_start],
+                                     **backtest_kwargs)
+            period_pnl = results['daily_pnl'].sum(axis=1)
+            selections.append(pd.DataFrame({
+                'period_start': period_dates[0],
+                'symbol_a': results['symbol_a'],
+                'symbol_b': results['symbol_b'],
+                'beta': selected['beta'].to_numpy(),
+                'p_value': selected['p_value'].to_numpy(),
+                'half_life': selected['half_life'].to_numpy(),
+                'num_trades': results['num_trades'],
+                'period_pnl': results['daily_pnl'].sum(axis=0),
+            }))
+        daily.append(pd.DataFrame({'date': period_dates, 'period_pnl': period_pnl}))
+
+    daily = pd.concat(daily, ignore_index=True) if daily else pd.DataFrame(columns=['date', 'period_pnl'])
+    daily['cumulative_pnl'] = daily['period_pnl'].cumsum()
+    selections = pd.concat(selections, ignore_index=True) if selections else pd.DataFrame()
+    return {'daily': daily, 'selections': selections}
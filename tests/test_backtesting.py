@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.backtesting import backtest_basket, backtest_pair, backtest_pairs, stack_pairs
+
+
+@pytest.fixture(scope="module")
+def prices():
+    rng = np.random.default_rng(7)
+    n_days = 250
+    price_b = 800 * np.exp(np.cumsum(rng.normal(0, 0.012, n_days)))
+    deviation = np.zeros(n_days)
+    for t in range(1, n_days):
+        deviation[t] = 0.85 * deviation[t - 1] + rng.normal(0, 12)
+    price_a = 100 + 1.3 * price_b + deviation
+    dates = pd.bdate_range("2023-01-02", periods=n_days)
+    return pd.DataFrame({"A": price_a, "B": price_b}, index=dates)
+
+
+@pytest.mark.parametrize("hedge", ["kalman", "rolling"])
+def test_dynamic_hedge_charges_rebalancing(prices, hedge):
+    cost_rate, book_size = 0.001, 1_000_000
+    details = backtest_pair(prices["A"], prices["B"], 1.3, cost_rate=cost_rate, book_size=book_size,
+                            stop_loss_pct=1.0, hedge=hedge)["details"]
+    free = backtest_pair(prices["A"], prices["B"], 1.3, cost_rate=0.0, book_size=book_size,
+                         stop_loss_pct=1.0, hedge=hedge)["details"]
+    position = details["position"].to_numpy()
+    held = np.r_[False, (position[1:] == position[:-1]) & (position[1:] != 0)]
+    traded = np.abs(details[["quantity_a", "quantity_b"]].diff().fillna(0).to_numpy()) * details[["price_a", "price_b"]].to_numpy()
+    switches = np.abs(np.diff(position, prepend=position[0]))
+
+    expected = cost_rate * (traded.sum(axis=1) * held + book_size * switches)
+    np.testing.assert_allclose(free["daily_pnl"] - details["daily_pnl"], expected, atol=1e-6)
+    assert (expected[held] > 0).any()
+
+
+@pytest.mark.parametrize("hedge", ["static", "kalman", "rolling"])
+def test_backtest_pairs_matches_backtest_pair(prices, hedge):
+    single = backtest_pair(prices["A"], prices["B"], 1.3, hedge=hedge)
+    batch = backtest_pairs(prices, [("A", "B", 1.3)], hedge=hedge)
+    np.testing.assert_array_equal(batch["cumulative_pnl"][:, 0], single["details"]["cumulative_pnl"])
+    assert batch["num_trades"][0] == single["num_trades"]
+
+
+def test_two_leg_basket_trades_like_a_pair(prices):
+    pair = backtest_pair(prices["A"], prices["B"], 1.3)
+    basket = backtest_basket(prices[["A", "B"]], [1.0, -1.3])
+    np.testing.assert_array_equal(basket["details"]["cumulative_pnl"], pair["details"]["cumulative_pnl"])
+    np.testing.assert_array_equal(basket["details"]["quantity_B"], pair["details"]["quantity_b"])
+    assert basket["num_trades"] == pair["num_trades"]
+
+
+def test_stack_pairs_rejects_unknown_symbols(prices):
+    with pytest.raises(KeyError, match=r"\['C', 'D'\]"):
+        stack_pairs(prices, [("A", "B", 1.3), ("C", "B", 1.0), ("A", "D", 1.0)])
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.cache import DiskCache, LRUCache, memoize
+
+
+def test_lru_evicts_least_recently_used_first():
+    cache = LRUCache(max_entries=3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") == "A"  # "b" is now the oldest
+    cache.put("d", "D")
+    assert "b" not in cache
+    cache.put("e", "E")
+    assert "c" not in cache
+    assert [key for key in "ade" if key in cache] == ["a", "d", "e"]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_lru_size_bound():
+    cache = LRUCache(max_entries=100, max_bytes=3 * 8000)
+    for key in range(5):
+        cache.put(key, np.zeros(1000))
+    assert len(cache) == 3 and cache.nbytes == 3 * 8000
+    assert [key in cache for key in range(5)] == [False, False, True, True, True]
+    # An entry larger than the bound alone is still kept, as the only one
+    cache.put("big", np.zeros(10_000))
+    assert len(cache) == 1 and cache.nbytes == 80_000
+    cache.pop("big")
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_memoize_version_invalidates():
+    calls, version = [], [1]
+
+    @memoize("test_cache.square", max_entries=8, version=lambda x: version[0])
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    assert square(3) == 9 and square(3) == 9
+    assert calls == [3]
+    version[0] = 2
+    assert square(3) == 9
+    assert calls == [3, 3]
+    assert square.cache.stats()["hits"] == 1
+
+
+def test_disk_cache_round_trip_and_invalidate(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put("a", [1, 2])
+    cache.put("b", {"x": 1})
+    # A new process sees the entries on disk
+    assert DiskCache(str(tmp_path)).get("a") == [1, 2]
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert DiskCache(str(tmp_path)).get("a") is None
+    assert cache.get("b") == {"x": 1}
+    cache.invalidate()
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_cache_evicts_least_recently_used_files(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10_000_000)
+    for i, key in enumerate("abc"):
+        cache.put(key, np.zeros(50_000))  # about 400 kB per file
+        os.utime(tmp_path / f"{key}.pkl", ns=(i * 10 ** 9, i * 10 ** 9))
+    DiskCache(str(tmp_path)).get("a")  # a hit refreshes the mtime, so "b" is now the oldest
+    cache.max_bytes = 1_000_000
+    cache.put("d", np.zeros(50_000))
+    assert sorted(os.listdir(tmp_path)) == ["a.pkl", "d.pkl"]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_disk_cache_recovers_from_partial_writes(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put("a", "kept")
+    # A writer that died mid-way leaves a temporary file, or (not through
+    # put) a truncated entry: neither is ever served
+    (tmp_path / "leftover.tmp").write_bytes(b"\x80\x05")
+    (tmp_path / "b.pkl").write_bytes(b"\x80\x05\x95")
+    assert DiskCache(str(tmp_path)).get("b", "missing") == "missing"
+    # A value that fails to pickle leaves no file behind and the old entry intact
+    with pytest.raises(Exception):
+        cache.put("a", lambda: None)
+    assert sorted(os.listdir(tmp_path)) == ["a.pkl", "b.pkl", "leftover.tmp"]
+    assert DiskCache(str(tmp_path)).get("a") == "kept"
+    cache.invalidate()
+    assert os.listdir(tmp_path) == []
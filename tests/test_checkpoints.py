@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+import pytest
+
+import main
+from benchmarks.synthetic import synthetic_universe
+from src.checkpoints import read_manifest, record_stage, stage_valid
+from src.results_store import STORE_DIR, read_yearly_results
+
+WINDOW = 20
+
+
+def test_record_stage_drops_later_stages(tmp_path):
+    store = str(tmp_path)
+    os.makedirs(tmp_path / "out")
+    for stage in ["select", "backtest", "aggregate"]:
+        manifest = record_stage(2024, stage, f"{stage}-key", "out", store_dir=store)
+    assert list(manifest) == ["select", "backtest", "aggregate"]
+    manifest = record_stage(2024, "backtest", "new-key", "out", status="partial", store_dir=store)
+    assert list(read_manifest(2024, store)) == ["select", "backtest"]
+    assert stage_valid(manifest, "select", "select-key", store)
+    assert not stage_valid(manifest, "select", "other-key", store)
+    assert not stage_valid(manifest, "backtest", "new-key", store)  # partial
+    assert not stage_valid(manifest, "aggregate", "aggregate-key", store)
+    os.rmdir(tmp_path / "out")
+    assert not stage_valid(manifest, "select", "select-key", store)  # output gone
+
+
+@pytest.fixture
+def year(tmp_path, monkeypatch):
+    """A synthetic year's price matrix, in an empty working directory"""
+    monkeypatch.chdir(tmp_path)
+    df, _ = synthetic_universe(n_symbols=20, start="2024-01-01", seed=3)
+    return df.pivot(index="date", columns="symbol", values="close")
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("should not run")
+
+
+def test_process_year_resumes_from_its_checkpoints(year, monkeypatch):
+    first = main.process_year(2024, year, None, WINDOW)
+    assert list(read_manifest(2024)) == ["select", "backtest", "aggregate", "book"]
+    monkeypatch.setattr(main, "select_pairs", fail)
+    monkeypatch.setattr(main, "backtest_pair", fail)
+    monkeypatch.setattr(main, "replay_book", fail)
+    resumed = main.process_year(2024, year, None, WINDOW)
+    pd.testing.assert_frame_equal(resumed, first[resumed.columns], check_dtype=False)
+    # New prices invalidate the selection, and so every stage after it
+    assert main.process_year(2024, year * 1.01, None, WINDOW) is None
+
+
+def test_forced_rerun_that_fails_discards_the_year(year, monkeypatch):
+    main.process_year(2024, year, None, WINDOW)
+    manifest = read_manifest(2024)
+    aggregate = main.aggregate_yearly_results
+    monkeypatch.setattr(main, "aggregate_yearly_results", fail)
+    assert main.process_year(2024, year, None, WINDOW, force=True) is None
+    # Selection was redone and kept; nothing written by the earlier run is left
+    assert list(read_manifest(2024)) == ["select"]
+    assert read_manifest(2024)["select"]["completed"] >= manifest["select"]["completed"]
+    for name in ["pairs", "yearly"]:
+        assert not os.path.exists(os.path.join(STORE_DIR, name, "year=2024"))
+    assert not os.path.exists(os.path.join(STORE_DIR, "book", "2024.npz"))
+
+    monkeypatch.setattr(main, "aggregate_yearly_results", aggregate)
+    yearly = main.process_year(2024, year, None, WINDOW)
+    stored = read_yearly_results(2024)
+    pd.testing.assert_frame_equal(stored, yearly[stored.columns], check_dtype=False)
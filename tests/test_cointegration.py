@@ -0,0 +1,82 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+from statsmodels.tsa.stattools import coint
+
+from benchmarks.synthetic import synthetic_universe, price_matrix
+from src.cointegration import batch_coint, parallel_coint, mackinnon_pvalues
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reference(values, idx_a, idx_b):
+    """statsmodels' coint (stat, p-value) for every pair"""
+    ref = np.empty((len(idx_a), 2))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for n, (i, j) in enumerate(zip(idx_a, idx_b)):
+            ref[n] = coint(values[:, i], values[:, j])[:2]
+    return ref
+
+
+def all_pairs(n_symbols, limit=None):
+    idx_a, idx_b = np.triu_indices(n_symbols, k=1)
+    return idx_a[:limit], idx_b[:limit]
+
+
+@pytest.fixture(scope="module")
+def synthetic_values():
+    df, _ = synthetic_universe(n_symbols=20, n_years=1, pair_share=0.5, seed=3)
+    return price_matrix(df).to_numpy()
+
+
+def test_batch_coint_matches_statsmodels_on_synthetic_pairs(synthetic_values):
+    idx_a, idx_b = all_pairs(synthetic_values.shape[1])
+    stats, pvalues = batch_coint(synthetic_values, idx_a, idx_b, chunk_size=37)
+    ref = reference(synthetic_values, idx_a, idx_b)
+    np.testing.assert_allclose(stats, ref[:, 0], rtol=1e-8, atol=1e-8)
+    np.testing.assert_allclose(pvalues, ref[:, 1], rtol=0, atol=1e-8)
+
+
+def test_batch_coint_matches_statsmodels_on_shipped_pairs(monkeypatch):
+    if not os.path.exists(os.path.join(ROOT, "data", "raw", "nifty50_2023.parquet")):
+        pytest.skip("shipped price data not available")
+    monkeypatch.chdir(ROOT)
+    import main
+    from src.data_loader import load_and_validate_data, create_clean_price_matrix
+
+    df = load_and_validate_data([2023])[2023]
+    df = df[df["symbol"].isin(main.nifty50_2023)]
+    values = create_clean_price_matrix(df).to_numpy()
+    idx_a, idx_b = all_pairs(values.shape[1], limit=150)
+    stats, pvalues = batch_coint(values, idx_a, idx_b)
+    ref = reference(values, idx_a, idx_b)
+    np.testing.assert_allclose(stats, ref[:, 0], rtol=1e-8, atol=1e-8)
+    np.testing.assert_allclose(pvalues, ref[:, 1], rtol=0, atol=1e-8)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_parallel_coint_is_identical_to_batch_coint(synthetic_values, n_jobs):
+    idx_a, idx_b = all_pairs(synthetic_values.shape[1])
+    expected = batch_coint(synthetic_values, idx_a, idx_b)
+    result = parallel_coint(synthetic_values, idx_a, idx_b, n_jobs=n_jobs, chunk_size=50)
+    np.testing.assert_array_equal(result[0], expected[0])
+    np.testing.assert_array_equal(result[1], expected[1])
+
+
+def test_mackinnon_pvalues_without_private_tables(monkeypatch):
+    import sys
+    import types
+    import statsmodels.tsa.adfvalues as adfvalues
+
+    stats = np.array([-6.0, -3.4, -2.0, 1.5, np.nan])
+    expected = mackinnon_pvalues(stats)
+    # A statsmodels release that only exposes the public mackinnonp
+    public = types.ModuleType(adfvalues.__name__)
+    public.mackinnonp = adfvalues.mackinnonp
+    monkeypatch.setitem(sys.modules, adfvalues.__name__, public)
+    fallback = mackinnon_pvalues(stats)
+    np.testing.assert_allclose(fallback, expected, rtol=1e-12, equal_nan=True)
+    assert np.isnan(fallback[-1])
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from src.hedge_ratio import kalman_hedge, rolling_hedge
+
+
+def random_pair(n_days=300, seed=0):
+    rng = np.random.default_rng(seed)
+    price_b = 500 * np.exp(np.cumsum(rng.normal(0, 0.015, n_days)))
+    price_a = 40 + 1.7 * price_b + np.cumsum(rng.normal(0, 4, n_days))
+    return price_a, price_b
+
+
+def test_rolling_hedge_matches_polyfit():
+    price_a, price_b = random_pair()
+    window = 60
+    hedged = rolling_hedge(price_a, price_b, beta=1.0, window=window)
+    for t in range(window - 1, len(price_a)):
+        days = slice(t - window + 1, t + 1)
+        slope, intercept = np.polyfit(price_b[days], price_a[days], 1)
+        assert abs(hedged["beta"][t] - slope) < 1e-9
+        assert abs(hedged["alpha"][t] - intercept) < 1e-6
+    # The static beta stands in until the first full window
+    assert (hedged["beta"][:window - 1] == 1.0).all()
+
+
+def test_rolling_hedge_out_of_sample_zscore():
+    price_a, price_b = random_pair(seed=1)
+    window = 40
+    hedged = rolling_hedge(price_a, price_b, window=window)
+    for t in (window, 120, len(price_a) - 1):
+        days = slice(t - window, t)
+        slope, intercept = np.polyfit(price_b[days], price_a[days], 1)
+        resid = price_a[days] - (intercept + slope * price_b[days])
+        expected = (price_a[t] - intercept - slope * price_b[t]) / np.sqrt(resid @ resid / (window - 2))
+        assert abs(hedged["zscore"][t] - expected) < 1e-8
+
+
+def test_rolling_hedge_many_pairs_match_one_pair():
+    pairs = [random_pair(seed=seed) for seed in range(4)]
+    price_a = np.column_stack([a for a, _ in pairs])
+    price_b = np.column_stack([b for _, b in pairs])
+    starts = np.array([0, 10, 0, 25])
+    together = rolling_hedge(price_a, price_b, beta=np.ones(4), starts=starts)
+    for k, (a, b) in enumerate(pairs):
+        alone = rolling_hedge(a[starts[k]:], b[starts[k]:], beta=1.0)
+        np.testing.assert_allclose(together["beta"][starts[k]:, k], alone["beta"], rtol=1e-12)
+        assert np.isnan(together["beta"][:starts[k], k]).all()
+
+
+def reference_kalman(y, x, beta, delta, obs_var, adapt):
+    """The filter of kalman_hedge written out with 2x2 matrices, one day at a time"""
+    n = len(y)
+    alpha_out, beta_out, zscore = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+    first = np.flatnonzero(~(np.isnan(y) | np.isnan(x)))[0]
+    y0, x0 = y[first], x[first]
+    theta = np.array([1 - beta * x0 / y0, beta * x0 / y0])
+    cov = np.zeros((2, 2))
+    state_noise = delta / (1 - delta) * np.eye(2)
+    noise = obs_var
+    for t in range(n):
+        if t < first:
+            alpha_out[t], beta_out[t] = y0 - beta * x0, beta
+            continue
+        if not (np.isnan(y[t]) or np.isnan(x[t])):
+            h = np.array([1.0, x[t] / x0])
+            predicted = cov + state_noise
+            error = y[t] / y0 - h @ theta
+            variance = h @ predicted @ h + noise
+            zscore[t] = error / np.sqrt(variance)
+            gain = predicted @ h / variance
+            theta = theta + gain * error
+            cov = predicted - np.outer(gain, h @ predicted)
+            noise += adapt * (error ** 2 - noise)
+        alpha_out[t], beta_out[t] = theta[0] * y0, theta[1] * y0 / x0
+    return alpha_out, beta_out, zscore
+
+
+def test_kalman_hedge_matches_the_filter_equations():
+    price_a, price_b = random_pair(n_days=120, seed=2)
+    # Missing first days and a gap: start-up values and carried estimates
+    price_a[:3] = np.nan
+    price_b[40:43] = np.nan
+    hedged = kalman_hedge(price_a, price_b, beta=1.6, delta=1e-4, obs_var=1e-3, adapt=0.05)
+    alpha, beta, zscore = reference_kalman(price_a, price_b, 1.6, 1e-4, 1e-3, 0.05)
+    np.testing.assert_allclose(hedged["beta"], beta, rtol=1e-10)
+    np.testing.assert_allclose(hedged["alpha"], alpha, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(hedged["zscore"], zscore, rtol=1e-9, atol=1e-12)
+    # Before the first prices: the static beta, with the intercept of the first day
+    assert (hedged["beta"][:3] == 1.6).all()
+    assert hedged["alpha"][0] == pytest.approx(price_a[3] - 1.6 * price_b[3])
+    assert np.isnan(hedged["zscore"][:3]).all() and np.isnan(hedged["zscore"][40:43]).all()
+    # The first update starts from the static beta, which fits the first day exactly
+    assert hedged["zscore"][3] == pytest.approx(0.0, abs=1e-12)
+
+
+def test_kalman_hedge_many_pairs_match_one_pair():
+    pairs = [random_pair(seed=seed) for seed in range(3)]
+    price_a = np.column_stack([a for a, _ in pairs])
+    price_b = np.column_stack([b for _, b in pairs])
+    starts = np.array([0, 15, 4])
+    betas = np.array([1.5, 1.7, np.nan])
+    together = kalman_hedge(price_a, price_b, beta=betas, starts=starts)
+    for k, (a, b) in enumerate(pairs):
+        alone = kalman_hedge(a[starts[k]:], b[starts[k]:], beta=betas[k])
+        for field in ("alpha", "beta", "zscore"):
+            np.testing.assert_array_equal(together[field][starts[k]:, k], alone[field])
+            assert np.isnan(together[field][:starts[k], k]).all()
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src import instrumentation
+from src.instrumentation import stage
+
+
+@pytest.fixture
+def recording():
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+
+
+def allocate(mb):
+    """Touch and free an mb-sized buffer"""
+    buffer = np.ones(mb * 1024 ** 2 // 8)
+    total = buffer.sum()
+    del buffer
+    return total
+
+
+def test_stage_records_the_peak_of_freed_buffers(recording):
+    with stage("work"):
+        allocate(200)
+    record, = instrumentation.records()
+    if np.isnan(record["rss_peak_mb"]):
+        pytest.skip("peak RSS needs /proc/self/clear_refs")
+    assert record["rss_peak_mb"] - record["rss_start_mb"] > 150
+    assert record["rss_delta_mb"] < 50
+    assert record["rss_peak_mb"] >= record["rss_end_mb"]
+
+
+def test_nested_stages_fold_their_peaks_into_the_outer_one(recording):
+    with stage("outer"):
+        allocate(150)
+        with stage("inner"):
+            allocate(50)
+        with stage("after"):
+            pass
+    after, inner, outer = instrumentation.records()
+    if np.isnan(outer["rss_peak_mb"]):
+        pytest.skip("peak RSS needs /proc/self/clear_refs")
+    # The outer allocation happened before the inner stage reset the mark
+    assert outer["rss_peak_mb"] - outer["rss_start_mb"] > 120
+    assert inner["rss_peak_mb"] - inner["rss_start_mb"] < 100
+    assert outer["rss_peak_mb"] >= inner["rss_peak_mb"]
+    assert after["rss_peak_mb"] < outer["rss_peak_mb"]
+
+
+def test_stage_table_totals(recording, tmp_path):
+    for _ in range(3):
+        with stage("work") as record:
+            record["items"] = 2
+    report, table = instrumentation.read_run_report(
+        instrumentation.write_run_report({"mode": "test"}, path=str(tmp_path)))
+    totals, = report["totals"]
+    assert totals["calls"] == 3 and totals["items"] == 6
+    assert totals["rss_peak_mb"] == pytest.approx(table["rss_peak_mb"].max())
+    assert list(table.columns[:len(instrumentation.STAGE_COLUMNS)]) == instrumentation.STAGE_COLUMNS
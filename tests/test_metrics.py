@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.metrics import ROLLING_WINDOW, metrics_table
+from src.view_results import compute_metrics
+
+
+@pytest.fixture
+def series():
+    """Daily PnL and positions of four pairs on one (dates x pairs) matrix"""
+    rng = np.random.default_rng(21)
+    dates = pd.bdate_range("2022-01-03", periods=300)
+    position = np.sign(np.sin(np.arange(300) / 9)).astype(int)
+    pnl = pd.DataFrame({
+        "trend": rng.normal(400, 5_000, 300),
+        "late": np.r_[np.full(120, np.nan), rng.normal(-200, 8_000, 180)],
+        "idle": np.zeros(300),
+        "flat": np.full(300, 250.0),
+    }, index=dates)
+    positions = pd.DataFrame({"trend": position, "late": position, "idle": 0, "flat": -1}, index=dates)
+    return pnl, positions
+
+
+def per_pair(pnl, positions, name):
+    """One pair's rows as compute_metrics reads them"""
+    df = pd.DataFrame({"date": pnl.index, "daily_pnl": pnl[name].to_numpy(),
+                       "position": positions[name].to_numpy()}).dropna(subset=["daily_pnl"])
+    df["cumulative_pnl"] = df["daily_pnl"].cumsum()
+    return df.reset_index(drop=True)
+
+
+def test_metrics_table_matches_compute_metrics(series):
+    pnl, positions = series
+    table, _ = metrics_table(pnl, 1_000_000, positions=positions)
+    for name in pnl.columns:
+        expected = compute_metrics(per_pair(pnl, positions, name), n_pairs=1)
+        for metric in ["Total Return (%)", "Annualized Sharpe", "Annualized Return (%)",
+                       "Max Drawdown (%)", "Calmar Ratio", "Number of Trades"]:
+            np.testing.assert_allclose(table.loc[name, metric], expected[metric], rtol=1e-9, atol=1e-12,
+                                       err_msg=f"{name}: {metric}")
+    assert table.loc["idle", "Number of Trades"] == 0
+    assert np.isnan(table.loc["flat", "Annualized Sharpe"])
+
+
+def test_rolling_metrics_match_compute_metrics_per_window(series):
+    pnl, positions = series
+    table, rolling = metrics_table(pnl, 1_000_000, positions=positions)
+    for name in pnl.columns:
+        df = per_pair(pnl, positions, name)
+        cum = df["cumulative_pnl"].to_numpy()
+        sharpe = np.full(len(df), np.nan)
+        drawdown = np.zeros(len(df))
+        for i in range(len(df)):
+            start = max(0, i - ROLLING_WINDOW + 1)
+            if i >= ROLLING_WINDOW - 1:
+                sharpe[i] = compute_metrics(df.iloc[start:i + 1], n_pairs=1)["Annualized Sharpe"]
+            peak = cum[start:i + 1].max()
+            if peak > 0:
+                drawdown[i] = 100 * (peak - cum[i]) / peak
+        got = rolling[rolling["series"] == name]
+        np.testing.assert_array_equal(got["date"].to_numpy(), df["date"].to_numpy())
+        np.testing.assert_allclose(got["rolling_sharpe"], sharpe, rtol=1e-6, equal_nan=True, err_msg=name)
+        np.testing.assert_allclose(got["rolling_drawdown"], drawdown, rtol=1e-9, atol=1e-12, err_msg=name)
+        np.testing.assert_allclose(table.loc[name, "Worst Rolling Sharpe"],
+                                   np.nanmin(sharpe) if np.isfinite(sharpe).any() else np.nan, rtol=1e-6)
+        np.testing.assert_allclose(table.loc[name, "Worst Rolling Drawdown (%)"], drawdown.max(), atol=1e-12)
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+
+from src.significance import bootstrap_test
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_bootstrap_test_does_not_depend_on_n_jobs():
+    pnl = np.random.default_rng(0).normal(200, 5_000, 250)
+    serial = bootstrap_test(pnl, 1_000_000, n_samples=2_000, seed=3, n_jobs=1)
+    pooled = bootstrap_test(pnl, 1_000_000, n_samples=2_000, seed=3, n_jobs=2)
+    assert serial == pooled
+
+
+def test_pool_after_numba_parallel_kernel_exits():
+    # Forking after numba's parallel threads started used to hang the
+    # interpreter at exit; run it in a child so a hang fails the test
+    script = textwrap.dedent("""
+        import numpy as np
+        import pandas as pd
+        from src.backtesting import backtest_pairs
+        from src.significance import bootstrap_test
+
+        rng = np.random.default_rng(0)
+        prices = pd.DataFrame(100 + np.cumsum(rng.normal(size=(120, 2)), axis=0), columns=["A", "B"])
+        backtest_pairs(prices, [("A", "B", 1.0)])
+        bootstrap_test(rng.normal(0, 1_000, 120), 1_000_000, n_samples=2_000, n_jobs=2)
+        print("done")
+    """)
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True,
+                            text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "done"
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from benchmarks.synthetic import synthetic_universe
+from src.backtesting import backtest_pair
+from src.price_cube import load_price_cube
+from src.results_store import read_book, read_final_portfolio, read_pair_results, read_yearly_results
+
+WINDOW = 20
+
+
+def write_raw(universe, n_days):
+    """The first n_days of the synthetic universe as data/raw/nifty50_2024.parquet"""
+    dates = universe["date"].drop_duplicates()[:n_days]
+    os.makedirs(os.path.join("data", "raw"), exist_ok=True)
+    universe[universe["date"].isin(dates)].to_parquet(os.path.join("data", "raw", "nifty50_2024.parquet"))
+
+
+@pytest.fixture
+def universe(tmp_path, monkeypatch):
+    """250 days of 20 synthetic symbols in 2024, in an empty working directory"""
+    monkeypatch.chdir(tmp_path)
+    df, _ = synthetic_universe(n_symbols=20, start="2024-01-01", seed=3)
+    return df
+
+
+def test_run_update_appends_what_the_batch_backtest_computes(universe):
+    # Full run on the first 220 days, then two end-of-day updates
+    write_raw(universe, 220)
+    cube = load_price_cube([2024])
+    yearly = main.process_year(2024, cube.price_matrix(2024, cube.symbols_in(2024)), None, WINDOW)
+    assert yearly is not None
+    main.write_final_portfolio(yearly)
+    write_raw(universe, 235)
+    main.run_update()
+    write_raw(universe, 250)
+    main.run_update()
+    main.run_update()  # nothing new: must not append anything
+
+    prices = universe.pivot(index="date", columns="symbol", values="close")
+    book = read_book()
+    assert book["last_date"] == prices.index[-1]
+    stored = read_pair_results(2024)
+    for a, b, beta in book["pairs"]:
+        rows = stored[stored["pair"] == f"{a}-{b}"].reset_index(drop=True)
+        expected = backtest_pair(prices[a], prices[b], beta, entry_z=1.5, exit_z=0.15)["details"].iloc[WINDOW:]
+        np.testing.assert_array_equal(rows["date"], expected["date"])
+        np.testing.assert_array_equal(rows["position"], expected["position"])
+        np.testing.assert_array_equal(rows["quantity_a"], expected["quantity_a"])
+        np.testing.assert_allclose(rows["daily_pnl"], expected["daily_pnl"], rtol=1e-9, atol=1e-6)
+        np.testing.assert_allclose(rows["cumulative_pnl"], expected["daily_pnl"].cumsum(), atol=1e-5)
+        assert (rows["bh_pnl_a"] == main.buy_and_hold_pnl(prices[a], 500_000)).all()
+
+    for results in [read_yearly_results(2024), read_final_portfolio()]:
+        np.testing.assert_array_equal(results["date"], prices.index[WINDOW:])
+        np.testing.assert_allclose(results["cumulative_pnl"], results["yearly_pnl"].cumsum(), atol=1e-5)
+    pair_total = stored.groupby("date")["daily_pnl"].sum()
+    np.testing.assert_allclose(read_final_portfolio()["yearly_pnl"], pair_total, atol=1e-6)